@@ -0,0 +1,199 @@
+'''
+Contains the Twarc client used for all requests to the Twitter API. Requests go to the live API unless api_base_url is
+set in config.yml, e.g. to the local mock server in tests/mock_twitter_api.py, in which case every request Twarc makes to
+https://api.twitter.com is sent to that address instead.
+
+bearer_token in config.yml may also be a list of tokens. Each request is then sent with the token that has the most
+requests left in its rate limit window for that endpoint, and a request refused for an exhausted token is retried
+straight away with another, so collection only waits for a reset once every token is exhausted.
+'''
+
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+from twarc import Twarc2
+
+from .config import Collection
+
+
+twitter_api_url = 'https://api.twitter.com'
+
+# One pool per set of tokens, shared by every client (e.g. collection workers) using those tokens
+token_pools = dict()
+token_pools_lock = threading.Lock()
+
+
+class TokenPool:
+
+    def __init__(self, bearer_tokens):
+        '''
+        Tracks the rate limit budget of each token, per endpoint, from the x-rate-limit-remaining and
+        x-rate-limit-reset headers of its responses. Thread safe.
+        '''
+
+        self.bearer_tokens = list(bearer_tokens)
+        self.lock = threading.Lock()
+        # (token, endpoint) -> (remaining, reset)
+        self.budgets = dict()
+        self.requests = {token: 0 for token in self.bearer_tokens}
+        self.rate_limited = {token: 0 for token in self.bearer_tokens}
+
+    def remaining(self, token, endpoint):
+        '''
+        Requests left for token in the current window; tokens not yet used, or whose window has reset, are treated as
+        having a full budget.
+        '''
+
+        remaining, reset = self.budgets.get((token, endpoint), (None, 0))
+        if remaining is None or time.time() >= reset:
+            return float('inf')
+        return remaining
+
+    def choose(self, endpoint, exclude=()):
+        '''
+        Returns the token with the most requests left for endpoint, apart from those in exclude. If every token is
+        exhausted, returns the one whose window resets first.
+        '''
+
+        with self.lock:
+            candidates = [token for token in self.bearer_tokens if token not in exclude and self.remaining(token, endpoint) > 0]
+            if len(candidates) > 0:
+                token = max(candidates, key=lambda token: self.remaining(token, endpoint))
+            else:
+                token = min(self.bearer_tokens, key=lambda token: self.budgets.get((token, endpoint), (0, 0))[1])
+            self.requests[token] = self.requests[token] + 1
+            return token
+
+    def has_budget(self, endpoint, exclude=()):
+        with self.lock:
+            return any(self.remaining(token, endpoint) > 0 for token in self.bearer_tokens if token not in exclude)
+
+    def seconds_until_reset(self, endpoint):
+        '''
+        Seconds until the first exhausted token's window resets for endpoint (0 if a token has budget now).
+        '''
+
+        with self.lock:
+            if any(self.remaining(token, endpoint) > 0 for token in self.bearer_tokens):
+                return 0
+            reset = min(self.budgets[(token, endpoint)][1] for token in self.bearer_tokens)
+        return max(0, reset - time.time())
+
+    def update(self, token, endpoint, status_code, headers):
+        '''
+        Records the budget reported by a response's headers. Returns True if the token is exhausted, i.e. the request
+        was refused with no requests left in the window (rather than for exceeding the one request per second limit).
+        '''
+
+        with self.lock:
+            if 'x-rate-limit-remaining' in headers and 'x-rate-limit-reset' in headers:
+                self.budgets[(token, endpoint)] = (int(headers['x-rate-limit-remaining']), int(headers['x-rate-limit-reset']))
+            if status_code == 429:
+                self.rate_limited[token] = self.rate_limited[token] + 1
+                return self.remaining(token, endpoint) <= 0
+        return False
+
+    def log_usage(self):
+        '''
+        Logs the requests made with each token, how many were refused for rate limiting, and the budget left.
+        '''
+
+        for number, token in enumerate(self.bearer_tokens, start=1):
+            budgets = [f'{endpoint}: {remaining} left' for (budget_token, endpoint), (remaining, reset)
+                       in self.budgets.items() if budget_token == token]
+            logging.info(f'Bearer token {number} (...{token[-6:]}): {self.requests[token]} requests, '
+                         f'{self.rate_limited[token]} rate limited. {", ".join(budgets)}')
+
+
+def get_token_pool(bearer_tokens):
+    '''
+    Returns the TokenPool for a set of tokens, creating it on first use.
+    '''
+
+    key = tuple(bearer_tokens)
+    with token_pools_lock:
+        if key not in token_pools:
+            token_pools[key] = TokenPool(bearer_tokens)
+        return token_pools[key]
+
+
+class ArchiveAdapter(HTTPAdapter):
+
+    def __init__(self, base_url=None, token_pool=None, **kwargs):
+        '''
+        Transport adapter for requests to the Twitter API. Rewrites them to base_url (keeping the path and query) if one
+        is given, and authorises each one with a token from token_pool if one is given.
+        '''
+
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip('/') if base_url is not None else None
+        self.token_pool = token_pool
+
+    def send(self, request, **kwargs):
+        if self.base_url is not None:
+            request.url = self.base_url + request.url[len(twitter_api_url):]
+        if self.token_pool is None:
+            return super().send(request, **kwargs)
+
+        endpoint = urlparse(request.url).path
+        tried = []
+        while True:
+            token = self.token_pool.choose(endpoint, exclude=tried)
+            request.headers['Authorization'] = f'Bearer {token}'
+            response = super().send(request, **kwargs)
+            if not self.token_pool.update(token, endpoint, response.status_code, response.headers):
+                return response
+
+            # Token exhausted: retry at once with another token, or, if all are exhausted, let Twarc wait for the reset
+            tried.append(token)
+            if not self.token_pool.has_budget(endpoint, exclude=tried):
+                return response
+            logging.info(f'Bearer token ...{token[-6:]} is rate limited for {endpoint}; switching token')
+            response.close()
+
+
+class ArchiveClient(Twarc2):
+
+    def __init__(self, bearer_tokens, api_base_url=None):
+        '''
+        A Twarc2 client that can be pointed at another base URL than the live Twitter API, and can spread its requests
+        across several bearer tokens.
+        '''
+
+        self.bearer_tokens = bearer_tokens
+        self.api_base_url = api_base_url
+        self.token_pool = None
+        if len(bearer_tokens) > 1:
+            self.token_pool = get_token_pool(bearer_tokens)
+        super().__init__(bearer_token=bearer_tokens[0])
+
+    def connect(self):
+        '''
+        Sets up the HTTP session as Twarc does, then routes it through an ArchiveAdapter if needed.
+        '''
+
+        super().connect()
+        if self.api_base_url is not None or self.token_pool is not None:
+            self.client.mount(twitter_api_url, ArchiveAdapter(self.api_base_url, self.token_pool))
+
+
+def create_client(bearer_token):
+    '''
+    Returns a client for bearer_token (a token, or a list of tokens), using api_base_url from config.yml: a Twarc client,
+    or an AsyncArchiveClient if collection_engine is 'async' in config.yml.
+    '''
+
+    if type(bearer_token) == str:
+        bearer_token = [bearer_token]
+
+    if Collection.engine == 'async':
+        # Imported here, as async_engine builds on this module
+        from .async_engine import AsyncArchiveClient
+        return AsyncArchiveClient(list(bearer_token), Collection.api_base_url, Collection.async_connections)
+    elif Collection.engine != 'twarc':
+        raise ValueError(f"collection_engine must be 'twarc' or 'async', not '{Collection.engine}'")
+
+    return ArchiveClient(list(bearer_token), Collection.api_base_url)
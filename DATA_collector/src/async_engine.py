@@ -0,0 +1,314 @@
+'''
+Contains the optional asyncio collection engine, used when collection_engine is 'async' in config.yml. Requests are made
+by one event loop, running in a background thread, through a single aiohttp session whose keep-alive connections are
+pooled and reused by every search and count in the process. Concurrent collection workers (or counts workers) each
+consume their own stream of pages, while the engine interleaves their requests on the one loop.
+
+AsyncArchiveClient has the same search_all() and counts_all() generators as Twarc2, yielding the same response pages,
+so expansions.flatten and the rest of data.py work on top of it unchanged. The next page of each stream is requested
+while the current one is written, and requests are paced from the x-rate-limit headers of each bearer token.
+'''
+
+import json
+import time
+import atexit
+import asyncio
+import logging
+import threading
+import datetime as dt
+from urllib.parse import urlencode
+
+import requests
+from twarc.expansions import EXPANSIONS, TWEET_FIELDS, USER_FIELDS, MEDIA_FIELDS, POLL_FIELDS, PLACE_FIELDS
+from twarc.version import version, user_agent
+
+from .api_client import twitter_api_url, get_token_pool
+
+# aiohttp is only needed for the async collection engine
+try:
+    import aiohttp
+    from yarl import URL
+except ImportError:
+    aiohttp = None
+
+
+search_all_path = '/2/tweets/search/all'
+counts_all_path = '/2/tweets/counts/all'
+
+# The full-archive endpoints also allow 1 request per second per token, which is not reported in the headers; Twarc
+# sleeps 1.05 seconds between requests for the same reason
+sleep_between = 1.05
+
+# Pages fetched ahead of the consumer, per stream
+prefetch_pages = 1
+
+# Attempts at a request that fails with a connection error or a server error before giving up
+max_tries = 30
+
+# Marks the end of a stream of pages
+end_of_pages = object()
+
+# One engine per api_base_url, shared by every AsyncArchiveClient in the process
+engines = dict()
+engines_lock = threading.Lock()
+
+
+def require_aiohttp():
+    if aiohttp is None:
+        raise ImportError("collection_engine: 'async' requires the 'aiohttp' package. "
+                          "Install it with 'pip install aiohttp'.")
+
+def format_time(timestamp):
+    # As Twarc sends start_time and end_time: UTC, without microseconds
+    if timestamp.tzinfo:
+        timestamp = timestamp.astimezone(dt.timezone.utc)
+    else:
+        timestamp = timestamp.replace(tzinfo=dt.timezone.utc)
+    return timestamp.isoformat(timespec='seconds')
+
+def format_counts_start(timestamp):
+    # The start of the earliest counts bucket, as returned by the counts_all endpoint
+    timestamp = dt.datetime.fromisoformat(format_time(timestamp))
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+def get_engine(api_base_url=None, connections=10):
+    '''
+    Returns the engine for api_base_url, starting it on first use.
+    '''
+
+    with engines_lock:
+        if api_base_url not in engines:
+            engines[api_base_url] = AsyncEngine(api_base_url, connections)
+        return engines[api_base_url]
+
+@atexit.register
+def close_engines():
+    for engine in engines.values():
+        engine.close()
+
+
+class AsyncEngine:
+
+    def __init__(self, api_base_url=None, connections=10, sleep_between=sleep_between):
+        '''
+        An event loop in a daemon thread, with one aiohttp session of up to 'connections' keep-alive connections.
+        Requests go to api_base_url if given, otherwise to the live Twitter API. Thread safe: any thread may start a
+        stream of pages with stream().
+        '''
+
+        require_aiohttp()
+        self.base_url = (api_base_url or twitter_api_url).rstrip('/')
+        self.connections = connections
+        self.sleep_between = sleep_between
+        # (token, path) -> earliest monotonic time of the next request
+        self.next_request = dict()
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='async-engine', daemon=True)
+        self.thread.start()
+        self.session = self.run(self.open_session())
+
+    def run(self, coroutine):
+        '''
+        Runs a coroutine on the engine's loop and waits for its result, from any other thread.
+        '''
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def open_session(self):
+        connector = aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=60)
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300),
+                                     headers={'User-Agent': user_agent})
+
+    async def new_queue(self):
+        return asyncio.Queue(maxsize=prefetch_pages)
+
+    def close(self):
+        if self.loop.is_running():
+            self.run(self.session.close())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def acquire(self, token_pool, path):
+        '''
+        Waits until a request to path may be made, and returns the token to make it with: the token with the most
+        requests left in its window, once at least sleep_between seconds have passed since its last request to path.
+        If every token is exhausted, waits for the first reset.
+        '''
+
+        while True:
+            wait = token_pool.seconds_until_reset(path)
+            if wait <= 0:
+                break
+            logging.info(f'Rate limit reached for {path}; waiting {round(wait)} seconds for the reset')
+            await asyncio.sleep(wait + 1)
+
+        token = token_pool.choose(path)
+        now = time.monotonic()
+        start = max(now, self.next_request.get((token, path), now))
+        self.next_request[(token, path)] = start + self.sleep_between
+        if start > now:
+            await asyncio.sleep(start - now)
+
+        return token
+
+    async def get(self, token_pool, path, params):
+        '''
+        Requests one page and returns the decoded response. Rate limited requests are retried once the limit allows,
+        and connection and server errors are retried with a backoff. Other errors raise requests.exceptions.HTTPError,
+        as they do from Twarc.
+        '''
+
+        url = f'{self.base_url}{path}'
+        errors = 0
+        while True:
+            token = await self.acquire(token_pool, path)
+            # Encoded as requests encodes it for Twarc, including next_token once it is set
+            request_url = URL(f'{url}?{urlencode(params)}', encoded=True)
+            try:
+                async with self.session.get(request_url, headers={'Authorization': f'Bearer {token}'}) as response:
+                    status = response.status
+                    body = await response.read()
+                    response_url = str(response.url)
+                    exhausted = token_pool.update(token, path, status, response.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                status = None
+                body = str(error).encode()
+
+            if status == 200:
+                page = json.loads(body)
+                # The same metadata Twarc adds to each page; kept in the __twarc column when processing
+                page['__twarc'] = {'url': response_url, 'version': version,
+                                   'retrieved_at': dt.datetime.now(dt.timezone.utc).isoformat(timespec='seconds')}
+                return page
+
+            if status == 429:
+                if not exhausted:
+                    logging.warning('Hit the 1 request/second rate limit, sleeping for 10 seconds')
+                    await asyncio.sleep(10)
+                # Otherwise acquire() switches to another token, or waits for the reset
+                continue
+
+            if status is None or status >= 500:
+                errors = errors + 1
+                if errors >= max_tries:
+                    raise requests.exceptions.ConnectionError(f'Giving up on {url} after {errors} attempts: {body.decode()}')
+                seconds = min(60, 2 ** errors)
+                logging.warning(f'Request to {url} failed ({status or body.decode()}); retrying in {seconds} seconds')
+                await asyncio.sleep(seconds)
+                continue
+
+            raise requests.exceptions.HTTPError(f'{status} Client Error for url: {url}: {body.decode()}')
+
+    async def paginate(self, token_pool, path, params, pages, counts_start=None):
+        '''
+        Requests every page of a search or count in turn, putting each page with data on the pages queue. Counts that
+        end before reaching counts_start (a known problem with long counts) are restarted from the earliest bucket
+        returned, as Twarc does.
+        '''
+
+        try:
+            buckets_collected = 0
+            last_bucket_start = None
+            while True:
+                response = await self.get(token_pool, path, params)
+                if 'data' in response:
+                    if counts_start is not None:
+                        last_bucket_start = response['data'][0]['start']
+                        buckets_collected = buckets_collected + len(response['data'])
+                    await pages.put(response)
+                else:
+                    logging.info('Retrieved an empty page of results.')
+
+                next_token = response.get('meta', {}).get('next_token')
+                if next_token is not None:
+                    params['next_token'] = next_token
+                    continue
+
+                if counts_start is None or buckets_collected == 0 or last_bucket_start == counts_start:
+                    break
+                logging.info(f'Detected incomplete counts, restarting with {last_bucket_start} as the new end_time')
+                params['end_time'] = last_bucket_start
+                params.pop('next_token', None)
+
+            await pages.put(end_of_pages)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            # Raised in the consuming thread
+            await pages.put(error)
+
+    def stream(self, token_pool, path, params, counts_start=None):
+        '''
+        A generator of response pages for the consuming thread. The next page is requested while the current one is
+        consumed; nothing is requested until the first page is asked for.
+        '''
+
+        pages = self.run(self.new_queue())
+        task = asyncio.run_coroutine_threadsafe(self.paginate(token_pool, path, params, pages, counts_start), self.loop)
+        try:
+            while True:
+                page = asyncio.run_coroutine_threadsafe(pages.get(), self.loop).result()
+                if page is end_of_pages:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            task.cancel()
+
+
+class AsyncArchiveClient:
+
+    def __init__(self, bearer_tokens, api_base_url=None, connections=10):
+        '''
+        A drop-in replacement for the Twarc client in data.py, for the full-archive search and counts endpoints, backed
+        by the AsyncEngine for api_base_url. Requests are spread across bearer_tokens as with ArchiveClient.
+        '''
+
+        self.bearer_tokens = bearer_tokens
+        self.api_base_url = api_base_url
+        # Always pooled, as the engine paces requests from the budget recorded for each token
+        self.token_pool = get_token_pool(bearer_tokens)
+        self.engine = get_engine(api_base_url, connections)
+
+    def search_all(self, query, start_time=None, end_time=None, max_results=100, next_token=None):
+        '''
+        Generator of search_all response pages, as from Twarc2.search_all().
+        '''
+
+        # As in Twarc, search the whole archive by default
+        if start_time is None:
+            start_time = dt.datetime(2006, 3, 21, tzinfo=dt.timezone.utc)
+
+        params = {'expansions': ','.join(EXPANSIONS),
+                  'tweet.fields': ','.join(TWEET_FIELDS),
+                  'user.fields': ','.join(USER_FIELDS),
+                  'media.fields': ','.join(MEDIA_FIELDS),
+                  'poll.fields': ','.join(POLL_FIELDS),
+                  'place.fields': ','.join(PLACE_FIELDS),
+                  'start_time': format_time(start_time)}
+        if end_time is not None:
+            params['end_time'] = format_time(end_time)
+        params['query'] = query
+        params['max_results'] = max_results
+        if next_token is not None:
+            params['next_token'] = next_token
+
+        return self.engine.stream(self.token_pool, search_all_path, params)
+
+    def counts_all(self, query, start_time=None, end_time=None, granularity='hour'):
+        '''
+        Generator of counts_all response pages, as from Twarc2.counts_all().
+        '''
+
+        params = dict()
+        counts_start = None
+        if start_time is not None:
+            params['start_time'] = format_time(start_time)
+            counts_start = format_counts_start(start_time)
+        if end_time is not None:
+            params['end_time'] = format_time(end_time)
+        params['query'] = query
+        params['granularity'] = granularity
+
+        return self.engine.stream(self.token_pool, counts_all_path, params, counts_start)
@@ -8,6 +8,8 @@ import numpy as np
 import pandas as pd
 
 from .fields import TCAT_fields, TweetQuery_fields
+from .query_packing import membership_tablename
+from .stage_timers import timed_stage
 
 
 class DATA_schema:
@@ -560,6 +562,19 @@ class TweetQuery_schema:
 
     list_of_tablenames = ['tweets_flat']
 
+class QueryMembership_schema:
+
+    query_membership_schema = [
+        bigquery.SchemaField("tweet_id", "STRING", mode="REQUIRED",
+                             description="Unique ID for this Tweet (from Twitter)"),
+        bigquery.SchemaField("query", "STRING", mode="NULLABLE",
+                             description="Query in the list of queries that this Tweet matches; the packed query if it could not be attributed"),
+    ]
+
+    csv = 'QUERY_MEMBERSHIP.csv'
+
+    tablename = membership_tablename
+
 class SchemaFuncs:
 
     def set_schema_type(self, Schematype):
@@ -579,11 +594,23 @@ class SchemaFuncs:
     def get_schema_type(self, list_of_dataframes, tweet_count):
         '''
         Select lists of dataframes, csvs, tablenames and schema depending on the schema indicated in config.yml.
+        If list_of_dataframes ends with a QUERY_MEMBERSHIP table (packed list queries, named by its 'tablename' attr), it
+        is added for every schema. A QUERY_MEMBERSHIP table on its own (for a chunk of tweets all uploaded already) is
+        the only table returned.
         '''
 
         # Init SchemaTransform class
         transform_schema = SchemaTransform()
 
+        QUERY_MEMBERSHIP = None
+        last_table = list_of_dataframes[-1] if len(list_of_dataframes) > 0 else None
+        if last_table is not None and last_table.attrs.get('tablename') == QueryMembership_schema.tablename:
+            QUERY_MEMBERSHIP = last_table
+            list_of_dataframes = list_of_dataframes[:-1]
+            if len(list_of_dataframes) == 0:
+                return [QUERY_MEMBERSHIP], [QueryMembership_schema.csv], [QueryMembership_schema.tablename], \
+                    [QueryMembership_schema.query_membership_schema], tweet_count
+
         if Schematype.DATA == True:
             list_of_dataframes = list_of_dataframes
             list_of_csv = DATA_schema.list_of_csv
@@ -613,10 +640,17 @@ class SchemaFuncs:
             except:
                 tweet_count = None
 
+        if QUERY_MEMBERSHIP is not None:
+            list_of_dataframes = list_of_dataframes + [QUERY_MEMBERSHIP]
+            list_of_csv = list_of_csv + [QueryMembership_schema.csv]
+            list_of_tablenames = list_of_tablenames + [QueryMembership_schema.tablename]
+            list_of_schema = list_of_schema + [QueryMembership_schema.query_membership_schema]
+
         return list_of_dataframes, list_of_csv, list_of_tablenames, list_of_schema, tweet_count
 
 class SchemaTransform:
 
+    @timed_stage('transform_DATA_to_TCAT')
     def transform_DATA_to_TCAT(self, list_of_dataframes):
         '''
         Transforms tables in DATA format for compatibility with existing TCAT datasets. Selects relevant fields from TWEETS,
@@ -666,6 +700,7 @@ class SchemaTransform:
 
         return list_of_dataframes
 
+    @timed_stage('transform_DATA_to_TQ')
     def transform_DATA_to_TQ(self, list_of_dataframes):
         '''
         Transforms tables in DATA format for compatibility with existing TweetQuery datasets. Selects relevant fields from TWEETS,
@@ -0,0 +1,118 @@
+'''
+Contains the bulk ingest used by Option 2 (process from json files) when ingest_workers is more than 1 in config.yml.
+Up to ingest_workers input files are read and flattened at once, each in a worker process of its own, and each processed
+chunk is sent back to a single upload stage in the main process, which writes it to csv and pushes it to BigQuery as it
+arrives. Uploads stay serial, as the temp csv files and BigQuery load jobs are shared by every file.
+
+Large uncompressed files are split into ranges of lines of about the same size, using their line index (see
+line_index.py), and each range is processed by a worker of its own, so one large file does not hold up the others.
+'''
+
+import os
+import math
+import queue
+import logging
+import traceback
+import multiprocessing
+
+from .line_index import get_line_index, can_index
+from .stage_timers import stage_timers
+
+
+# Files larger than this are split into ranges of about this size, processed by separate workers
+split_file_bytes = 256 * 1024 * 1024
+
+# Seconds between checks that the worker processes are still alive, while waiting for a chunk
+poll_seconds = 5
+
+
+def plan_ingest(json_input_files):
+    '''
+    Returns the work for the workers: (a_file, line_range) for each file, or for each range of lines of a large file.
+    line_range is None for a whole file.
+    '''
+
+    work = []
+    for a_file in json_input_files:
+        if can_index(a_file) and os.path.getsize(a_file) > split_file_bytes:
+            line_index = get_line_index(a_file)
+            line_ranges = line_index.split(math.ceil(os.path.getsize(a_file) / split_file_bytes))
+            logging.info(f'Splitting {a_file} ({line_index.tweet_count} tweets) into {len(line_ranges)} ranges of lines')
+            work.extend([(a_file, line_range) for line_range in line_ranges])
+        else:
+            work.append((a_file, None))
+    return work
+
+def describe(a_file, line_range):
+    if line_range is None:
+        return a_file
+    return f'{a_file} (lines {line_range[0] + 1} to {line_range[1]})'
+
+def ingest_file(a_file, line_range, schematype, chunks):
+    '''
+    Runs in a worker process: processes a json file, or a range of its lines, putting ('chunk', name, (list_of_dataframes,
+    stage_chunks)) on the chunks queue for each chunk, with the stage timings recorded for it (see stage_timers.py), then
+    ('done', name, None), or ('failed', name, traceback) if processing fails.
+    '''
+
+    # Imported here, as data.py imports this module
+    from .data import iter_processed_chunks
+    from .config import Collection
+
+    # Each file already has a process of its own
+    Collection.process_workers = 1
+    name = describe(a_file, line_range)
+    try:
+        for list_of_dataframes in iter_processed_chunks(a_file, schematype, line_range=line_range):
+            chunks.put(('chunk', name, (list_of_dataframes, stage_timers.take_chunks())))
+        chunks.put(('done', name, None))
+    except Exception:
+        chunks.put(('failed', name, traceback.format_exc()))
+
+def ingest_files(json_input_files, workers, schematype, upload):
+    '''
+    Processes json_input_files, up to 'workers' files at once, each in its own process, and calls upload(list_of_dataframes)
+    in this process for every chunk, in the order chunks arrive. Raises RuntimeError if a file cannot be processed, once
+    the other workers are stopped.
+    '''
+
+    context = multiprocessing.get_context('spawn')
+    # Bounded, so workers pause while uploads catch up
+    chunks = context.Queue(maxsize=workers)
+    waiting = plan_ingest(json_input_files)
+    total = len(waiting)
+    running = dict()
+    done = 0
+
+    try:
+        while len(waiting) > 0 or len(running) > 0:
+            while len(waiting) > 0 and len(running) < workers:
+                a_file, line_range = waiting.pop(0)
+                name = describe(a_file, line_range)
+                logging.info(f'Processing tweet data from {name}...')
+                process = context.Process(target=ingest_file, args=(a_file, line_range, schematype, chunks), daemon=True)
+                process.start()
+                running[name] = process
+
+            try:
+                message, name, payload = chunks.get(timeout=poll_seconds)
+            except queue.Empty:
+                # A worker killed before it could report (e.g. out of memory) would otherwise be waited for forever
+                for name, process in running.items():
+                    if process.exitcode is not None and process.exitcode != 0:
+                        raise RuntimeError(f'Worker processing {name} exited with code {process.exitcode}')
+                continue
+
+            if message == 'chunk':
+                list_of_dataframes, stage_chunks = payload
+                stage_timers.add_chunks(stage_chunks)
+                upload(list_of_dataframes)
+            elif message == 'done':
+                running.pop(name).join()
+                done = done + 1
+                logging.info(f'Finished processing {name} ({done} of {total})')
+            else:
+                raise RuntimeError(f'Processing {name} failed:\n{payload}')
+    finally:
+        for process in running.values():
+            process.terminate()
@@ -0,0 +1,206 @@
+'''
+Contains the columnar flattening engine, used when flatten_engine is 'columnar' in config.yml. Collected json files are
+decoded one line at a time with orjson (if installed), and the one-to-one nested columns of each chunk of tweets
+(entities, public_metrics, author, ...) are flattened in a single traversal of each tweet, appending every value
+straight into the list that becomes its column. The pandas engine instead runs pd.json_normalize and a merge on
+tweet_id for each nested column in turn.
+
+Both engines build the same tweets_flat dataframe: same columns, in the same order, with the same values and dtypes.
+'''
+
+import gc
+import json
+import logging
+from itertools import islice
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from .process_tables import one_to_one_nested_cols
+from .stage_timers import timed_stage
+
+# orjson is optional; it decodes tweets several times faster than the json module
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+
+@contextmanager
+def paused_gc():
+    '''
+    Pauses Python's cyclic garbage collector. Decoding and flattening tweets creates millions of dicts and lists, each of
+    which counts towards triggering a collection, so the collector would otherwise repeatedly scan every object created
+    so far; none of them can be part of a reference cycle.
+    '''
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def iter_decoded_lines(f, chunksize):
+    '''
+    Yields lists of decoded json objects from a json lines file, chunksize lines at a time. As pd.read_json() does,
+    blank lines count towards the chunksize but are skipped.
+    '''
+
+    while True:
+        lines = list(islice(f, chunksize))
+        if len(lines) == 0:
+            break
+        yield decode_lines(lines)
+
+def decode_lines(lines):
+    # Blank lines are skipped
+    with paused_gc():
+        return [loads(line) for line in lines if line.strip()]
+
+def flatten_items(record, prefix, items):
+    '''
+    Appends the (column, value) pairs of a nested dict to items, named and ordered as pd.json_normalize() names and
+    orders the columns of a record: keys holding values first, then the keys of nested dicts, joined with '.'.
+    Empty dicts give no columns.
+    '''
+
+    nested = []
+    for key, value in record.items():
+        if isinstance(value, dict):
+            nested.append((key, value))
+        else:
+            items.append((f'{prefix}{key}', value))
+    for key, value in nested:
+        flatten_dict(value, f'{prefix}{key}.', items)
+
+def flatten_dict(record, prefix, items):
+    # Below the top level of a record, pd.json_normalize() keeps keys in order
+    for key, value in record.items():
+        if isinstance(value, dict):
+            flatten_dict(value, f'{prefix}{key}.', items)
+        else:
+            items.append((f'{prefix}{key}', value))
+
+def normalize_records(records):
+    '''
+    Builds the same dataframe as pd.json_normalize(records), for a list of dicts: each record is flattened in a single
+    traversal, and the flat records are built into a dataframe as pd.json_normalize() builds them. A record equal to an
+    earlier one with the same 'id' (e.g. a tweet retweeted many times in one chunk) is only flattened once.
+    '''
+
+    if not all(isinstance(record, dict) for record in records):
+        return pd.json_normalize(records)
+
+    flat_records = []
+    flattened = dict()
+    with paused_gc():
+        for record in records:
+            record_id = record.get('id')
+            earlier = flattened.get(record_id)
+            if earlier is not None and earlier[0] == record:
+                flat_records.append(earlier[1])
+                continue
+            items = []
+            flatten_items(record, '', items)
+            flat_record = dict(items)
+            if isinstance(record_id, str):
+                flattened[record_id] = (record, flat_record)
+            flat_records.append(flat_record)
+
+    return pd.DataFrame(flat_records)
+
+def can_flatten(tweets, nested_cols):
+    '''
+    The columnar engine builds the same columns as a left merge on tweet_id only if tweet_ids are unique and present,
+    and every nested value is a dict; other chunks are left to the pandas engine.
+    '''
+
+    if tweets['tweet_id'].isna().any() or not tweets['tweet_id'].is_unique:
+        return False
+    for nested_col in nested_cols:
+        values = tweets[nested_col]
+        if not all(isinstance(value, dict) for value in values[values.notna()]):
+            return False
+    return True
+
+@timed_stage('flatten_top_tweet_level (columnar)')
+def flatten_top_tweet_level(tweets):
+    '''
+    Flattens the main Tweet table, as ProcessTweets.flatten_top_tweet_level() does, in one pass over the tweets.
+    Each nested column's values are collected in per-column lists, for the rows where it is present, then built into a
+    dataframe (inferring dtypes as pd.json_normalize() does) and aligned to all rows (as the left merge does).
+    Returns None if the chunk cannot be flattened this way (see can_flatten()).
+    '''
+
+    nested_cols = [nested_col for nested_col in one_to_one_nested_cols if nested_col in tweets.columns]
+    if not can_flatten(tweets, nested_cols):
+        return None
+
+    logging.info('Flattening one-to-one nested columns (columnar)...')
+
+    # Per nested column: flattened column name -> values, and the rows holding the nested column
+    columns = {nested_col: dict() for nested_col in nested_cols}
+    rows = {nested_col: [] for nested_col in nested_cols}
+
+    nested_values = [tweets[nested_col].tolist() for nested_col in nested_cols]
+    with paused_gc():
+        for row, values in enumerate(zip(*nested_values)):
+            for nested_col, value in zip(nested_cols, values):
+                if not isinstance(value, dict):
+                    continue
+                nested_columns = columns[nested_col]
+                count = len(rows[nested_col])
+                items = []
+                flatten_items(value, f'{nested_col}_', items)
+                for name, item in items:
+                    column = nested_columns.get(name)
+                    if column is None:
+                        column = nested_columns[name] = []
+                    # Columns missing from earlier records are NaN for those records
+                    if len(column) < count:
+                        column.extend([np.nan] * (count - len(column)))
+                    if len(column) > count:
+                        # A name repeated within a record keeps its last value
+                        column[count] = item
+                    else:
+                        column.append(item)
+                rows[nested_col].append(row)
+
+    # The merges index rows from 0, with an Int64Index
+    merged_index = pd.Index(np.arange(len(tweets)))
+    aux_df_list = []
+    for nested_col in nested_cols:
+        count = len(rows[nested_col])
+        for column in columns[nested_col].values():
+            column.extend([np.nan] * (count - len(column)))
+        nested_col_df = pd.DataFrame(columns[nested_col], index=rows[nested_col])
+        if count < len(tweets):
+            nested_col_df = nested_col_df.reindex(range(len(tweets)))
+        aux_df_list.append(nested_col_df.set_axis(merged_index, axis=0))
+
+    # Drop author_id and in_reply_to_user_id in tweets df, to replace with fields in flattened one-to-one tables).
+    # The original nested columns are kept, as the pandas engine keeps them
+    tweets = tweets.drop(columns=['author_id', 'in_reply_to_user_id'], errors='ignore')
+
+    # Columns with the same name would be suffixed by the merges
+    merged_columns = tweets.columns.append([nested_col_df.columns for nested_col_df in aux_df_list])
+    if not merged_columns.is_unique:
+        return None
+
+    if len(nested_cols) > 0:
+        tweets = tweets.set_axis(merged_index, axis=0)
+        tweets = pd.concat([tweets] + aux_df_list, axis=1)
+
+    tweets_flat = tweets.rename(columns={'like_count': 'public_metrics_like_count',
+                                         'quote_count': 'public_metrics_quote_count',
+                                         'reply_count': 'public_metrics_reply_count',
+                                         'retweet_count': 'public_metrics_retweet_count'})
+
+    # Set reference_level column; tweets_flat now contains reference_level='0' tweets
+    tweets_flat['reference_level'] = '0'
+
+    return tweets_flat
@@ -55,3 +55,36 @@ class Schematype():
     TCAT = config['TCAT']
     TweetQuery = config['TweetQuery']
 
+
+class Collection():
+    # Optional settings; older config.yml files without these keys fall back to the defaults
+    workers = config.get('collection_workers', 1)
+    pipeline = config.get('pipeline', False)
+    queue_size = config.get('pipeline_queue_size', 2)
+    write_buffer_kb = config.get('write_buffer_kb', 1024)
+    fsync = config.get('fsync', 'window')
+    raw_compression = config.get('raw_compression', None)
+    if raw_compression == 'None':
+        raw_compression = None
+    tweets_per_file = config.get('tweets_per_file', 100000)
+    partition_by_counts = config.get('partition_by_counts', False)
+    counts_granularity = config.get('counts_granularity', 'day')
+    counts_cache = config.get('counts_cache', True)
+    counts_workers = config.get('counts_workers', 1)
+    deduplicate = config.get('deduplicate_queries', True)
+    pack_queries = config.get('pack_queries', False)
+    api_base_url = config.get('api_base_url', None)
+    if api_base_url == 'None':
+        api_base_url = None
+    engine = config.get('collection_engine', 'twarc')
+    async_connections = config.get('async_connections', 10)
+    stream_processing = config.get('stream_processing', False)
+    keep_raw_json = config.get('keep_raw_json', True)
+    flatten_engine = config.get('flatten_engine', 'pandas')
+    process_workers = config.get('process_workers', 1)
+    ingest_workers = config.get('ingest_workers', 1)
+    max_chunk_mb = config.get('max_chunk_mb', 0)
+    memory_profile = config.get('memory_profile', False)
+    memory_ceiling_mb = config.get('memory_ceiling_mb', 0)
+    max_reference_depth = config.get('max_reference_depth', 0)
+
@@ -0,0 +1,159 @@
+'''
+Contains a local, SQLite-backed cache of tweet counts, saved to my_collections/counts_cache.sqlite. Counts are stored
+per bucket (day or hour), keyed by the normalised query and the bucket's start time, so a query counted before over an
+overlapping period only needs the missing buckets to be fetched from the counts_all endpoint.
+
+Counts of recent buckets keep changing as tweets are posted (and deleted), so buckets ending less than stable_after ago
+are always fetched, and never cached.
+'''
+
+import sqlite3
+import logging
+import threading
+import datetime as dt
+
+
+# Length of one counts bucket for each counts_all granularity
+bucket_lengths = {'day': dt.timedelta(days=1),
+                  'hour': dt.timedelta(hours=1),
+                  'minute': dt.timedelta(minutes=1)}
+
+# Buckets ending less than this long ago are not cached, as their counts may still change
+stable_after = dt.timedelta(hours=48)
+
+
+def normalise_query(query):
+    '''
+    Collapses whitespace, so that the same query typed with different spacing shares cache entries. Case is kept, as
+    operators such as OR are case sensitive.
+    '''
+
+    return ' '.join(query.split())
+
+def utc_now():
+    return dt.datetime.now(dt.timezone.utc)
+
+def is_stable(bucket_end):
+    return bucket_end <= utc_now() - stable_after
+
+def to_utc_string(date):
+    return date.astimezone(dt.timezone.utc).isoformat()
+
+def floor_to_bucket(date, granularity):
+    '''
+    Start of the bucket containing date (buckets are aligned to whole days/hours/minutes, in UTC).
+    '''
+
+    date = date.astimezone(dt.timezone.utc)
+    if granularity == 'day':
+        return date.replace(hour=0, minute=0, second=0, microsecond=0)
+    elif granularity == 'hour':
+        return date.replace(minute=0, second=0, microsecond=0)
+    return date.replace(second=0, microsecond=0)
+
+def ceil_to_bucket(date, granularity):
+    floor = floor_to_bucket(date, granularity)
+    if floor == date:
+        return floor
+    return floor + bucket_lengths[granularity]
+
+
+class CountsCache:
+
+    def __init__(self, cache_file):
+        '''
+        Opens (or creates) the cache. Thread safe, so one cache can be shared by concurrent counting workers.
+        '''
+
+        self.connection = sqlite3.connect(cache_file, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS counts (
+                    query TEXT NOT NULL,
+                    granularity TEXT NOT NULL,
+                    bucket_start TEXT NOT NULL,
+                    bucket_end TEXT NOT NULL,
+                    tweet_count INTEGER NOT NULL,
+                    PRIMARY KEY (query, granularity, bucket_start))''')
+
+    def get_counts(self, query, start_date, end_date, granularity, fetch_counts):
+        '''
+        Returns the counts for query between start_date and end_date, as a sorted list of (start, end, tweet_count)
+        buckets. Whole buckets are answered from the cache where possible; only missing runs of buckets, and the partial
+        buckets at either end of the period, are fetched with fetch_counts(start, end), which must return buckets in
+        the same form. Newly fetched whole buckets are added to the cache, unless they are recent (see stable_after).
+        '''
+
+        bucket_length = bucket_lengths[granularity]
+        first_bucket = ceil_to_bucket(start_date, granularity)
+        last_bucket = floor_to_bucket(end_date, granularity)
+
+        # Period too short to contain a whole bucket; nothing can be cached
+        if first_bucket >= last_bucket:
+            return fetch_counts(start_date, end_date)
+
+        query = normalise_query(query)
+        cached = self.get_cached_buckets(query, granularity, first_bucket, last_bucket)
+        counts_buckets = list(cached.values())
+
+        # Find runs of consecutive whole buckets that are not in the cache, and fetch each run with one search
+        missing_spans = []
+        bucket_start = first_bucket
+        while bucket_start < last_bucket:
+            if to_utc_string(bucket_start) not in cached:
+                if missing_spans and missing_spans[-1][1] == bucket_start:
+                    missing_spans[-1][1] = bucket_start + bucket_length
+                else:
+                    missing_spans.append([bucket_start, bucket_start + bucket_length])
+            bucket_start = bucket_start + bucket_length
+
+        logging.info(f'Counts cache: {len(cached)} buckets cached, {len(missing_spans)} missing spans to fetch for query: {query}')
+
+        for span_start, span_end in missing_spans:
+            fetched = fetch_counts(span_start, span_end)
+            self.add_buckets(query, granularity, fetched)
+            counts_buckets.extend(fetched)
+
+        # Partial buckets at either end of the search period are always fetched
+        if start_date < first_bucket:
+            counts_buckets.extend(fetch_counts(start_date, first_bucket))
+        if last_bucket < end_date:
+            counts_buckets.extend(fetch_counts(last_bucket, end_date))
+
+        return sorted(counts_buckets)
+
+    def get_cached_buckets(self, query, granularity, first_bucket, last_bucket):
+        '''
+        Returns cached buckets from first_bucket up to last_bucket, keyed by bucket start.
+        '''
+
+        with self.lock:
+            rows = self.connection.execute('''
+                SELECT bucket_start, bucket_end, tweet_count FROM counts
+                WHERE query = ? AND granularity = ? AND bucket_start >= ? AND bucket_start < ?''',
+                (query, granularity, to_utc_string(first_bucket), to_utc_string(last_bucket))).fetchall()
+
+        cached = dict()
+        for bucket_start, bucket_end, tweet_count in rows:
+            bucket = (dt.datetime.fromisoformat(bucket_start), dt.datetime.fromisoformat(bucket_end), tweet_count)
+            # Recent buckets cached by earlier versions are fetched again
+            if is_stable(bucket[1]):
+                cached[bucket_start] = bucket
+
+        return cached
+
+    def add_buckets(self, query, granularity, counts_buckets):
+        '''
+        Caches whole, aligned buckets that ended at least stable_after ago only; partial buckets depend on the search
+        period and are not reusable.
+        '''
+
+        rows = [(query, granularity, to_utc_string(bucket_start), to_utc_string(bucket_end), tweet_count)
+                for bucket_start, bucket_end, tweet_count in counts_buckets
+                if bucket_end - bucket_start == bucket_lengths[granularity]
+                and floor_to_bucket(bucket_start, granularity) == bucket_start
+                and is_stable(bucket_end)]
+
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?, ?)', rows)
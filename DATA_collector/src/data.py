@@ -1,7 +1,8 @@
-import json
+import io
 import requests
 
 import pandas as pd
+import numpy as np
 import time
 
 import humanfriendly
@@ -9,110 +10,241 @@ from humanfriendly import format_timespan
 import traceback
 import re
 import csv
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from twarc import Twarc2, expansions
+from twarc import expansions
 from google.cloud import bigquery
 from google.cloud.bigquery.client import Client
 from google.cloud.exceptions import NotFound
 from google.api_core import exceptions
 
-from .bq_schema import SchemaFuncs
+from .bq_schema import SchemaFuncs, DATA_schema
 from .notifications import *
 from .fields import DATA_fields, TCAT_fields, TweetQuery_fields, TWEET_fields
 from .set_up_directories import *
 from .validate_params import ValidateParams
 from .process_tables import ProcessTweets, ProcessTables
+from .api_client import create_client
+from .rate_limit import RateLimiter, scale_limits, SEARCH_ALL_LIMITS, COUNTS_ALL_LIMITS
+from .pipeline import run_pipeline
+from .raw_archive import RawArchiveWriter, open_archive
+from .manifest import CollectionManifest, StreamProgress
+from .partition import parse_counts_buckets, partition_by_counts
+from .counts_cache import CountsCache
+from .seen_ids import SeenTweetIds
+from .query_packing import QueryPack, plan_query_packs
+from . import columnar
+from .process_pool import get_process_pool
+from .line_index import get_line_index, can_index, has_truncated_final_line
+from .bulk_ingest import ingest_files
+from .memory import AdaptiveChunkSizer, PeakMemory
+from .throughput import StageThroughput, ThroughputHistory, default_seconds_per_tweet
+from .stage_timers import stage_timers, count_rows
 
 pd.options.mode.chained_assignment = None
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 warnings.simplefilter(action='ignore', category=pd.errors.PerformanceWarning)
 
+# One Twarc client per collection worker thread
+worker_clients = threading.local()
 
+# Local cache of counts_all results, opened on first use
+counts_cache = None
 
-def get_pre_search_counts(*args):
+# Seen tweet ID store for each dataset, opened on first use
+seen_id_stores = dict()
+
+# Tweets and time spent in each stage of the current search, and the history of previous searches
+stage_throughput = StageThroughput()
+throughput_history = None
+
+
+def get_counts_cache():
     '''
-    Runs a Twarc counts search on the query in config.yml when Option 1 (Search Archive) is selected.
+    Opens the local counts cache (my_collections/counts_cache.sqlite) on first use; shared by every count in a run.
     '''
 
-    client = args[0]
-    # Run counts_all search
-    try:
-        count_tweets = client.counts_all(query=args[1], start_time=args[2], end_time=args[3])
+    global counts_cache
+    if counts_cache is None:
+        counts_cache = CountsCache(f'{cwd}/my_collections/counts_cache.sqlite')
+    return counts_cache
+
+def get_seen_ids(dataset):
+    '''
+    Opens the seen tweet ID store (my_collections/<dataset>/seen_tweet_ids.sqlite) for a dataset on first use.
+    '''
+
+    if dataset not in seen_id_stores:
+        seen_id_stores[dataset] = SeenTweetIds(f'{cwd}/my_collections/{dataset}/seen_tweet_ids.sqlite')
+    return seen_id_stores[dataset]
+
+def get_throughput_history():
+    '''
+    Opens the throughput history (my_collections/throughput_history.json) on first use.
+    '''
+
+    global throughput_history
+    if throughput_history is None:
+        throughput_history = ThroughputHistory(f'{cwd}/my_collections/throughput_history.json')
+    return throughput_history
+
+def write_run_report(dataset, schematype, **details):
+    '''
+    Saves the stage timings of this search (see stage_timers.py) to my_collections/<dataset>/, and logs the slowest
+    stages. The report directory is set when the timers are reset, at the start of the search.
+    '''
+
+    stage_timers.write_report(dataset=dataset,
+                              schematype=schematype,
+                              flatten_engine=Collection.flatten_engine,
+                              process_workers=Collection.process_workers,
+                              ingest_workers=Collection.ingest_workers,
+                              max_chunk_mb=Collection.max_chunk_mb,
+                              memory_profile=Collection.memory_profile,
+                              memory_ceiling_mb=Collection.memory_ceiling_mb,
+                              **details)
+
+def get_stage_workers():
+    '''
+    The workers each stage of a search runs on, as recorded in the throughput history. Chunks are uploaded one at a time.
+    '''
+
+    return {'collection': Collection.workers, 'processing': Collection.process_workers, 'upload': 1}
+
+def estimate_search_duration(tweet_count):
+    '''
+    Returns a readable estimate of how long collecting, processing and uploading tweet_count tweets will take, fitted
+    on the measured throughput of previous searches with the same schematype (see throughput.py). Falls back to a
+    fixed rate until there is history.
+    '''
+
+    schematype = SchemaFuncs().set_schema_type(Schematype)
+    time_estimate, run_count = get_throughput_history().estimate(tweet_count, schematype, Collection.pipeline, get_stage_workers())
+    if time_estimate is None:
+        return format_timespan(tweet_count * default_seconds_per_tweet)
+
+    return f'{format_timespan(time_estimate)} (based on {run_count} previous {schematype} searches)'
+
+def count_query(client, query, start_date, end_date, rate_limiter=None, show_pages=True):
+    '''
+    Returns the counts for a query as a sorted list of (start, end, tweet_count) buckets (day or hour, set by
+    counts_granularity in config.yml). Unless counts_cache is False in config.yml, buckets counted in earlier runs are
+    read from the local counts cache, and only the rest are requested from the counts_all endpoint. If a rate_limiter is
+    supplied, a token is taken from it before each page is requested.
+    '''
+
+    granularity = Collection.counts_granularity
+
+    def fetch_counts(start, end):
+        # Run counts_all search; each next() on the generator requests one page
+        count_tweets = client.counts_all(query=query, start_time=start, end_time=end, granularity=granularity)
 
         # Append each page of data to list
         tweet_counts_data = []
         page_count = 0
-        for page in count_tweets:
+        while True:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            try:
+                page = next(count_tweets)
+            except StopIteration:
+                break
             page_count = page_count + 1
-            print(f"\rCounting Tweets, page {page_count}...", end="")
+            if show_pages:
+                print(f"\rCounting Tweets, page {page_count}...", end="")
             tweet_counts_data.append(page)
 
-        # Combine all ["meta"]["total_tweet_count"] and sum for total tweets
-        tweet_counts = []
-        for i in range(len(tweet_counts_data)):
-            total = (tweet_counts_data[i]["meta"]["total_tweet_count"])
-            tweet_counts.append(total)
+        return parse_counts_buckets(tweet_counts_data)
+
+    if Collection.counts_cache:
+        return get_counts_cache().get_counts(query, start_date, end_date, granularity, fetch_counts)
+    return fetch_counts(start_date, end_date)
+
+def count_query_in_worker(client, query, start_date, end_date, rate_limiter):
+    '''
+    Runs count_query() in a worker thread, using that thread's own Twarc client.
+    '''
+
+    return count_query(get_worker_client(client), query, start_date, end_date, rate_limiter, show_pages=False)
 
-        # Get total tweet counts
-        archive_search_counts = sum(tweet_counts)
+def get_pre_search_counts(*args):
+    '''
+    Runs a Twarc counts search on the query in config.yml when Option 1 (Search Archive) is selected.
+    Also returns the per-bucket (day or hour, set by counts_granularity in config.yml) counts, as a list of
+    (start, end, tweet_count) tuples.
+    '''
+
+    client = args[0]
+    try:
+        # Keep counts per bucket, for partitioning the search into windows
+        counts_buckets = count_query(client, args[1], args[2], args[3])
 
-        # Give an estimate of search duration
-        ''' Currently saving search duration data and counts to a txt file from which I will work out a good calc'''
-        time_estimate = (archive_search_counts*0.4784919736026976)/2
-        readable_time_estimate = format_timespan(time_estimate)
+        # Sum the buckets for total tweets
+        archive_search_counts = sum([tweet_count for bucket_start, bucket_end, tweet_count in counts_buckets])
+
+        # Give an estimate of search duration, from the throughput of previous searches
+        readable_time_estimate = estimate_search_duration(archive_search_counts)
     except requests.exceptions.HTTPError:
         print(f"\nThere seems to be an issue with your query that wasn't caught at the validation stage. \nIt might be an invalid bearer token.\nIf you are searching for a phrase containing 'and', ensure you wrap your query in double quotes within single quotes.\nIf you are searching for tweets in a specific language, make sure you are using the correct lang code!")
         exit()
 
 
-    return archive_search_counts, readable_time_estimate
+    return archive_search_counts, readable_time_estimate, counts_buckets
 
 def get_batch_pre_search_counts(query, start_date, end_date, client, dataset):
+    '''
+    Runs counts for each query in a list. Queries are counted by a pool of counts_workers (config.yml) worker threads,
+    which share one rate limiter for the counts_all endpoint. Each result is written to <dataset>.csv as soon as it is
+    complete, so the file is in order of completion; the returned list is in query order.
+    '''
 
     # Make directory to save counts data into
     dir_name = f'{cwd}/my_collections/{dataset}'
     # set_directory(dir_name, folder=dataset)
     set_up_directories(logfile_filepath, dir_name, folder, json_filepath, csv_filepath, error_filepath)
-    counts_list = []
+    queries = list(query)
+    counts_list = [None]*len(queries)
+
+    # Open the cache before starting the workers, so they all share it
+    if Collection.counts_cache:
+        get_counts_cache()
+    # Each bearer token has a budget of its own
+    rate_limiter = RateLimiter(scale_limits(COUNTS_ALL_LIMITS, len(client.bearer_tokens)))
 
     field_names = ['Query', 'Start_date', 'End_date', 'Count']
-    with open(f'{dir_name}/{dataset}.csv', 'w') as f:
+    with open(f'{dir_name}/{dataset}.csv', 'w', newline='') as f:
         writer = csv.DictWriter(f, fieldnames=field_names)
         writer.writeheader()
 
-        for keyword in query:
-            if 'url' in keyword:
-                query = keyword
-            else:
-                query = keyword
-            # Run counts_all search
-            count_tweets = client.counts_all(query=query, start_time=start_date, end_time=end_date)
-            time.sleep(0.5)
-            # Append each page of data to list
-            tweet_counts_data = []
-
-            page_count = 0
-            for page in count_tweets:
-                page_count = page_count + 1
-                print(f"\rCounting Tweets, page {page_count}...", end="")
-                tweet_counts_data.append(page)
-
-            # Combine all ["meta"]["total_tweet_count"] and sum for total tweets
-            tweet_counts = []
-            for i in range(len(tweet_counts_data)):
-                total = (tweet_counts_data[i]["meta"]["total_tweet_count"])
-                tweet_counts.append(total)
-
-            # Get total tweet counts
-            total_tweet_counts = sum(tweet_counts)
-            print(f'\n{query}:\n{total_tweet_counts} tweets\n')
-            counts_data = f'{query}, {start_date}, {end_date}, {total_tweet_counts}'
-            counts_list.append({'Query': query, 'Start_date': start_date, 'End_date': end_date, 'Count': total_tweet_counts})
-
-            f.write(counts_data + '\n')
-
-        archive_search_counts = counts_list
+        executor = ThreadPoolExecutor(max_workers=Collection.counts_workers)
+        try:
+            futures = dict()
+            for position, subquery in enumerate(queries):
+                futures[executor.submit(count_query_in_worker, client, subquery, start_date, end_date, rate_limiter)] = position
+
+            completed = 0
+            for future in as_completed(futures):
+                position = futures[future]
+                subquery = queries[position]
+
+                # Get total tweet counts
+                total_tweet_counts = sum([tweet_count for bucket_start, bucket_end, tweet_count in future.result()])
+                counts_list[position] = {'Query': subquery, 'Start_date': start_date, 'End_date': end_date, 'Count': total_tweet_counts}
+                writer.writerow(counts_list[position])
+                f.flush()
+
+                completed = completed + 1
+                print(f'\r{subquery}: {total_tweet_counts} tweets'.ljust(80))
+                print(f'Counted {completed} of {len(queries)} queries...', end='')
+        finally:
+            # On error, do not start counting queries that have not yet been picked up by a worker
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    print('\n')
+    archive_search_counts = counts_list
 
     # print("""\n\t\tYour counts data can be found in DATA_collector/my_collections/{dataset}.
     # Please check this file to ensure you have enough quota in your API bearer token to run these searches.""")
@@ -128,7 +260,7 @@ def calculate_interval(start_date, end_date, archive_search_counts, schematype):
     search_duration = (end_date - start_date).days
     if search_duration == 0:
         search_duration = 1
-    ave_tweets_per_file = 100000
+    ave_tweets_per_file = Collection.tweets_per_file
     archive_search_counts = archive_search_counts
     if archive_search_counts > 0:
         if archive_search_counts > ave_tweets_per_file:
@@ -145,51 +277,414 @@ def calculate_interval(start_date, end_date, archive_search_counts, schematype):
 
     return interval, num_intervals
 
-def collect_archive_data(bq, project, dataset, to_collect, not_to_collect, expected_files, client, subquery, start_date, end_date, csv_filepath, archive_search_counts, tweet_count, query, query_count, schematype):
+def calculate_windows(start_date, end_date, counts_buckets):
+    '''
+    If partition_by_counts is True in config.yml, uses the per-bucket counts from get_pre_search_counts() to cut the
+    search into windows of roughly equal tweet volume (tweets_per_file each), rather than windows of equal duration.
+    This keeps file sizes, and memory used per file when processing, predictable for event-driven queries.
+    Returns None if windows should be generated from the interval instead.
+    '''
+
+    if Collection.partition_by_counts and counts_buckets:
+        windows = partition_by_counts(counts_buckets, start_date, end_date, Collection.tweets_per_file)
+        logging.info(f'Partitioned search into {len(windows)} windows of ~{Collection.tweets_per_file} tweets')
+        return windows
+
+    return None
+
+def collect_interval(client, subquery, start, end, a_file, rate_limiter=None, manifest=None):
+    '''
+    Collects a single interval (one expected file) using the Twarc search_all endpoint, flattening each page of tweets
+    and writing it to a_file. If a rate_limiter is supplied, a token is taken from it before each page is requested, so
+    that concurrent workers share one request budget. If a manifest is supplied, the next_token and tweet count are
+    recorded after every page, and an interrupted window is resumed from its last recorded page. The window is only
+    recorded as collected: it is completed once its tweets are uploaded.
+    '''
+
+    interval_start = time.perf_counter()
+    next_token = None
+    if manifest is not None:
+        if manifest.is_collected(a_file) and os.path.isfile(a_file):
+            logging.info(f'{a_file} was collected, but not uploaded, before the collection was interrupted; processing it again')
+            return a_file
+        next_token = manifest.resume_window(a_file, subquery, start, end)
+
+    # Twarc search_all; each next() on the generator requests one page
+    search_results = client.search_all(query=subquery, start_time=start, end_time=end, max_results=100, next_token=next_token)
+
+    # Flatten tweet objects and dump to json; one open file handle per interval, one write per page
+    with RawArchiveWriter(a_file, buffer_size=Collection.write_buffer_kb*1024, fsync=Collection.fsync) as writer:
+        while True:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            try:
+                page = next(search_results)
+            except StopIteration:
+                break
+            result = expansions.flatten(page)
+            writer.write_page(result)
+            if manifest is not None:
+                manifest.record_page(a_file, page.get('meta', {}).get('next_token'), len(result), writer.file_size())
+
+    if manifest is not None:
+        manifest.record_collected(a_file)
+
+    stage_throughput.add('collection', writer.tweets_written, time.perf_counter() - interval_start)
+
+    return a_file
+
+def get_worker_client(client):
+    '''
+    Returns a Twarc client for the current worker thread, so that concurrent workers do not share one HTTP session.
+    '''
+
+    if not hasattr(worker_clients, 'client'):
+        worker_clients.client = create_client(client.bearer_tokens)
+
+    return worker_clients.client
+
+def collect_interval_in_worker(client, subquery, start, end, a_file, rate_limiter, manifest):
+    '''
+    Runs collect_interval() in a worker thread, using that thread's own Twarc client.
+    '''
+
+    return collect_interval(get_worker_client(client), subquery, start, end, a_file, rate_limiter, manifest)
+
+def collect_interval_chunks(client, subquery, start, end, a_file, chunksize, rate_limiter=None, manifest=None):
+    '''
+    Streaming version of collect_interval(), used when stream_processing is True in config.yml. Flattened pages are
+    gathered into chunks of chunksize tweets, and each chunk is yielded as a dataframe to be processed straight away,
+    rather than written to a_file and read back. Pages are only written to a_file if keep_raw_json is True.
+    If a manifest is given, each chunk is followed by a StreamProgress (see manifest.py), to be recorded once the chunk
+    is uploaded; the window is only complete once its last chunk is uploaded.
+    As the tweets of a chunk not yet uploaded are kept nowhere else, an interrupted window is not resumed part-way
+    through; it is collected again from the start. Chunks already uploaded are skipped, as long as the same tweets are
+    collected again: if a chunk differs (e.g. tweets were deleted in between), that chunk and the rest of the window
+    are uploaded again, which may duplicate tweets.
+    '''
+
+    busy_start = time.perf_counter()
+    busy_seconds = 0
+    # Chunks uploaded before the window was interrupted, as [tweets, last_tweet_id] pairs
+    uploaded_chunks = []
+    if manifest is not None:
+        uploaded_chunks = manifest.get_uploaded_chunks(a_file)
+        manifest.restart_window(a_file, subquery, start, end, uploaded_chunks)
+    to_skip = list(uploaded_chunks)
+
+    # Twarc search_all; each next() on the generator requests one page
+    search_results = client.search_all(query=subquery, start_time=start, end_time=end, max_results=100)
+
+    writer = None
+    if Collection.keep_raw_json:
+        writer = RawArchiveWriter(a_file, buffer_size=Collection.write_buffer_kb*1024, fsync=Collection.fsync)
+
+    tweets = []
+    tweets_collected = 0
+    tweets_yielded = 0
+
+    def stop_skipping():
+        nonlocal to_skip
+        if len(to_skip) > 0:
+            logging.warning(f'{a_file} returned different tweets than before it was interrupted; {len(to_skip)} chunks '
+                            f'already uploaded from it are uploaded again, and may duplicate tweets')
+            manifest.set_uploaded_chunks(a_file, uploaded_chunks[:len(uploaded_chunks) - len(to_skip)])
+            to_skip = []
+
+    def yield_chunk(chunk_tweets, last_of_window):
+        nonlocal tweets_yielded
+        first_index = tweets_yielded
+        tweets_yielded = tweets_yielded + len(chunk_tweets)
+        last_tweet_id = chunk_tweets[-1]['id'] if len(chunk_tweets) > 0 else None
+        if len(to_skip) > 0 and to_skip[0] == [len(chunk_tweets), last_tweet_id]:
+            # Uploaded before the window was interrupted
+            to_skip.pop(0)
+            chunk_tweets = []
+        else:
+            stop_skipping()
+        if len(chunk_tweets) > 0:
+            yield build_tweet_chunk(chunk_tweets, first_index)
+        if manifest is not None and (len(chunk_tweets) > 0 or last_of_window):
+            yield StreamProgress(manifest, a_file, len(chunk_tweets), last_tweet_id, last_of_window)
+
+    try:
+        while True:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            try:
+                page = next(search_results)
+            except StopIteration:
+                break
+            result = expansions.flatten(page)
+            if writer is not None:
+                writer.write_page(result)
+            if manifest is not None:
+                # No file size is recorded, so the window is never resumed from this page
+                manifest.record_page(a_file, page.get('meta', {}).get('next_token'), len(result), None)
+            tweets.extend(result)
+            tweets_collected = tweets_collected + len(result)
+
+            while len(tweets) >= chunksize:
+                busy_seconds = busy_seconds + time.perf_counter() - busy_start
+                yield from yield_chunk(tweets[:chunksize], False)
+                busy_start = time.perf_counter()
+                tweets = tweets[chunksize:]
+
+        if len(to_skip) > 0 and len(tweets) == 0:
+            # Fewer tweets than were uploaded
+            stop_skipping()
+        busy_seconds = busy_seconds + time.perf_counter() - busy_start
+        yield from yield_chunk(tweets, True)
+        busy_start = time.perf_counter()
+    finally:
+        if writer is not None:
+            writer.close()
+
+    busy_seconds = busy_seconds + time.perf_counter() - busy_start
+    stage_throughput.add('collection', tweets_collected, busy_seconds)
+    logging.info(f'Streamed {tweets_collected} tweets for {subquery} from {start} to {end}')
+
+def collect_intervals_serially(to_collect, expected_files, client, subquery, query, query_count, manifest):
+    '''
+    Collects one interval at a time, yielding each file once its collection is complete.
+    '''
+
+    for a_file in to_collect:
+        start, end = expected_files[a_file]
+        if type(query) == list:
+            logging.info(f'Query {query_count} of {len(list(query))}')
+        logging.info(f'Query: {subquery} from {start} to {end}')
+        logging.info(f'Collecting file {a_file}')
+
+        yield collect_interval(client, subquery, start, end, a_file, manifest=manifest)
+
+def collect_intervals_concurrently(to_collect, expected_files, client, subquery, workers, manifest):
+    '''
+    Collects several intervals at once through a pool of worker threads. All workers share one rate limiter that
+    respects the full-archive search rate limit of every bearer token together. Each interval is still written to its own file. Yields each file as
+    soon as its collection is complete.
+    '''
+
+    rate_limiter = RateLimiter(scale_limits(SEARCH_ALL_LIMITS, len(client.bearer_tokens)))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = []
+        for a_file in to_collect:
+            start, end = expected_files[a_file]
+            futures.append(executor.submit(collect_interval_in_worker, client, subquery, start, end, a_file, rate_limiter, manifest))
+
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # On error, do not start any intervals that have not yet been picked up by a worker
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def stream_intervals_serially(to_collect, expected_files, client, subquery, query, query_count, manifest, chunksize):
+    '''
+    Streams one interval at a time, yielding chunks of tweets as they fill.
+    '''
+
+    for a_file in to_collect:
+        start, end = expected_files[a_file]
+        if type(query) == list:
+            logging.info(f'Query {query_count} of {len(list(query))}')
+        logging.info(f'Query: {subquery} from {start} to {end}')
+        logging.info(f'Streaming file {a_file}')
+
+        yield from collect_interval_chunks(client, subquery, start, end, a_file, chunksize, manifest=manifest)
+
+def stream_intervals_concurrently(to_collect, expected_files, client, subquery, workers, manifest, chunksize):
+    '''
+    Streams several intervals at once through a pool of worker threads sharing one rate limiter, yielding chunks of
+    tweets from all of them as they fill. At most pipeline_queue_size chunks wait to be processed; workers pause while
+    the queue is full.
+    '''
+
+    rate_limiter = RateLimiter(scale_limits(SEARCH_ALL_LIMITS, len(client.bearer_tokens)))
+    chunk_queue = queue.Queue(maxsize=Collection.queue_size)
+    stopped = threading.Event()
+
+    def collect(a_file):
+        start, end = expected_files[a_file]
+        for chunk in collect_interval_chunks(get_worker_client(client), subquery, start, end, a_file, chunksize, rate_limiter, manifest):
+            while not stopped.is_set():
+                try:
+                    chunk_queue.put(chunk, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            if stopped.is_set():
+                return
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(collect, a_file) for a_file in to_collect]
+        while True:
+            try:
+                yield chunk_queue.get(timeout=0.5)
+                continue
+            except queue.Empty:
+                pass
+            for future in futures:
+                if future.done() and future.exception() is not None:
+                    raise future.exception()
+            if all(future.done() for future in futures) and chunk_queue.empty():
+                break
+    finally:
+        # On error, stop the workers and do not start any intervals that have not yet been picked up
+        stopped.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def collect_archive_data(bq, project, dataset, to_collect, not_to_collect, expected_files, client, subquery, start_date, end_date, csv_filepath, archive_search_counts, tweet_count, query, query_count, schematype, query_pack=None):
     '''
     Uses a dictionary containing expected filename, start_date and end-date, generated in set_up_directories.py.
     For each file in the dictionary, a separate query is run, resulting in e.g. 1 file per day if interval = 1.
-    This function loops through the expected files if they do not already exist in the 'collected_json' dir.
+    This function loops through the expected files that have not already been collected (see set_up_expected_files()).
+    If collection_workers in config.yml is greater than 1, several files are collected concurrently and each file is
+    processed as soon as it is complete. If pipeline is True, processing and upload run in their own stages alongside
+    collection. If a packed query_pack is given (see query_packing.py), each tweet is also attributed to the subqueries
+    it matches, in the QUERY_MEMBERSHIP table.
     Leads to the process_json_data() function.
     '''
 
     logging.info('-----------------------------------------------------------------------------------------')
     logging.info('Commencing data collection...')
-    # Collect archive data one interval at a time using the Twarc search_all endpoint
+    stage_throughput.reset()
+    stage_timers.reset(f'{cwd}/my_collections/{dataset}')
+    if Collection.process_workers > 1:
+        get_process_pool(Collection.process_workers).reset()
+    # Collect archive data using the Twarc search_all endpoint, one search per interval (file)
     if len(to_collect) > 0:
-        for a_file in to_collect:
-            start, end = expected_files[a_file]
+        # Records progress after every page, so an interrupted collection can be resumed
+        manifest = CollectionManifest(os.path.dirname(to_collect[0]))
+
+        # Skip tweets already uploaded under an earlier query in the list
+        seen_ids = None
+        if type(query) == list and Collection.deduplicate:
+            seen_ids = get_seen_ids(dataset)
+
+        if Collection.workers > 1 and len(to_collect) > 1:
             if type(query) == list:
                 logging.info(f'Query {query_count} of {len(list(query))}')
-            logging.info(f'Query: {subquery} from {start} to {end}')
-            logging.info(f'Collecting file {a_file}')
-
-            # Twarc search_all
-            search_results = client.search_all(query=subquery, start_time=start, end_time=end, max_results=100)
-
-            # Flatten tweet objects and dump to json
-            for page in search_results:
-                result = expansions.flatten(page)
-                for tweet in result:
-                    json_object = (json.dumps(tweet))
-                    with open(a_file, "a") as f:
-                        f.write(json_object + "\n")
-
-            # Start processing collected file
-            if os.path.isfile(a_file):
-                logging.info(f'Processing tweet data...')
-                # Process json data
-                tweet_count, list_of_dataframes = process_json_data(a_file, csv_filepath, bq, project, dataset, subquery, start_date, end_date, archive_search_counts, tweet_count, schematype, test=False)
-
+            logging.info(f'Query: {subquery} from {start_date} to {end_date}')
+            logging.info(f'Collecting {len(to_collect)} files using {Collection.workers} concurrent workers')
+            if Collection.stream_processing:
+                collected_files = stream_intervals_concurrently(to_collect, expected_files, client, subquery, Collection.workers, manifest, get_chunksize(schematype))
+            else:
+                collected_files = collect_intervals_concurrently(to_collect, expected_files, client, subquery, Collection.workers, manifest)
+        elif Collection.stream_processing:
+            collected_files = stream_intervals_serially(to_collect, expected_files, client, subquery, query, query_count, manifest, get_chunksize(schematype))
+        else:
+            collected_files = collect_intervals_serially(to_collect, expected_files, client, subquery, query, query_count, manifest)
+
+        if Collection.pipeline:
+            # Overlap collection, processing and upload; see pipeline.py
+            tweet_count = process_in_pipeline(collected_files, csv_filepath, bq, project, dataset, subquery, start_date, end_date, archive_search_counts, tweet_count, schematype, seen_ids, query_pack, streamed=Collection.stream_processing, manifest=manifest)
+        elif Collection.stream_processing:
+            # Chunks of tweets are processed and uploaded as they are collected, without reading back a json file
+            for list_of_dataframes in process_chunks(collected_files, seen_ids, query_pack):
+                if isinstance(list_of_dataframes, StreamProgress):
+                    # The chunks before it are uploaded
+                    list_of_dataframes.record()
+                    continue
+                tweet_count = upload_processed_chunk(list_of_dataframes, csv_filepath, bq, project, dataset, subquery, start_date, end_date, archive_search_counts, tweet_count, schematype, seen_ids)
+        else:
+            for a_file in collected_files:
+                # Start processing collected file
+                if os.path.isfile(a_file):
+                    logging.info(f'Processing tweet data from {a_file}...')
+                    # Process json data
+                    tweet_count, list_of_dataframes = process_json_data(a_file, csv_filepath, bq, project, dataset, subquery, start_date, end_date, archive_search_counts, tweet_count, schematype, test=False, seen_ids=seen_ids, query_pack=query_pack)
+                # Only now that its tweets are uploaded is the window complete
+                manifest.complete_window(a_file)
+
+        if seen_ids is not None:
+            logging.info(f'Duplicate tweets skipped in this dataset so far: {seen_ids.duplicates_skipped}')
+
+        # Save this search's throughput, for estimating the duration of future searches
+        get_throughput_history().record_run(schematype, stage_throughput, get_stage_workers())
+        write_run_report(dataset, schematype, query=subquery, start_date=str(start_date), end_date=str(end_date))
+
+        # Report requests per bearer token, if several are in use
+        if client.token_pool is not None:
+            client.token_pool.log_usage()
+
+        # Report how processing scaled across the process pool, if one is in use
+        if Collection.process_workers > 1:
+            get_process_pool(Collection.process_workers).log_scaling_report()
+
+    elif type(query) == list:
+        # Move on to the next query in the list
+        logging.info(f'All files for query {subquery} have already been collected. Skipping...')
     else:
         print_already_collected(dataset, not_to_collect)
         exit()
 
-def process_json_data(a_file, csv_filepath, bq, project, dataset, subquery, start_date, end_date, archive_search_counts, tweet_count, schematype, test):
+def process_in_pipeline(collected_files, csv_filepath, bq, project, dataset, subquery, start_date, end_date, archive_search_counts, tweet_count, schematype, seen_ids=None, query_pack=None, streamed=False, manifest=None):
+    '''
+    Processes and uploads collected files in a producer/consumer pipeline: while the next file is being collected, the
+    previous file is flattened in a separate stage, and each flattened chunk is uploaded to Google BigQuery as soon as it
+    is ready. If streamed is True, collected_files yields chunks of tweets (see collect_interval_chunks()) rather than
+    files, and each chunk is flattened as soon as it is collected. If a manifest is given, each file's window is
+    completed once the last chunk of the file is uploaded. Returns the updated tweet_count.
+    '''
+
+    def process_file(a_file):
+        if streamed:
+            # a_file is a chunk of tweets
+            yield from process_chunks([a_file], seen_ids, query_pack)
+            return
+        if os.path.isfile(a_file):
+            logging.info(f'Processing tweet data from {a_file}...')
+            yield from iter_processed_chunks(a_file, schematype, seen_ids, query_pack)
+        if manifest is not None:
+            yield StreamProgress(manifest, a_file, 0, None, True)
+
+    def upload(list_of_dataframes):
+        nonlocal tweet_count
+        if isinstance(list_of_dataframes, StreamProgress):
+            # Chunks are uploaded in order, so the chunks before it are uploaded
+            list_of_dataframes.record()
+            return
+        tweet_count = upload_processed_chunk(list_of_dataframes, csv_filepath, bq, project, dataset, subquery, start_date, end_date, archive_search_counts, tweet_count, schematype, seen_ids)
+
+    run_pipeline(collected_files, process_file, upload, queue_size=Collection.queue_size)
+
+    return tweet_count
+
+def ingest_json_files(json_input_files, csv_filepath, bq, project, dataset, subquery, start_date, end_date, archive_search_counts, tweet_count, schematype):
+    '''
+    Processes several json files at once, each in a worker process of its own (see bulk_ingest.py), uploading each
+    processed chunk from this process as it arrives. Returns the updated tweet_count.
+    '''
+
+    def upload(list_of_dataframes):
+        nonlocal tweet_count
+        tweet_count = upload_processed_chunk(list_of_dataframes, csv_filepath, bq, project, dataset, subquery, start_date, end_date, archive_search_counts, tweet_count, schematype)
+
+    ingest_files(json_input_files, Collection.ingest_workers, schematype, upload)
+
+    return tweet_count
+
+def process_json_data(a_file, csv_filepath, bq, project, dataset, subquery, start_date, end_date, archive_search_counts, tweet_count, schematype, test, seen_ids=None, query_pack=None):
     '''
     For each file collected, process 50,000 lines at a time. This keeps memory usage low while processing at a reasonable rate.
     Un-nests each tweet object, flattens main Tweet table, then sorts nested columns into separate, flattened tables.
     All tables are connected to the main Tweet table by either 'tweet_id', 'author_id' or 'poll_id'.
+    If a seen_ids store is supplied, tweets already uploaded to the dataset are skipped.
+    If a packed query_pack is supplied, the QUERY_MEMBERSHIP table is added to each chunk's list_of_dataframes.
+    '''
+
+    list_of_dataframes = None
+    for list_of_dataframes in iter_processed_chunks(a_file, schematype, seen_ids, query_pack):
+        if test == False:
+            tweet_count = upload_processed_chunk(list_of_dataframes, csv_filepath, bq, project, dataset, subquery, start_date, end_date, archive_search_counts, tweet_count, schematype, seen_ids)
+
+    return tweet_count, list_of_dataframes
+
+def get_chunksize(schematype):
+    '''
+    Number of json lines to process at a time.
     '''
 
     # Process json 50,000 lines at a time
@@ -200,128 +695,389 @@ def process_json_data(a_file, csv_filepath, bq, project, dataset, subquery, star
     else:
         chunksize = 50000
 
-    for chunk in pd.read_json(a_file, lines=True, dtype=False, chunksize=chunksize):
-        tweets = chunk
-
-        # If data are totally unprocessed, use 'data' field to identify and flatten the twarc response
-        if 'data' in tweets.columns:
-            tweetdict = tweets.to_dict()
-            for item in tweetdict:
-                tweetdict[item] = tweetdict[item][0]
-            tweetdict_flat = expansions.flatten(tweetdict)
-            tweets = pd.DataFrame(tweetdict_flat)
+    return chunksize
 
-        # Rename 'id' field for clarity.
-        try:
-            tweets = tweets.rename(columns={'id': 'tweet_id', 'id_str': 'tweet_id'}, errors='ignore')
-            tweets['tweet_id'] = tweets['tweet_id'].astype(object)
-        except KeyError:
-            print("No 'id' or 'id_str' fields found in dataframe. Exiting...")
+def get_chunk_sizer(schematype):
+    '''
+    Returns an AdaptiveChunkSizer for the max_chunk_mb memory budget (see memory.py), or None for chunks of a fixed
+    number of lines.
+    '''
 
-        # Init ProcessTweets class
-        process_tweets = ProcessTweets()
+    if not Collection.max_chunk_mb:
+        return None
+    return AdaptiveChunkSizer(Collection.max_chunk_mb, get_chunksize(schematype))
 
-        # Call function to flatten top level tweets and merge with one-to-one nested columns
-        tweets_flat = process_tweets.flatten_top_tweet_level(tweets)
-        # Start reference_levels_list with tweets_flat only; append lower reference levels to this list
-        reference_levels_list = [tweets_flat]
-        reference_levels_list = process_tweets.unpack_referenced_tweets(reference_levels_list)
-        # Get pre-defined fields from fields.py (DATA class)
-        up_a_level_column_list = TWEET_fields.up_a_level_column_list
-        # Copy data from reference levels to previous level, as 'referenced_tweet' columns. This creates 'TWEET' table
-        TWEETS = process_tweets.move_referenced_tweet_data_up(reference_levels_list, up_a_level_column_list)
+def iter_processed_chunks(a_file, schematype, seen_ids=None, query_pack=None, line_range=None):
+    '''
+    Reads a json file (optionally gzip or zstd compressed) one chunk at a time and yields the list_of_dataframes built from each chunk.
+    If a seen_ids store is supplied, tweets already uploaded to the dataset are dropped before flattening.
+    If a packed query_pack is supplied, the chunk's QUERY_MEMBERSHIP table is appended to list_of_dataframes.
+    If a line_range (start_line, stop_line) is given, only those lines of the (uncompressed) file are read, using its
+    line index (see line_index.py). An incomplete final line, e.g. from a crashed collection, is skipped.
+    If max_chunk_mb is set, chunks are sized to fit that memory budget rather than a fixed number of lines.
+    '''
 
-        # Address retweet truncation issue
-        TWEETS = process_tweets.fix_retweet_truncation(TWEETS)
+    chunk_sizer = get_chunk_sizer(schematype)
+    if line_range is not None or has_truncated_final_line(a_file):
+        line_index = get_line_index(a_file)
+        if line_range is None:
+            logging.warning(f'Skipping the incomplete final line of {a_file}')
+            line_range = (0, line_index.line_count)
+        yield from process_chunks(read_line_range_chunks(line_index, line_range, schematype, chunk_sizer), seen_ids, query_pack, chunk_sizer)
+        return
 
-        logging.info('TWEETS table built')
+    # Compressed files (.jsonl.gz, .jsonl.zst) are decompressed as a stream
+    with open_archive(a_file) as f:
+        yield from process_chunks(read_chunks(f, schematype, chunk_sizer), seen_ids, query_pack, chunk_sizer)
 
-        logging.info('Unpacking one-to-many nested columns...')
+def read_chunks(f, schematype, chunk_sizer=None):
+    '''
+    Yields chunks of tweets (dataframes) read from a json file, counting the time spent reading as processing time.
+    Chunks are split by chunk_sizer if one is given, otherwise every get_chunksize() lines.
+    '''
 
-        # Init ProcessTables class
-        data_processor = ProcessTables()
+    if chunk_sizer is not None:
+        chunks = read_sized_chunks(f, chunk_sizer)
+    elif Collection.flatten_engine == 'columnar':
+        chunks = read_decoded_chunks(f, get_chunksize(schematype))
+    else:
+        chunks = pd.read_json(f, lines=True, dtype=False, chunksize=get_chunksize(schematype))
+    yield from timed_reads(chunks)
+
+def timed_reads(chunks):
+    # Time spent reading chunks counts as processing time, and as the read_json stage of each chunk
+    while True:
+        read_start = time.perf_counter()
+        chunk = next(chunks, None)
+        seconds = time.perf_counter() - read_start
+        if chunk is None:
+            break
+        stage_throughput.add('processing', 0, seconds)
+        stage_timers.record('read_json', seconds, rows_out=len(chunk))
+        yield chunk
+
+def read_sized_chunks(lines, chunk_sizer, first_row=0):
+    '''
+    Yields chunks of tweets from lines of json, split into chunks by chunk_sizer, and indexed from first_row on as
+    pd.read_json() indexes the lines of a file.
+    '''
 
-        # Pull entities_mentions from TWEETS for building MENTIONS, AUTHOR DESCRIPTION, AUTHOR_URLS
-        if 'entities_mentions' in TWEETS.columns:
-            entities_mentions = data_processor.extract_entities_data(TWEETS)
+    for chunk_lines in chunk_sizer.split(lines):
+        if all(len(line.strip()) == 0 for line in chunk_lines):
+            continue
+        if Collection.flatten_engine == 'columnar':
+            chunk = build_tweet_chunk(columnar.decode_lines(chunk_lines), first_row)
         else:
-            entities_mentions = pd.DataFrame()
+            chunk = pd.read_json(io.StringIO(''.join(chunk_lines)), lines=True, dtype=False)
+            chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+        first_row = first_row + len(chunk)
+        yield chunk
 
-        # Depending on schema chosen, proceed with table building
-        if Schematype.DATA == True:
-            AUTHOR_DESCRIPTION = data_processor.build_author_description_table(TWEETS, entities_mentions)
-            AUTHOR_URLS = data_processor.build_author_urls_table(TWEETS, entities_mentions)
-            MEDIA = data_processor.build_media_table(TWEETS)
-            POLL_OPTIONS = data_processor.build_poll_options_table(TWEETS)
-            CONTEXT_ANNOTATIONS = data_processor.build_context_annotations_table(TWEETS)
-            ANNOTATIONS = data_processor.build_annotations_table(TWEETS)
-            HASHTAGS = data_processor.build_hashtags_table(TWEETS)
-            CASHTAGS = data_processor.build_cashtags_table(TWEETS)
-            URLS = data_processor.build_urls_table(TWEETS)
-            TWEETS = process_tweets.extract_quote_reply_users(TWEETS, URLS)
-            MENTIONS = data_processor.build_mentions_table(entities_mentions)
-            INTERACTIONS = data_processor.build_interactions_table(TWEETS, MENTIONS)
-            EDIT_HISTORY = data_processor.build_edit_history_table(TWEETS)
+def read_line_range_chunks(line_index, line_range, schematype, chunk_sizer=None):
+    '''
+    Yields chunks of tweets read from a range of lines of an indexed json file, seeking straight to each chunk's lines.
+    Chunks are the same as those read from the whole file by read_chunks(), for the same lines.
+    '''
+
+    start_line, stop_line = line_range
+    if chunk_sizer is not None:
+        lines = line_index.iter_lines(start_line, stop_line)
+        chunks = read_sized_chunks(lines, chunk_sizer, int(line_index.rows_before_line[start_line]))
+    else:
+        chunks = read_indexed_chunks(line_index, start_line, stop_line, get_chunksize(schematype))
+    yield from timed_reads(chunks)
+
+def read_indexed_chunks(line_index, start_line, stop_line, chunksize):
+    '''
+    Yields chunks of tweets from lines start_line to stop_line of an indexed json file, chunksize lines at a time.
+    '''
+
+    for first_row, lines in line_index.iter_line_chunks(start_line, stop_line, chunksize):
+        lines = lines.decode('utf-8')
+        if len(lines.strip()) == 0:
+            continue
+        if Collection.flatten_engine == 'columnar':
+            chunk = build_tweet_chunk(columnar.decode_lines(lines.splitlines()), first_row)
         else:
-            TWEETS = TWEETS.loc[TWEETS['reference_level'] == '0']
-            MENTIONS = data_processor.build_mentions_table(entities_mentions)
-            INTERACTIONS = data_processor.build_interactions_table(TWEETS, MENTIONS)
-            HASHTAGS = data_processor.build_hashtags_table(TWEETS)
-            URLS = data_processor.build_urls_table(TWEETS)
-            # todo CASHTAGS = SYMBOLS IN TQ
-            CASHTAGS = AUTHOR_DESCRIPTION = AUTHOR_URLS = MEDIA = POLL_OPTIONS = CONTEXT_ANNOTATIONS = ANNOTATIONS = EDIT_HISTORY = None
-
-        # Special case of geo_geo_bbox: convert from column of lists to strings
-        if 'geo_geo_bbox' in TWEETS.columns:
-            TWEETS['geo_geo_bbox'] = TWEETS['geo_geo_bbox'].fillna('')
-            TWEETS['geo_geo_bbox'] = [','.join(map(str, l)) for l in TWEETS['geo_geo_bbox']]
-
-        TWEETS = process_tweets.process_boolean_cols(TWEETS)
-        TWEETS = TWEETS.rename(columns={
-            'text': 'tweet_text'})\
-            .reset_index(drop=True)\
-            .reindex(columns=DATA_fields.tweet_column_order) \
-            .drop_duplicates()
-
-        TWEETS = process_tweets.fill_blanks_and_nas(TWEETS)
-
-        TWEETS = TWEETS.astype(TWEET_fields.tweet_table_dtype_dict)
-
-        list_of_dataframes = [TWEETS,
-                              MEDIA,
-                              ANNOTATIONS,
-                              CONTEXT_ANNOTATIONS,
-                              HASHTAGS,
-                              CASHTAGS,
-                              URLS,
-                              MENTIONS,
-                              AUTHOR_DESCRIPTION,
-                              AUTHOR_URLS,
-                              POLL_OPTIONS,
-                              INTERACTIONS,
-                              EDIT_HISTORY]
+            chunk = pd.read_json(io.StringIO(lines), lines=True, dtype=False)
+            chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+        yield chunk
 
-        if test == False:
-            # Init SchemaFuncs class
-            schema_funcs = SchemaFuncs()
+def count_input_tweets(json_input_files):
+    '''
+    Counts the tweets in uncompressed json input files from their line indexes. Returns 0 (unknown) if any file is
+    compressed.
+    '''
 
-            # Proceed according to schema chosen
-            list_of_dataframes, list_of_csv, list_of_tablenames, list_of_schema, tweet_count = schema_funcs.get_schema_type(list_of_dataframes, tweet_count)
+    if not all(can_index(a_file) for a_file in json_input_files):
+        return 0
+    return sum(get_line_index(a_file).tweet_count for a_file in json_input_files)
 
-            # For each processed json, write to temp csv file
-            for tweetframe, csv_file in zip(list_of_dataframes, list_of_csv):
-                write_processed_data_to_csv(tweetframe, csv_file, csv_filepath)
-            if archive_search_counts > 0:
-                percent_collected = tweet_count / archive_search_counts * 100
-                logging.info(f'Processed {tweet_count} of {archive_search_counts} collected tweets ({round(percent_collected, 1)}%)')
+def read_decoded_chunks(f, chunksize):
+    '''
+    Yields chunks of tweets from a json file, chunksize lines at a time, exactly as pd.read_json() reads them, with
+    each line decoded by the columnar engine.
+    '''
 
-            # Write temp csv files to BigQuery tables
-            push_processed_tables_to_bq(bq, project, dataset, list_of_tablenames, csv_filepath, list_of_csv, subquery, start_date, end_date, list_of_schema, list_of_dataframes, schematype)
+    first_index = 0
+    for tweets in columnar.iter_decoded_lines(f, chunksize):
+        yield build_tweet_chunk(tweets, first_index)
+        first_index = first_index + len(tweets)
 
-    return tweet_count, list_of_dataframes
+def process_chunks(chunks, seen_ids=None, query_pack=None, chunk_sizer=None):
+    '''
+    Yields the list_of_dataframes built from each chunk of tweets (a dataframe of flattened tweets), whether read from
+    a json file or streamed from collection.
+    If a seen_ids store is supplied, tweets already uploaded to the dataset are dropped before flattening.
+    If a packed query_pack is supplied, the chunk's QUERY_MEMBERSHIP table is appended to list_of_dataframes.
+    If process_workers is more than 1, chunks are flattened in a process pool (see process_pool.py), and yielded in order.
+    If a chunk_sizer is supplied, the memory used to flatten each chunk is measured and recorded with it, to size the
+    chunks read next.
+    A StreamProgress among streamed chunks is yielded as it is, in order, to be recorded once the chunks before it are
+    uploaded. A chunk whose tweets were all uploaded already yields only its QUERY_MEMBERSHIP table, if packed.
+    '''
+
+    if Collection.process_workers > 1:
+        pool = get_process_pool(Collection.process_workers)
+        chunks = prepare_chunks(chunks, seen_ids, query_pack)
+        for list_of_dataframes, context, seconds, memory_used in pool.map(process_tweet_chunk, chunks, chunk_sizer is not None):
+            if list_of_dataframes is None:
+                # Nothing to flatten (see prepare_chunks())
+                yield context
+                continue
+            tweets, QUERY_MEMBERSHIP = context
+            if chunk_sizer is not None:
+                chunk_sizer.record(tweets, memory_used)
+            if QUERY_MEMBERSHIP is not None:
+                list_of_dataframes.append(QUERY_MEMBERSHIP)
+            # Time spent waiting for the workers; excludes time spent by the consumer of this generator
+            stage_throughput.add('processing', tweets, seconds)
+            yield list_of_dataframes
+        return
+
+    for chunk, context in prepare_chunks(chunks, seen_ids, query_pack):
+        if chunk is None:
+            # Nothing to flatten (see prepare_chunks())
+            yield context
+            continue
+        tweets, QUERY_MEMBERSHIP = context
+        chunk_start = time.perf_counter()
+        peak_memory = PeakMemory().start() if chunk_sizer is not None else None
+        list_of_dataframes = process_tweet_chunk(chunk)
+        if peak_memory is not None:
+            chunk_sizer.record(tweets, peak_memory.stop())
+        if QUERY_MEMBERSHIP is not None:
+            list_of_dataframes.append(QUERY_MEMBERSHIP)
+        # Flattening time; excludes time spent by the consumer of this generator
+        stage_throughput.add('processing', tweets, time.perf_counter() - chunk_start)
+        yield list_of_dataframes
+
+def prepare_chunks(chunks, seen_ids=None, query_pack=None):
+    '''
+    Yields each chunk of tweets to be flattened, with the number of tweets in it and its QUERY_MEMBERSHIP table (or None).
+    Tweets in seen_ids are dropped, and chunks left empty are skipped. The time taken counts as processing time.
+    Items with nothing to flatten are passed on as (None, item): a StreamProgress among the chunks, and the
+    QUERY_MEMBERSHIP table of a chunk whose tweets were all dropped, as a list_of_dataframes of its own.
+    '''
+
+    for chunk in chunks:
+        if isinstance(chunk, StreamProgress):
+            yield None, chunk
+            continue
+        chunk_start = time.perf_counter()
+        # Attribute tweets to subqueries before duplicates are dropped, so a tweet already uploaded under an
+        # earlier query is still recorded as matching this one
+        QUERY_MEMBERSHIP = None
+        if query_pack is not None and query_pack.is_packed() and 'id' in chunk.columns:
+            QUERY_MEMBERSHIP = query_pack.build_membership_table(chunk)
+        if seen_ids is not None:
+            chunk = seen_ids.drop_seen(chunk)
+        stage_throughput.add('processing', 0, time.perf_counter() - chunk_start)
+        if len(chunk) == 0:
+            # The tweets were uploaded under an earlier query, but still match this one
+            if QUERY_MEMBERSHIP is not None and len(QUERY_MEMBERSHIP) > 0:
+                yield None, [QUERY_MEMBERSHIP]
+            continue
+        yield chunk, (len(chunk), QUERY_MEMBERSHIP)
+
+def is_default_date_column(column):
+    # Columns that pd.read_json() converts to datetimes by default
+    column = column.lower()
+    return column.endswith('_at') or column.endswith('_time') or column in ['modified', 'date', 'datetime'] or column.startswith('timestamp')
+
+def build_tweet_chunk(tweets, first_index=0):
+    '''
+    Builds a chunk of tweets (a dataframe) from a list of flattened tweets, exactly as pd.read_json() reads the same
+    tweets from a collected json file: with date columns converted to datetimes, and indexed from first_index.
+    '''
+
+    chunk = pd.DataFrame(tweets, index=pd.RangeIndex(first_index, first_index + len(tweets)))
+    for column in chunk.columns:
+        if chunk[column].dtype == object and is_default_date_column(column):
+            try:
+                chunk[column] = pd.to_datetime(chunk[column], errors='raise')
+            except (ValueError, OverflowError, TypeError):
+                pass
+        # As pd.read_json(dtype=False) does, missing values (e.g. json nulls) become NaN
+        if chunk[column].isna().any():
+            chunk[column] = chunk[column].fillna(np.nan)
 
+    return chunk
 
+@stage_timers.chunk('processing')
+def process_tweet_chunk(tweets):
+    '''
+    Builds the TWEETS table and all one-to-many tables from one chunk of tweets (a dataframe of flattened tweet objects).
+    Returns list_of_dataframes, in the order expected by SchemaFuncs.get_schema_type().
+    Each stage is timed, as one 'processing' chunk of the run report (see stage_timers.py).
+    '''
+
+    # If data are totally unprocessed, use 'data' field to identify and flatten the twarc response
+    if 'data' in tweets.columns:
+        tweetdict = tweets.to_dict()
+        for item in tweetdict:
+            tweetdict[item] = tweetdict[item][0]
+        tweetdict_flat = expansions.flatten(tweetdict)
+        tweets = pd.DataFrame(tweetdict_flat)
+
+    # Rename 'id' field for clarity.
+    try:
+        tweets = tweets.rename(columns={'id': 'tweet_id', 'id_str': 'tweet_id'}, errors='ignore')
+        tweets['tweet_id'] = tweets['tweet_id'].astype(object)
+    except KeyError:
+        print("No 'id' or 'id_str' fields found in dataframe. Exiting...")
+
+    # Init ProcessTweets class
+    process_tweets = ProcessTweets()
+
+    # Call function to flatten top level tweets and merge with one-to-one nested columns
+    tweets_flat = None
+    if Collection.flatten_engine == 'columnar':
+        tweets_flat = columnar.flatten_top_tweet_level(tweets)
+    elif Collection.flatten_engine != 'pandas':
+        raise ValueError(f"flatten_engine must be 'pandas' or 'columnar', not '{Collection.flatten_engine}'")
+    if tweets_flat is None:
+        tweets_flat = process_tweets.flatten_top_tweet_level(tweets)
+    # Start reference_levels_list with tweets_flat only; append lower reference levels to this list
+    reference_levels_list = [tweets_flat]
+    reference_levels_list = process_tweets.unpack_referenced_tweets(reference_levels_list)
+    # Get pre-defined fields from fields.py (DATA class)
+    up_a_level_column_list = TWEET_fields.up_a_level_column_list
+    # Copy data from reference levels to previous level, as 'referenced_tweet' columns. This creates 'TWEET' table
+    TWEETS = process_tweets.move_referenced_tweet_data_up(reference_levels_list, up_a_level_column_list)
 
+    # Address retweet truncation issue
+    TWEETS = process_tweets.fix_retweet_truncation(TWEETS)
+
+    logging.info('TWEETS table built')
+
+    logging.info('Unpacking one-to-many nested columns...')
+
+    # Init ProcessTables class
+    data_processor = ProcessTables()
+
+    # Pull entities_mentions from TWEETS for building MENTIONS, AUTHOR DESCRIPTION, AUTHOR_URLS
+    if 'entities_mentions' in TWEETS.columns:
+        entities_mentions = data_processor.extract_entities_data(TWEETS)
+    else:
+        entities_mentions = pd.DataFrame()
+
+    # Depending on schema chosen, proceed with table building
+    if Schematype.DATA == True:
+        AUTHOR_DESCRIPTION = data_processor.build_author_description_table(TWEETS, entities_mentions)
+        AUTHOR_URLS = data_processor.build_author_urls_table(TWEETS, entities_mentions)
+        MEDIA = data_processor.build_media_table(TWEETS)
+        POLL_OPTIONS = data_processor.build_poll_options_table(TWEETS)
+        CONTEXT_ANNOTATIONS = data_processor.build_context_annotations_table(TWEETS)
+        ANNOTATIONS = data_processor.build_annotations_table(TWEETS)
+        HASHTAGS = data_processor.build_hashtags_table(TWEETS)
+        CASHTAGS = data_processor.build_cashtags_table(TWEETS)
+        URLS = data_processor.build_urls_table(TWEETS)
+        TWEETS = process_tweets.extract_quote_reply_users(TWEETS, URLS)
+        MENTIONS = data_processor.build_mentions_table(entities_mentions)
+        INTERACTIONS = data_processor.build_interactions_table(TWEETS, MENTIONS)
+        EDIT_HISTORY = data_processor.build_edit_history_table(TWEETS)
+    else:
+        TWEETS = TWEETS.loc[TWEETS['reference_level'] == '0']
+        MENTIONS = data_processor.build_mentions_table(entities_mentions)
+        INTERACTIONS = data_processor.build_interactions_table(TWEETS, MENTIONS)
+        HASHTAGS = data_processor.build_hashtags_table(TWEETS)
+        URLS = data_processor.build_urls_table(TWEETS)
+        # todo CASHTAGS = SYMBOLS IN TQ
+        CASHTAGS = AUTHOR_DESCRIPTION = AUTHOR_URLS = MEDIA = POLL_OPTIONS = CONTEXT_ANNOTATIONS = ANNOTATIONS = EDIT_HISTORY = None
+
+    # Special case of geo_geo_bbox: convert from column of lists to strings
+    if 'geo_geo_bbox' in TWEETS.columns:
+        TWEETS['geo_geo_bbox'] = TWEETS['geo_geo_bbox'].fillna('')
+        TWEETS['geo_geo_bbox'] = [','.join(map(str, l)) for l in TWEETS['geo_geo_bbox']]
+
+    TWEETS = process_tweets.process_boolean_cols(TWEETS)
+    TWEETS = TWEETS.rename(columns={
+        'text': 'tweet_text'})\
+        .reset_index(drop=True)\
+        .reindex(columns=DATA_fields.tweet_column_order) \
+        .drop_duplicates()
+
+    TWEETS = process_tweets.fill_blanks_and_nas(TWEETS)
+
+    TWEETS = TWEETS.astype(TWEET_fields.tweet_table_dtype_dict)
+
+    list_of_dataframes = [TWEETS,
+                          MEDIA,
+                          ANNOTATIONS,
+                          CONTEXT_ANNOTATIONS,
+                          HASHTAGS,
+                          CASHTAGS,
+                          URLS,
+                          MENTIONS,
+                          AUTHOR_DESCRIPTION,
+                          AUTHOR_URLS,
+                          POLL_OPTIONS,
+                          INTERACTIONS,
+                          EDIT_HISTORY]
+
+    stage_timers.record_tables(DATA_schema.list_of_tablenames, list_of_dataframes)
+
+    return list_of_dataframes
+
+@stage_timers.chunk('upload')
+def upload_processed_chunk(list_of_dataframes, csv_filepath, bq, project, dataset, subquery, start_date, end_date, archive_search_counts, tweet_count, schematype, seen_ids=None):
+    '''
+    Writes one processed chunk to temp csv files and pushes them to Google BigQuery. Returns the updated tweet_count.
+    If a seen_ids store is supplied, the chunk's level 0 tweets are recorded in it once uploaded.
+    '''
+
+    upload_start = time.perf_counter()
+    # Level 0 tweets, i.e. those matching the query (rather than tweets they reference); none if the chunk holds only
+    # a QUERY_MEMBERSHIP table (see prepare_chunks())
+    TWEETS = list_of_dataframes[0]
+    if 'reference_level' in TWEETS.columns:
+        uploaded_ids = TWEETS.loc[TWEETS['reference_level'] == '0', 'tweet_id']
+    else:
+        uploaded_ids = []
+
+    # Init SchemaFuncs class
+    schema_funcs = SchemaFuncs()
+
+    # Proceed according to schema chosen
+    list_of_dataframes, list_of_csv, list_of_tablenames, list_of_schema, tweet_count = schema_funcs.get_schema_type(list_of_dataframes, tweet_count)
+
+    # For each processed json, write to temp csv file
+    for tweetframe, csv_file in zip(list_of_dataframes, list_of_csv):
+        write_processed_data_to_csv(tweetframe, csv_file, csv_filepath)
+    if archive_search_counts > 0:
+        percent_collected = tweet_count / archive_search_counts * 100
+        logging.info(f'Processed {tweet_count} of {archive_search_counts} collected tweets ({round(percent_collected, 1)}%)')
+
+    # Write temp csv files to BigQuery tables
+    push_processed_tables_to_bq(bq, project, dataset, list_of_tablenames, csv_filepath, list_of_csv, subquery, start_date, end_date, list_of_schema, list_of_dataframes, schematype)
+
+    if seen_ids is not None:
+        seen_ids.add(uploaded_ids)
+
+    stage_throughput.add('upload', len(uploaded_ids), time.perf_counter() - upload_start)
+
+    return tweet_count
 
 def write_processed_data_to_csv(tweetframe, csv_file, csv_filepath):
     '''
@@ -338,11 +1094,12 @@ def write_processed_data_to_csv(tweetframe, csv_file, csv_filepath):
                 mode = 'w'
                 header = True
 
-            tweetframe.to_csv(csv_filepath + csv_file,
-                              mode=mode,
-                              index=False,
-                              escapechar='|',
-                              header=header)
+            with stage_timers.stage(f'write_csv {csv_file}', len(tweetframe)):
+                tweetframe.to_csv(csv_filepath + csv_file,
+                                  mode=mode,
+                                  index=False,
+                                  escapechar='|',
+                                  header=header)
     except TypeError:
         pass
         print('Test does not produce CSV tables')
@@ -386,10 +1143,7 @@ def push_processed_tables_to_bq(bq, project, dataset, list_of_tablenames, csv_fi
     # Create table in dataset if one does not exist
     for i in range(num_tables):
         if os.path.isfile(csv_filepath + list_of_csv[i]) == True:
-            if schematype != 'TweetQuery':
-                tweets_table = list_of_tablenames[i]
-            else:
-                tweets_table = 'tweets_flat'
+            tweets_table = list_of_tablenames[i]
 
             table_id = bigquery.Table(f'{tweet_dataset}.{tweets_table}')
 
@@ -407,7 +1161,7 @@ def push_processed_tables_to_bq(bq, project, dataset, list_of_tablenames, csv_fi
 
             job_config.allow_quoted_newlines = True
 
-            with open(csv_filepath + list_of_csv[i], 'rb') as tweet_fh:
+            with open(csv_filepath + list_of_csv[i], 'rb') as tweet_fh, stage_timers.stage(f'load_job {tweets_table}', count_rows(list_of_dataframes[i])):
                 for attempt in range(1, 11):
                     try:
                         job = bq.load_table_from_file(tweet_fh, tweet_dataset + '.' + tweets_table,
@@ -541,8 +1295,8 @@ def run_DATA():
                     search will commence; if 'n', program will exit.
                     ii) If 'n', search/process/push will commence.
         2. Process from json
-            DATA will look for .jsonl files in the DATA_collector/json_input_files directory, then ask the user if they
-            would like to proceed. If 'y', files will be processed and pushed to the specified Google BigQuery dataset.
+            DATA will look for .jsonl (or compressed .jsonl.gz/.jsonl.zst) files in the DATA_collector/json_input_files
+            directory, then ask the user if they would like to proceed. If 'y', files will be processed and pushed to the specified Google BigQuery dataset.
             If 'n', program will exit.
     '''
 
@@ -579,17 +1333,20 @@ def run_DATA():
 
 
             # Initiate a Twarc client instance
-            client = Twarc2(bearer_token=bearer_token)
+            client = create_client(bearer_token)
 
 
             if type(query) == str:
                 print("Getting Tweet count estimate for your query. Please wait...\n")
-                archive_search_counts, readable_time_estimate = get_pre_search_counts(client, query, start_date, end_date)
+                archive_search_counts, readable_time_estimate, counts_buckets = get_pre_search_counts(client, query, start_date, end_date)
 
                 if archive_search_counts > 0:
                     interval, num_intervals = calculate_interval(start_date, end_date, archive_search_counts, schematype)
+                    windows = calculate_windows(start_date, end_date, counts_buckets)
+                    if windows is not None:
+                        num_intervals = len(windows)
                     # Print search results for user and ask to proceed
-                    user_proceed = get_user_confirmation_string_search(query, start_date, end_date, project, dataset, schematype, archive_search_counts, num_intervals)
+                    user_proceed = get_user_confirmation_string_search(query, start_date, end_date, project, dataset, schematype, archive_search_counts, num_intervals, readable_time_estimate)
 
                     if user_proceed == 'y':
                         sleep(1)
@@ -603,7 +1360,7 @@ def run_DATA():
                             # Get current datetime for calculating duration
                             search_start_time = datetime.now()
                             # to_collect, expected files tell the program what to collect and what has already been collected
-                            to_collect, not_to_collect, expected_files = set_up_expected_files(start_date, end_date, json_filepath, option_selection,  query, dataset, interval, query_count)
+                            to_collect, not_to_collect, expected_files = set_up_expected_files(start_date, end_date, json_filepath, option_selection,  query, dataset, interval, query_count, windows)
                             # Call function collect_archive_data()
                             collect_archive_data(bq, project, dataset, to_collect, not_to_collect, expected_files, client, query, start_date, end_date, csv_filepath, archive_search_counts, tweet_count, query, query_count, schematype)
                             # Notify user of completion
@@ -656,17 +1413,36 @@ def run_DATA():
                     else:
                         counts = [None]*len(query)
 
+                    # Optionally combine short queries into fewer searches; see query_packing.py
+                    if Collection.pack_queries:
+                        query_packs = plan_query_packs(query)
+                        # Queries that were not packed keep their counts; packed queries are counted again
+                        counts_by_query = dict(zip(query, counts))
+                        counts = [None if query_pack.is_packed() else counts_by_query[query_pack.query] for query_pack in query_packs]
+                    else:
+                        query_packs = [QueryPack([subquery]) for subquery in query]
+                    searches = [query_pack.query for query_pack in query_packs]
+
+                    # Place in the list of the first query of each search
+                    query_position = 0
                     try:
-                        for subquery, count in zip(query, counts):
+                        for query_pack, count in zip(query_packs, counts):
+                            subquery = query_pack.query
                             query_count = query_count + 1
+                            # Packed searches are saved under their own file names, distinct from single queries. A query
+                            # left unpacked keeps the file names it has without packing, numbered by its place in the list
+                            file_label = f'pack{query_count}' if query_pack.is_packed() else query_position + 1
+                            query_position = query_position + len(query_pack.subqueries)
                             # Get current datetime for calculating duration
                             search_start_time = datetime.now()
 
-                            if count == None:
+                            counts_buckets = None
+                            # Counts per bucket are needed to partition the search, even if total counts were run
+                            if count == None or Collection.partition_by_counts:
                                 # Pre-search archive counts
                                 logging.info('-----------------------------------------------------------------------------------------')
                                 logging.info(f'Getting tweet counts for query: {subquery}')
-                                archive_search_counts, readable_time_estimate = get_pre_search_counts(client, subquery, start_date, end_date)
+                                archive_search_counts, readable_time_estimate, counts_buckets = get_pre_search_counts(client, subquery, start_date, end_date)
                                 count = archive_search_counts
 
                             logging.info(f'Archive counts: {count}')
@@ -674,9 +1450,10 @@ def run_DATA():
                             if count > 0:
                                 # to_collect, expected files tell the program what to collect and what has already been collected
                                 interval, num_intervals = calculate_interval(start_date, end_date, count, schematype)
-                                to_collect, not_to_collect, expected_files = set_up_expected_files(start_date, end_date, json_filepath, option_selection, subquery, dataset, interval, query_count)
+                                windows = calculate_windows(start_date, end_date, counts_buckets)
+                                to_collect, not_to_collect, expected_files = set_up_expected_files(start_date, end_date, json_filepath, option_selection, subquery, dataset, interval, file_label, windows)
                                 # Call function collect_archive_data()
-                                collect_archive_data(bq, project, dataset, to_collect, not_to_collect, expected_files, client, subquery, start_date, end_date, csv_filepath, count, tweet_count, query, query_count, schematype)
+                                collect_archive_data(bq, project, dataset, to_collect, not_to_collect, expected_files, client, subquery, start_date, end_date, csv_filepath, count, tweet_count, searches, query_count, schematype, query_pack)
                                 # Notify user of completion
                                 notify_completion(bq, search_start_time, project, dataset, start_date, end_date, option_selection, count, subquery=subquery, interval=interval)
                             else:
@@ -731,22 +1508,38 @@ def run_DATA():
 
                 # Get current datetime for calculating duration
                 search_start_time = datetime.now()
+                stage_timers.reset(f'{cwd}/my_collections/{dataset}')
+
+                # Counted from each file's line index, to report progress
+                archive_search_counts = count_input_tweets(json_input_files)
+                if archive_search_counts > 0:
+                    logging.info(f'{archive_search_counts} tweets in {len(json_input_files)} json files')
+
+                if Collection.ingest_workers > 1 and len(json_input_files) > 1:
+                    # Several files at once, each in its own process; see bulk_ingest.py
+                    logging.info(f'Processing {len(json_input_files)} files using {Collection.ingest_workers} worker processes')
+                    tweet_count = ingest_json_files(json_input_files, csv_filepath, bq, project, dataset, query, start_date, end_date, archive_search_counts, tweet_count, schematype)
+                else:
+                    filecount = 1
 
-                filecount = 1
+                    for a_file in json_input_files:
+                        logging.info( '-----------------------------------------------------------------------------------------')
+                        logging.info(f'Processing file {a_file}')
+                        logging.info(f'File {filecount} of {len(json_input_files)}')
 
-                for a_file in json_input_files:
-                    logging.info( '-----------------------------------------------------------------------------------------')
-                    logging.info(f'Processing file {a_file}')
-                    logging.info(f'File {filecount} of {len(json_input_files)}')
+                        filecount = filecount + 1
 
-                    filecount = filecount + 1
+                        # For each interval (file), process json
+                        tweet_count, list_of_dataframes = process_json_data(a_file, csv_filepath, bq, project, dataset, query, start_date, end_date, archive_search_counts, tweet_count, schematype, test)
 
-                    # For each interval (file), process json
-                    tweet_count = process_json_data(a_file, csv_filepath, bq, project, dataset, query, start_date, end_date, archive_search_counts, tweet_count, schematype, test)
+                    # Report how processing scaled across the process pool, if one is in use
+                    if Collection.process_workers > 1:
+                        get_process_pool(Collection.process_workers).log_scaling_report()
 
+                write_run_report(dataset, schematype, input_files=json_input_files)
 
-                    # Notify user of completion
-                    notify_completion(bq, search_start_time, project, dataset, start_date, end_date, option_selection, archive_search_counts, subquery=query, interval=0)
+                # Notify user of completion, once every file is processed
+                notify_completion(bq, search_start_time, project, dataset, start_date, end_date, option_selection, archive_search_counts, subquery=query, interval=0)
 
             else:
                 exit()
@@ -780,7 +1573,7 @@ def run_DATA():
                 query, bearer_token, start_date, end_date, project, dataset, bq, schematype)
 
             # Initiate a Twarc client instance
-            client = Twarc2(bearer_token=bearer_token)
+            client = create_client(bearer_token)
 
             user_proceed = get_user_confirmation_batch_counts(query, start_date, end_date, project, dataset, schematype)
             if user_proceed == 'y':
@@ -815,9 +1608,9 @@ def run_DATA():
                         logging.info(
                             '-----------------------------------------------------------------------------------------')
                         logging.info(f'Getting tweet counts for query: {subquery}')
-                        archive_search_counts, readable_time_estimate = get_pre_search_counts(client,
-                                                                                              subquery,
-                                                                                              start_date, end_date)
+                        archive_search_counts, readable_time_estimate, counts_buckets = get_pre_search_counts(client,
+                                                                                                              subquery,
+                                                                                                              start_date, end_date)
 
                         logging.info(f'Archive counts: {archive_search_counts}')
 
@@ -825,11 +1618,13 @@ def run_DATA():
                             # to_collect, expected files tell the program what to collect and what has already been collected
                             interval, num_intervals = calculate_interval(start_date, end_date, archive_search_counts,
                                                                          schematype)
+                            windows = calculate_windows(start_date, end_date, counts_buckets)
                             to_collect, not_to_collect, expected_files = set_up_expected_files(start_date, end_date,
                                                                                                json_filepath,
                                                                                                option_selection,
                                                                                                subquery, dataset,
-                                                                                               interval, query_count)
+                                                                                               interval, query_count,
+                                                                                               windows)
 
                             # Call function collect_archive_data()
                             collect_archive_data(bq, project, dataset, to_collect, not_to_collect, expected_files, client, subquery, start_date, end_date, csv_filepath, archive_search_counts, tweet_count, query, query_count, schematype)
@@ -0,0 +1,231 @@
+'''
+Contains the line index of a json lines file: the byte offset at which each line starts, found with one scan for
+newlines over the memory-mapped file. The index is saved next to the file (<file>.lineidx.npz) and reused for as long as
+the file keeps the same size and modification time.
+
+With the index, the lines of a file can be counted without reading it, any range of lines can be read straight from its
+byte offsets (so several workers can each read a part of one file), and a file can be split into ranges of lines of
+about the same size in bytes. A final line cut short, e.g. by a collection that crashed while writing, is detected and
+left out of every range.
+
+Only uncompressed files can be indexed, as the lines of a compressed file have no fixed byte offsets.
+'''
+
+import os
+import io
+import json
+import mmap
+import logging
+
+import numpy as np
+
+from .raw_archive import get_file_compression
+
+
+index_suffix = '.lineidx.npz'
+
+# Bytes scanned for newlines at a time; bounds the memory used by the scan
+scan_block_bytes = 64 * 1024 * 1024
+
+# Lines of at most this many bytes (e.g. '\n' or '\r\n') hold no json object, and are skipped by readers
+blank_line_bytes = 2
+
+
+def can_index(a_file):
+    return get_file_compression(a_file) is None
+
+def scan_newlines(a_file):
+    '''
+    Returns the byte offset of every newline in a file, scanning the memory-mapped file one block at a time.
+    '''
+
+    size = os.path.getsize(a_file)
+    if size == 0:
+        return np.empty(0, dtype=np.int64)
+
+    newlines = []
+    with open(a_file, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            data = np.frombuffer(mapped, dtype=np.uint8)
+            for block_start in range(0, size, scan_block_bytes):
+                block = data[block_start:block_start + scan_block_bytes]
+                newlines.append(np.flatnonzero(block == ord('\n')).astype(np.int64) + block_start)
+            # The mapping cannot be closed while arrays still point into it
+            del data, block
+        finally:
+            mapped.close()
+
+    return np.concatenate(newlines)
+
+def is_complete_line(line):
+    try:
+        json.loads(line)
+    except ValueError:
+        return False
+    return True
+
+def read_final_line(a_file):
+    '''
+    Returns the bytes after the last newline of a file, reading back from its end (b'' if it ends with a newline).
+    '''
+
+    with open(a_file, 'rb') as f:
+        end = f.seek(0, io.SEEK_END)
+        position = end
+        tail = b''
+        while position > 0:
+            step = min(position, 64 * 1024)
+            position = position - step
+            f.seek(position)
+            tail = f.read(step) + tail
+            newline = tail.rfind(b'\n')
+            if newline >= 0:
+                return tail[newline + 1:]
+        return tail
+
+def has_truncated_final_line(a_file):
+    '''
+    True if an uncompressed json lines file ends in a line that is not complete json, without scanning the whole file.
+    '''
+
+    if not can_index(a_file) or not os.path.isfile(a_file):
+        return False
+    final_line = read_final_line(a_file)
+    return len(final_line.strip()) > 0 and not is_complete_line(final_line)
+
+def get_line_index(a_file):
+    '''
+    Returns the LineIndex of an uncompressed json lines file, from the file saved next to it if that is up to date,
+    otherwise by scanning the file (and saving the index). Raises ValueError for compressed files.
+    '''
+
+    if not can_index(a_file):
+        raise ValueError(f'Cannot index the lines of compressed file {a_file}')
+
+    stat = os.stat(a_file)
+    index_file = a_file + index_suffix
+    if os.path.isfile(index_file):
+        try:
+            with np.load(index_file) as saved:
+                if int(saved['size']) == stat.st_size and int(saved['mtime_ns']) == stat.st_mtime_ns:
+                    return LineIndex(a_file, saved['starts'], int(saved['truncated_bytes']))
+        except (OSError, ValueError, KeyError):
+            logging.info(f'Line index {index_file} could not be read; rebuilding it')
+
+    line_index = LineIndex.build(a_file)
+    line_index.save(stat.st_size, stat.st_mtime_ns)
+
+    return line_index
+
+
+class LineIndex:
+
+    def __init__(self, a_file, starts, truncated_bytes=0):
+        '''
+        The line index of a_file. starts holds the byte offset of the start of each complete line, followed by the
+        offset of the end of the last one; truncated_bytes is the length of an incomplete final line, if any.
+        '''
+
+        self.a_file = a_file
+        self.starts = starts
+        self.truncated_bytes = truncated_bytes
+        self.line_count = len(starts) - 1
+        # Lines holding a json object; for each line, the number of them before it
+        lengths = np.diff(starts)
+        self.rows_before_line = np.concatenate([[0], np.cumsum(lengths > blank_line_bytes)])
+        self.tweet_count = int(self.rows_before_line[-1])
+
+    @classmethod
+    def build(cls, a_file):
+        '''
+        Indexes a file with one scan for newlines. A final line without a newline counts as a line if it is complete
+        json, and is otherwise recorded as truncated.
+        '''
+
+        newlines = scan_newlines(a_file)
+        starts = np.concatenate([np.zeros(1, dtype=np.int64), newlines + 1])
+        size = os.path.getsize(a_file)
+
+        truncated_bytes = 0
+        if starts[-1] < size:
+            final_line = read_final_line(a_file)
+            if len(final_line.strip()) == 0:
+                starts = np.append(starts, size)
+            elif is_complete_line(final_line):
+                starts = np.append(starts, size)
+            else:
+                truncated_bytes = size - int(starts[-1])
+                logging.warning(f'{a_file} ends with an incomplete line of {truncated_bytes} bytes, which will be skipped')
+
+        return cls(a_file, starts, truncated_bytes)
+
+    @property
+    def truncated(self):
+        return self.truncated_bytes > 0
+
+    def save(self, size, mtime_ns):
+        index_file = self.a_file + index_suffix
+        # np.savez adds .npz to file names without it
+        temp_file = f'{self.a_file}.lineidx.tmp.npz'
+        try:
+            np.savez(temp_file, starts=self.starts, truncated_bytes=self.truncated_bytes, size=size, mtime_ns=mtime_ns)
+            os.replace(temp_file, index_file)
+        except OSError as error:
+            # E.g. a read-only input directory; the index is rebuilt next time
+            logging.info(f'Could not save line index {index_file}: {error}')
+
+    def byte_range(self, start_line, stop_line):
+        return int(self.starts[start_line]), int(self.starts[stop_line])
+
+    def read_lines(self, start_line, stop_line):
+        '''
+        Returns the bytes of lines start_line to stop_line (exclusive), read straight from their offsets.
+        '''
+
+        start, stop = self.byte_range(start_line, stop_line)
+        with open(self.a_file, 'rb') as f:
+            f.seek(start)
+            return f.read(stop - start)
+
+    def iter_lines(self, start_line, stop_line):
+        '''
+        Yields lines start_line to stop_line (exclusive) as text, each with its newline, reading about scan_block_bytes
+        of the file at a time.
+        '''
+
+        while start_line < stop_line:
+            block_stop = int(np.searchsorted(self.starts, self.starts[start_line] + scan_block_bytes, side='right')) - 1
+            block_stop = min(max(block_stop, start_line + 1), stop_line)
+            lines = self.read_lines(start_line, block_stop).decode('utf-8').split('\n')
+            # The block ends with a newline, leaving an empty string after the last line
+            for line in lines[:-1]:
+                yield line + '\n'
+            if len(lines[-1]) > 0:
+                yield lines[-1]
+            start_line = block_stop
+
+    def split(self, parts):
+        '''
+        Splits the file's lines into up to 'parts' consecutive ranges, (start_line, stop_line), of about the same size
+        in bytes.
+        '''
+
+        if self.line_count == 0:
+            return []
+        total_bytes = self.starts[-1] - self.starts[0]
+        targets = self.starts[0] + total_bytes * np.arange(1, parts) / parts
+        boundaries = np.searchsorted(self.starts, targets)
+        boundaries = np.unique(np.concatenate([[0], boundaries, [self.line_count]]))
+
+        return [(int(start), int(stop)) for start, stop in zip(boundaries[:-1], boundaries[1:])]
+
+    def iter_line_chunks(self, start_line, stop_line, chunksize):
+        '''
+        Yields (first_row, data) for each chunksize lines of the range start_line to stop_line: the bytes of those
+        lines, and the number of json lines before them in the file (the index pd.read_json() would give the first).
+        '''
+
+        for chunk_start in range(start_line, stop_line, chunksize):
+            chunk_stop = min(chunk_start + chunksize, stop_line)
+            yield int(self.rows_before_line[chunk_start]), self.read_lines(chunk_start, chunk_stop)
@@ -0,0 +1,197 @@
+'''
+Contains the collection manifest: a record of every interval (window) collected for a dataset, saved to
+my_collections/<dataset>/collected_json/collection_manifest.json. The manifest is updated after every page of results,
+so an interrupted collection can resume each window from its last page, and completed windows are never collected twice.
+
+A window is only complete once its tweets are uploaded. A window whose file was collected, but not yet uploaded when
+the collection was interrupted, is processed and uploaded from that file again rather than collected again.
+Windows streamed straight into processing (stream_processing in config.yml) record each chunk uploaded, so that a window
+collected again after an interruption skips the chunks already uploaded.
+'''
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+
+manifest_filename = 'collection_manifest.json'
+
+
+class CollectionManifest:
+
+    def __init__(self, json_filepath):
+        '''
+        Loads the manifest in json_filepath (the collected_json directory), or starts a new one. Windows are keyed by
+        file name. Thread safe, so one manifest can be shared by concurrent collection workers.
+        '''
+
+        self.manifest_file = os.path.join(json_filepath, manifest_filename)
+        self.lock = threading.Lock()
+
+        if os.path.isfile(self.manifest_file):
+            with open(self.manifest_file, encoding='utf-8') as f:
+                self.windows = json.load(f)['windows']
+        else:
+            self.windows = dict()
+
+    def get_window(self, a_file):
+        return self.windows.get(os.path.basename(a_file))
+
+    def is_complete(self, a_file):
+        window = self.get_window(a_file)
+        return window is not None and window['complete']
+
+    def is_collected(self, a_file):
+        '''
+        True if every page of a window has been written to its file, whether or not its tweets have been uploaded.
+        '''
+
+        window = self.get_window(a_file)
+        return window is not None and (window['complete'] or window.get('collected', False))
+
+    def resume_window(self, a_file, query, start, end):
+        '''
+        Decides where to (re)start collecting a window. If the manifest holds a next_token for an incomplete,
+        uncompressed window, the file is truncated to its size after the last recorded page (dropping anything written
+        after it) and that token is returned. Otherwise any partial file is removed and the window starts from scratch
+        (returns None).
+        '''
+
+        window = self.get_window(a_file)
+        if window is not None and window['next_token'] is not None and window['bytes'] is not None \
+                and os.path.isfile(a_file) and os.path.getsize(a_file) >= window['bytes']:
+            os.truncate(a_file, window['bytes'])
+            logging.info(f"Resuming {a_file} from page {window['pages'] + 1} ({window['tweet_count']} tweets already collected)")
+            return window['next_token']
+
+        self.restart_window(a_file, query, start, end)
+
+        return None
+
+    def restart_window(self, a_file, query, start, end, uploaded_chunks=()):
+        '''
+        Removes any partial file for a window and records the window as started from scratch, with the chunks of it
+        already uploaded, if streamed.
+        '''
+
+        if os.path.isfile(a_file):
+            logging.info(f'Restarting partially collected file {a_file}')
+            os.remove(a_file)
+        self.start_window(a_file, query, start, end, uploaded_chunks)
+
+    def start_window(self, a_file, query, start, end, uploaded_chunks=()):
+        '''
+        Records a window as started (or restarted from scratch).
+        '''
+
+        with self.lock:
+            self.windows[os.path.basename(a_file)] = {'query': query,
+                                                      'start': str(start),
+                                                      'end': str(end),
+                                                      'next_token': None,
+                                                      'pages': 0,
+                                                      'tweet_count': 0,
+                                                      'bytes': 0,
+                                                      'complete': False,
+                                                      'uploaded_chunks': [list(chunk) for chunk in uploaded_chunks],
+                                                      'updated': str(datetime.now())}
+            self.save()
+
+    def record_page(self, a_file, next_token, tweets, file_bytes):
+        '''
+        Records a page once it is written: the token for the next page, the running tweet count, and the size of the
+        file after the page (None for compressed files, which cannot be resumed part-way through).
+        '''
+
+        with self.lock:
+            window = self.windows[os.path.basename(a_file)]
+            window['next_token'] = next_token
+            window['pages'] = window['pages'] + 1
+            window['tweet_count'] = window['tweet_count'] + tweets
+            window['bytes'] = file_bytes
+            window['updated'] = str(datetime.now())
+            self.save()
+
+    def get_uploaded_chunks(self, a_file):
+        '''
+        Returns the streamed chunks of a window uploaded so far, as [tweets, last_tweet_id] pairs, in order.
+        '''
+
+        window = self.get_window(a_file)
+        if window is None:
+            return []
+        return [list(chunk) for chunk in window.get('uploaded_chunks', [])]
+
+    def record_uploaded_chunk(self, a_file, tweets, last_tweet_id):
+        '''
+        Records a streamed chunk of a window as uploaded: the number of tweets in it, and the id of its last tweet.
+        '''
+
+        with self.lock:
+            window = self.windows[os.path.basename(a_file)]
+            window.setdefault('uploaded_chunks', []).append([tweets, last_tweet_id])
+            window['updated'] = str(datetime.now())
+            self.save()
+
+    def set_uploaded_chunks(self, a_file, uploaded_chunks):
+        with self.lock:
+            window = self.windows[os.path.basename(a_file)]
+            window['uploaded_chunks'] = [list(chunk) for chunk in uploaded_chunks]
+            window['updated'] = str(datetime.now())
+            self.save()
+
+    def record_collected(self, a_file):
+        '''
+        Records every page of a window as written to its file. The window is completed once its tweets are uploaded.
+        '''
+
+        with self.lock:
+            window = self.windows[os.path.basename(a_file)]
+            window['next_token'] = None
+            window['collected'] = True
+            window['updated'] = str(datetime.now())
+            self.save()
+
+    def complete_window(self, a_file):
+        with self.lock:
+            window = self.windows[os.path.basename(a_file)]
+            window['next_token'] = None
+            window['complete'] = True
+            window['updated'] = str(datetime.now())
+            self.save()
+
+    def save(self):
+        '''
+        Writes the manifest to a temporary file, then replaces the old manifest, so a crash never leaves it half-written.
+        '''
+
+        temp_file = self.manifest_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump({'windows': self.windows}, f, indent=1)
+        os.replace(temp_file, self.manifest_file)
+
+
+class StreamProgress:
+
+    def __init__(self, manifest, a_file, tweets, last_tweet_id, complete):
+        '''
+        Follows a chunk streamed from a window (see collect_interval_chunks() in data.py) through processing to upload,
+        as an item of its own behind the chunk. record() is called once the chunk is uploaded: it records the chunk as
+        uploaded, and completes the window after its last chunk. A window with no tweets (left) to upload, or whose
+        tweets are read back from its file (see process_in_pipeline()), has a single StreamProgress with no tweets, after
+        its last chunk.
+        '''
+
+        self.manifest = manifest
+        self.a_file = a_file
+        self.tweets = tweets
+        self.last_tweet_id = last_tweet_id
+        self.complete = complete
+
+    def record(self):
+        if self.tweets > 0:
+            self.manifest.record_uploaded_chunk(self.a_file, self.tweets, self.last_tweet_id)
+        if self.complete:
+            self.manifest.complete_window(self.a_file)
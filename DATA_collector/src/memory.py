@@ -0,0 +1,215 @@
+'''
+Contains the memory measurements and the adaptive chunk sizing used when max_chunk_mb is set in config.yml.
+
+Rather than a fixed number of lines, each chunk read from a json file holds as many lines as are expected to fit in the
+memory budget, going by the bytes of json in each line and the memory used per byte of json when processing the
+previous chunk. Chunks of heavy tweets (long texts, many entities, large includes) therefore hold fewer tweets, and
+several collections or workers can share one machine without any of them running out of memory.
+
+Resident memory is read with psutil if it is installed, otherwise from /proc (Linux). Where neither is available,
+chunks are sized from their bytes of json alone, with a conservative estimate of the memory used per byte.
+'''
+
+import os
+import sys
+import logging
+import threading
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+megabyte = 1024 * 1024
+
+# Memory used per byte of json, as measured when processing 2,000 - 20,000 tweets; used until a chunk is measured
+default_memory_per_json_byte = 16.0
+
+# Chunks hold at least this many tweets (unless the file has fewer), whatever their size
+min_chunk_rows = 500
+
+# Changes in chunk size smaller than this fraction are not logged
+resize_log_fraction = 0.1
+
+# Seconds between samples of resident memory, where the kernel's peak cannot be reset
+sample_seconds = 0.05
+
+# Measurements started but not yet stopped, in any thread. The kernel's peak is for the whole process, so it is only
+# reset when no other measurement is active, as resetting it would lose the peak of the others
+active_measurements = 0
+active_measurements_lock = threading.Lock()
+
+
+def current_rss():
+    '''
+    Returns the resident memory of this process in bytes, or None if it cannot be read.
+    '''
+
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def reset_peak_rss():
+    '''
+    Resets the kernel's record of the peak resident memory of this process (Linux only). Returns True if it was reset.
+    '''
+
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return read_peak_rss() is not None
+
+def read_peak_rss():
+    '''
+    Returns the peak resident memory of this process in bytes since it was last reset (Linux only), or None.
+    '''
+
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class PeakMemory:
+
+    def __init__(self):
+        '''
+        Measures the memory used by this process between start() and stop(): the peak resident memory over that time,
+        less the resident memory at start(). The peak is read from the kernel where it can be reset (Linux), if no other
+        measurement is active; otherwise resident memory is sampled every sample_seconds in a background thread.
+        Measurements may overlap, in one thread or several.
+        '''
+
+        self.baseline = None
+        self.peak = None
+        self.sampler = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        global active_measurements
+        self.baseline = current_rss()
+        self.peak = self.baseline
+        if self.baseline is None:
+            return self
+        with active_measurements_lock:
+            active_measurements = active_measurements + 1
+            if active_measurements == 1 and reset_peak_rss():
+                return self
+        self.stopping.clear()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        return self
+
+    def sample(self):
+        while not self.stopping.wait(sample_seconds):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self):
+        '''
+        Stops measuring; returns the memory used in bytes, or None if memory cannot be measured.
+        '''
+
+        global active_measurements
+        if self.baseline is None:
+            return None
+        if self.sampler is not None:
+            self.stopping.set()
+            self.sampler.join()
+            self.sampler = None
+            self.peak = max(self.peak, current_rss())
+        else:
+            self.peak = max(self.peak, read_peak_rss() or 0)
+        # Only once the peak is read, as a measurement started after this one may reset it
+        with active_measurements_lock:
+            active_measurements = active_measurements - 1
+
+        return max(self.peak - self.baseline, 0)
+
+
+class AdaptiveChunkSizer:
+
+    def __init__(self, max_chunk_mb, max_rows):
+        '''
+        Splits the lines of json files into chunks expected to use up to max_chunk_mb of memory when processed, and of
+        at most max_rows lines (the fixed chunksize for the schematype). The memory used per byte of json is updated
+        with record() as each chunk is processed.
+        '''
+
+        self.budget_bytes = max_chunk_mb * megabyte
+        self.max_rows = max_rows
+        self.min_rows = min(min_chunk_rows, max_rows)
+        self.memory_per_json_byte = default_memory_per_json_byte
+        # Lines holding a json object, and their bytes, over every chunk split so far
+        self.rows = 0
+        self.json_bytes = 0
+
+    def json_byte_limit(self):
+        return self.budget_bytes / self.memory_per_json_byte
+
+    def split(self, lines):
+        '''
+        Yields lists of lines, each ending once its bytes of json reach json_byte_limit(), or it holds max_rows lines.
+        Blank lines count towards max_rows, as they do for a fixed chunksize, but hold no json.
+        '''
+
+        chunk = []
+        chunk_bytes = 0
+        limit = self.json_byte_limit()
+        for line in lines:
+            chunk.append(line)
+            # Collected json is ascii, so characters are bytes
+            line_bytes = len(line.strip())
+            if line_bytes > 0:
+                chunk_bytes = chunk_bytes + line_bytes
+                self.rows = self.rows + 1
+                self.json_bytes = self.json_bytes + line_bytes
+            if len(chunk) >= self.max_rows or (chunk_bytes >= limit and len(chunk) >= self.min_rows):
+                yield chunk
+                chunk = []
+                chunk_bytes = 0
+                limit = self.json_byte_limit()
+        if len(chunk) > 0:
+            yield chunk
+
+    def record(self, rows, memory_used):
+        '''
+        Updates the memory used per byte of json from a processed chunk of 'rows' tweets that used memory_used bytes
+        (None if it could not be measured), going by the average bytes of json per tweet split so far.
+        '''
+
+        if memory_used is None or memory_used <= 0 or rows == 0 or self.rows == 0:
+            return
+        previous_rows = self.rows_per_chunk()
+        measured = memory_used / (rows * self.json_bytes / self.rows)
+        # Memory freed by earlier chunks and reused unseen can make a chunk look lighter than it is, so chunks shrink
+        # as soon as they are measured heavier, but grow halfway at a time
+        if measured < self.memory_per_json_byte:
+            measured = (measured + self.memory_per_json_byte) / 2
+        self.memory_per_json_byte = measured
+        next_rows = self.rows_per_chunk()
+        if abs(next_rows - previous_rows) >= resize_log_fraction * previous_rows:
+            logging.info(f'Chunk of {rows} tweets used {round(memory_used / megabyte)} MB; resizing chunks from about '
+                         f'{previous_rows} to {next_rows} tweets to fit max_chunk_mb ({round(self.budget_bytes / megabyte)} MB)')
+
+    def rows_per_chunk(self):
+        '''
+        The number of average-sized tweets expected in the next chunk.
+        '''
+
+        if self.rows == 0:
+            return self.max_rows
+        rows = int(self.json_byte_limit() / (self.json_bytes / self.rows))
+        return min(max(rows, self.min_rows), self.max_rows)
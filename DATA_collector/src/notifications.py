@@ -44,7 +44,7 @@ def print_welcome_screen():
 
     return option_selection
 
-def get_user_confirmation_string_search(query, start_date, end_date, project, dataset, schematype, archive_search_counts, num_intervals):
+def get_user_confirmation_string_search(query, start_date, end_date, project, dataset, schematype, archive_search_counts, num_intervals, readable_time_estimate):
     print(f"""
     \n
     Please check the below details carefully, and ensure you have enough room in your academic project bearer token quota!
@@ -57,6 +57,7 @@ def get_user_confirmation_string_search(query, start_date, end_date, project, da
     \n
     Your archive search will collect approximately {archive_search_counts} tweets (upper estimate).
     The collection will be distributed across approximately {num_intervals} json files.
+    Estimated time to collect, process and upload: {readable_time_estimate}.
     \n
     ** Remember to monitor the space on your hard drive! **
     \n 
@@ -168,7 +169,7 @@ def print_already_collected(dataset, not_to_collect):
 
     print(f"""
 \n
-It looks like you have already collected, or partially collected, these data. 
+It looks like you have already collected these data. 
 Please check your DATA_collector/{dataset}/collected_json directory for the following files:
 """)
 
@@ -179,7 +180,7 @@ Please check your DATA_collector/{dataset}/collected_json directory for the foll
         """)
 
     print(f"""
-Either modify your search or remove {th}.
+Either modify your search, or remove {th} and collection_manifest.json from that directory.
 
 Exiting...
     """)
\ No newline at end of file
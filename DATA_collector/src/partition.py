@@ -0,0 +1,86 @@
+'''
+Contains functions for partitioning a search into collection windows of roughly equal tweet volume, using the per-bucket
+(day or hour) counts returned by the Twarc counts_all endpoint.
+'''
+
+import datetime as dt
+
+
+def parse_counts_buckets(counts_pages):
+    '''
+    Converts the 'data' of each counts_all page into a sorted list of (start, end, tweet_count) tuples.
+    '''
+
+    counts_buckets = []
+    for page in counts_pages:
+        for bucket in page.get('data', []):
+            counts_buckets.append((parse_api_datetime(bucket['start']),
+                                   parse_api_datetime(bucket['end']),
+                                   bucket['tweet_count']))
+
+    return sorted(counts_buckets)
+
+def parse_api_datetime(timestamp):
+    '''
+    Parses a Twitter API timestamp, e.g. '2022-11-22T00:00:00.000Z', to a timezone-aware datetime.
+    '''
+
+    return dt.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+def partition_by_counts(counts_buckets, start_date, end_date, tweets_per_window):
+    '''
+    Cuts the period from start_date to end_date into consecutive windows holding roughly tweets_per_window tweets each.
+    Windows close part-way through a bucket when needed, assuming tweets are spread evenly within that bucket; a single
+    busy day or hour can therefore be split across several windows (of at least a second each), and quiet periods are
+    merged into one. Returns a list of (window_start, window_end) tuples covering the whole period.
+    '''
+
+    if tweets_per_window <= 0:
+        raise ValueError(f'tweets_per_window must be more than 0, not {tweets_per_window}')
+
+    windows = []
+    window_start = start_date
+    window_tweets = 0
+
+    for bucket_start, bucket_end, tweet_count in counts_buckets:
+        # Only count the part of each bucket inside the search period, and not yet in a window
+        bucket_start = max(bucket_start, start_date, window_start)
+        bucket_end = min(bucket_end, end_date)
+        if bucket_end <= bucket_start or tweet_count <= 0:
+            continue
+
+        while window_tweets + tweet_count > tweets_per_window:
+            # Close the window part-way through this bucket, once it holds tweets_per_window tweets
+            needed = tweets_per_window - window_tweets
+            cut = round_to_second(bucket_start + (bucket_end - bucket_start) * (needed / tweet_count))
+            # A window already full closes where this bucket starts; otherwise windows last at least a second
+            cut = max(cut, bucket_start)
+            if cut <= window_start:
+                cut = window_start + dt.timedelta(seconds=1)
+            if cut >= bucket_end:
+                # The rest of the bucket fills the window, which closes where the bucket ends
+                windows.append((window_start, bucket_end))
+                window_start = bucket_end
+                tweet_count = 0
+                window_tweets = 0
+                break
+            windows.append((window_start, cut))
+            # The tweets before the cut, spread evenly over the bucket, went into the closed window
+            tweet_count = tweet_count * (bucket_end - cut) / (bucket_end - bucket_start)
+            bucket_start = cut
+            window_start = cut
+            window_tweets = 0
+
+        window_tweets = window_tweets + tweet_count
+
+    if window_start < end_date or len(windows) == 0:
+        windows.append((window_start, end_date))
+
+    return windows
+
+def round_to_second(date):
+    '''
+    Rounds a datetime to the nearest whole second, to keep window boundaries (and file names) tidy.
+    '''
+
+    return (date + dt.timedelta(microseconds=500000)).replace(microsecond=0)
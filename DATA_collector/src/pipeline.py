@@ -0,0 +1,111 @@
+'''
+Contains a producer/consumer pipeline that overlaps collection, processing and upload. Collection of the next file
+continues while the previous file is flattened in a separate stage, and flattened chunks are uploaded as they arrive.
+Stages are connected by bounded queues, so memory use stays flat however far ahead collection gets.
+'''
+
+import logging
+import queue
+import threading
+
+
+# Put on a queue by a stage when it has no more output
+STAGE_DONE = object()
+
+
+class PipelineStage(threading.Thread):
+
+    def __init__(self, name, items, work, outbox, failed):
+        '''
+        Runs work(item) for each item (an iterable, or a queue fed by the previous stage) in its own thread, putting
+        every result work() yields on the outbox queue.
+        '''
+
+        super().__init__(name=name, daemon=True)
+        self.items = items
+        self.work = work
+        self.outbox = outbox
+        self.failed = failed
+        self.error = None
+
+    def run(self):
+        try:
+            for item in self.get_items():
+                for result in self.work(item):
+                    if not self.put(result):
+                        return
+        except BaseException as error:
+            logging.info(f'Pipeline stage "{self.name}" failed: {repr(error)}')
+            self.error = error
+            self.failed.set()
+        finally:
+            if hasattr(self.items, 'close'):
+                self.items.close()
+            self.put(STAGE_DONE)
+
+    def get_items(self):
+        if isinstance(self.items, queue.Queue):
+            return iterate_queue(self.items, self.failed)
+        return self.items
+
+    def put(self, item):
+        '''
+        Puts item on the outbox, waiting while the queue is full. Returns False if another stage has failed.
+        '''
+
+        while not self.failed.is_set():
+            try:
+                self.outbox.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+def iterate_queue(inbox, failed):
+    '''
+    Yields items from a stage's inbox until the previous stage is done, or until any stage fails.
+    '''
+
+    while not failed.is_set():
+        try:
+            item = inbox.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if item is STAGE_DONE:
+            return
+        yield item
+
+
+def run_pipeline(collected_files, process_file, upload, queue_size=2):
+    '''
+    Runs collection, processing and upload as three overlapping stages:
+        - collected_files is a generator that yields each collected file; it is consumed in a collection thread
+        - process_file(a_file) yields the processed chunks of a file; it runs in a processing thread
+        - upload(chunk) is called in the calling thread for each processed chunk, in order
+    Queues between stages hold at most queue_size items. If any stage raises an exception, all stages stop and the
+    exception is re-raised here.
+    '''
+
+    failed = threading.Event()
+    file_queue = queue.Queue(maxsize=queue_size)
+    chunk_queue = queue.Queue(maxsize=queue_size)
+
+    stages = [PipelineStage('collect', collected_files, lambda a_file: [a_file], file_queue, failed),
+              PipelineStage('process', file_queue, process_file, chunk_queue, failed)]
+    for stage in stages:
+        stage.start()
+
+    try:
+        for chunk in iterate_queue(chunk_queue, failed):
+            upload(chunk)
+    except BaseException:
+        failed.set()
+        raise
+
+    # Stages are daemon threads; on failure, do not wait for a stage that is part-way through a file
+    for stage in stages:
+        if stage.error is not None:
+            raise stage.error
+    for stage in stages:
+        stage.join()
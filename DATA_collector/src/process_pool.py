@@ -0,0 +1,152 @@
+'''
+Contains the process pool used when process_workers is more than 1 in config.yml. Chunks of tweets, read from a json
+file or streamed from collection, are flattened by ProcessTweets and ProcessTables in separate worker processes, so
+several chunks are processed at once on machines with several cores. Results are returned in the order the chunks were
+read, so tables are written and uploaded in the same order as when processing on one core.
+
+The pool records the time its workers spend processing and the time it is in use, and reports its scaling efficiency:
+the speed-up over processing the same chunks on one core, relative to the number of workers.
+'''
+
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .memory import PeakMemory
+from .stage_timers import stage_timers
+
+
+# One pool per process, started on first use and kept for every file processed
+process_pool = None
+process_pool_lock = threading.Lock()
+
+
+def timed_call(work, item, measure_memory=False):
+    '''
+    Runs work(item) in a worker process; returns the result, the CPU seconds it took, the memory it used in bytes if
+    measure_memory (otherwise None), and the stage timings it recorded. CPU time, rather than elapsed time, excludes
+    time the worker waits for a core when there are more workers than cores.
+    '''
+
+    peak_memory = PeakMemory().start() if measure_memory else None
+    start = time.process_time()
+    result = work(item)
+    seconds = time.process_time() - start
+    memory_used = peak_memory.stop() if peak_memory is not None else None
+    return result, seconds, memory_used, stage_timers.take_chunks()
+
+def get_process_pool(workers):
+    '''
+    Returns the process pool, starting it with the given number of workers on first use.
+    '''
+
+    global process_pool
+    with process_pool_lock:
+        if process_pool is None:
+            process_pool = ChunkProcessPool(workers)
+        return process_pool
+
+@atexit.register
+def close_process_pool():
+    if process_pool is not None:
+        process_pool.close()
+
+
+class ChunkProcessPool:
+
+    def __init__(self, workers):
+        '''
+        A pool of worker processes for processing chunks of tweets. Workers are started with 'spawn', as they are on
+        Windows, so they do not inherit the threads of collection workers or pipeline stages; each one imports src once,
+        then processes any number of chunks.
+        '''
+
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''
+        Clears the chunks, tweets and seconds recorded for the scaling report.
+        '''
+
+        with self.lock:
+            self.chunks = 0
+            self.tweets = 0
+            # CPU seconds spent processing chunks, summed over the workers
+            self.busy_seconds = 0.0
+            # Seconds from the first chunk submitted to the last result returned, in each call to map()
+            self.elapsed_seconds = 0.0
+
+    def map(self, work, items, measure_memory=False):
+        '''
+        Runs work(chunk) in the worker processes for each (chunk, context) pair of items, and yields (result, context,
+        seconds, memory_used) in the order of items: seconds is the time spent waiting for that result, and memory_used
+        the memory the worker used to produce it, if measure_memory (otherwise None). Up to two chunks per worker are
+        submitted ahead of the result being waited for, which keeps every worker busy while bounding memory use.
+        Items whose chunk is None are not submitted, but yielded in their place as (None, context, 0, None).
+        '''
+
+        pending = deque()
+        items = iter(items)
+        exhausted = False
+        start = time.perf_counter()
+        try:
+            while True:
+                while not exhausted and len(pending) < 2 * self.workers:
+                    item = next(items, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    chunk, context = item
+                    if chunk is None:
+                        pending.append((None, 0, context))
+                        continue
+                    pending.append((self.executor.submit(timed_call, work, chunk, measure_memory), len(chunk), context))
+                if len(pending) == 0:
+                    break
+
+                future, tweets, context = pending.popleft()
+                if future is None:
+                    yield None, context, 0, None
+                    continue
+                wait_start = time.perf_counter()
+                result, seconds, memory_used, stage_chunks = future.result()
+                stage_timers.add_chunks(stage_chunks)
+                wait_seconds = time.perf_counter() - wait_start
+                with self.lock:
+                    self.chunks = self.chunks + 1
+                    self.tweets = self.tweets + tweets
+                    self.busy_seconds = self.busy_seconds + seconds
+                yield result, context, wait_seconds, memory_used
+        finally:
+            for future, tweets, context in pending:
+                if future is not None:
+                    future.cancel()
+            with self.lock:
+                self.elapsed_seconds = self.elapsed_seconds + time.perf_counter() - start
+
+    def log_scaling_report(self):
+        '''
+        Logs the chunks processed since the last reset, and how well processing scaled across the workers: the speed-up
+        is the workers' CPU time over the time the pool was in use (about the time the same chunks take on one core),
+        and the efficiency is the speed-up per worker. Time spent reading chunks, and writing and uploading results,
+        while workers wait for chunks, lowers both; so do fewer cores than workers.
+        '''
+
+        with self.lock:
+            if self.chunks == 0 or self.elapsed_seconds == 0:
+                return
+            speed_up = self.busy_seconds / self.elapsed_seconds
+            efficiency = speed_up / self.workers
+            logging.info(f'Process pool: {self.chunks} chunks ({self.tweets} tweets) on {self.workers} workers; '
+                         f'{round(self.busy_seconds, 1)} CPU seconds of processing in {round(self.elapsed_seconds, 1)} seconds')
+            logging.info(f'Process pool scaling: {round(speed_up, 2)}x speed-up, {round(efficiency * 100)}% efficiency')
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
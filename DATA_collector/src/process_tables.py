@@ -3,11 +3,15 @@ Contains all functions relating to the separate processing of the nested columns
 becomes its own flattened table and is linked to the main TWEETS table on tweet_id, author_id or poll_id
 '''
 
+import itertools
+
 import pandas as pd
 import numpy as np
 
+from .config import Collection
 from .fields import DATA_fields, TCAT_fields, TweetQuery_fields, TWEET_fields
 from .set_up_directories import *
+from .stage_timers import timed_stage
 
 pd.options.mode.chained_assignment = None
 
@@ -15,9 +19,43 @@ import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 warnings.simplefilter(action='ignore', category=pd.errors.PerformanceWarning)
 
+# Nested columns holding one object per tweet, merged into the main Tweet table
+one_to_one_nested_cols = ['entities',
+                          'public_metrics',
+                          'author',
+                          'in_reply_to_user',
+                          'attachments',
+                          'geo',
+                          '__twarc']
+
+
+def explode_list_column(frame, key, column):
+    '''
+    Un-nests a column of lists: returns a dataframe with one row per list element, holding the key of the row it came
+    from (column key) and the element (column 0), in row order then list order. Missing elements are dropped.
+    This gives the same result as frame.set_index([key])[column].apply(pd.Series).stack().reset_index(), but works on
+    one flat array of elements with offsets, rather than building a Series for every row.
+    '''
+
+    values = [value if isinstance(value, (list, tuple, np.ndarray)) else
+              list(value.values()) if isinstance(value, dict) else [value]
+              for value in frame[column]]
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+
+    elements = np.empty(lengths.sum(), dtype=object)
+    elements[:] = list(itertools.chain.from_iterable(values))
+    keys = np.repeat(frame[key].to_numpy(), lengths)
+
+    # As stack() does, drop missing elements
+    present = ~pd.isna(elements)
+    exploded = pd.DataFrame({key: keys[present], 0: elements[present]})
+
+    return exploded
+
 
 class ProcessTweets:
 
+    @timed_stage('flatten_top_tweet_level')
     def flatten_top_tweet_level(self, tweets):
         '''
         Flattens main Tweet table after moving nested columns from dataframe. Gives a reference_level value of '0' to each record.
@@ -28,13 +66,7 @@ class ProcessTweets:
         logging.info('Flattening one-to-one nested columns...')
 
         # List of nested columns
-        nested_cols_list = ['entities',
-                            'public_metrics',
-                            'author',
-                            'in_reply_to_user',
-                            'attachments',
-                            'geo',
-                            '__twarc']
+        nested_cols_list = one_to_one_nested_cols
 
         # Create empty list to hold flattened one-to-one auxiliary dataframes for merging with main tweet dataframe
         aux_df_list = []
@@ -72,85 +104,83 @@ class ProcessTweets:
 
         return tweets_flat
 
-    def unpack_referenced_tweets(self, reference_levels_list):
+    @timed_stage('unpack_referenced_tweets')
+    def unpack_referenced_tweets(self, reference_levels_list, max_depth=None):
         '''
-        Unpacks referenced tweet data from the 'referenced_tweets' column of tweets_flat. Un-nests each set of referenced
-        tweets, appends to reference_levels_list and checks for the 'referenced_tweets' column in that 'level'.
-        Repeats this process until there are no more levels containing the 'referenced_tweets' column.
+        Unpacks referenced tweet data from the 'referenced_tweets' column of tweets_flat, one level at a time. The
+        'referenced_tweets' of the last level are exploded into an edge list (referencing tweet_id, referenced tweet),
+        and the referenced tweets are flattened into the next level, which is appended to reference_levels_list. Repeats
+        until a level has no 'referenced_tweets' column, or max_depth levels are unpacked (max_reference_depth in
+        config.yml; 0 for no limit). Tweets referenced below max_depth are not unpacked, but the ids and types of the
+        references of the last level are still merged into it, as move_referenced_tweet_data_up() does for the levels
+        above, without adding a level of rows.
         '''
 
+        # Imported here, as columnar.py imports this module
+        from .columnar import normalize_records
+
+        if max_depth is None:
+            max_depth = Collection.max_reference_depth
+
         logging.info('Extracting referenced tweets...')
 
-        for level in reference_levels_list:
-            if 'referenced_tweets' in level.columns:
-                refd_tweets = level[['tweet_id', 'referenced_tweets']] \
+        level = reference_levels_list[-1]
+        while 'referenced_tweets' in level.columns:
+            if max_depth and len(reference_levels_list) > max_depth:
+                referencing = level['referenced_tweets'].notna().sum()
+                logging.info(f'Not unpacking tweets referenced by {referencing} tweets at reference level '
+                             f'{len(reference_levels_list) - 1}, as max_reference_depth is {max_depth}')
+                edges = level[['tweet_id', 'referenced_tweets']] \
                     .dropna() \
-                    .set_index(['tweet_id'])['referenced_tweets'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
-                refd_tweets_norm = pd.json_normalize(refd_tweets[0])
-                referenced_tweets = pd.concat([refd_tweets['tweet_id'], refd_tweets_norm], axis=1)
-                TWEETS_LEVEL = referenced_tweets \
-                    .reset_index(drop=True) \
-                    .rename(columns={'tweet_id': 'referencing_tweet_id', 'id': 'tweet_id'}) \
-                    .drop(columns=['author_id', 'in_reply_to_user.id'], errors='ignore')
-                # Give each level a reference number
-                TWEETS_LEVEL['reference_level'] = str(len(reference_levels_list))
+                    .pipe(explode_list_column, 'tweet_id', 'referenced_tweets')
+                references = pd.DataFrame({'tweet_id': edges['tweet_id'].to_numpy(),
+                                           'referenced_tweet_id': [reference.get('id') for reference in edges[0]],
+                                           'tweet_type': [reference.get('type') for reference in edges[0]]}) \
+                    .drop_duplicates()
+                reference_levels_list[-1] = pd.merge(level, references, on='tweet_id', how='left')
+                break
+            edges = level[['tweet_id', 'referenced_tweets']] \
+                .dropna() \
+                .pipe(explode_list_column, 'tweet_id', 'referenced_tweets')
+            referenced_tweets = pd.concat([edges['tweet_id'], normalize_records(edges[0].tolist())], axis=1)
+            level = referenced_tweets \
+                .reset_index(drop=True) \
+                .rename(columns={'tweet_id': 'referencing_tweet_id', 'id': 'tweet_id'}) \
+                .drop(columns=['author_id', 'in_reply_to_user.id'], errors='ignore')
+            # Give each level a reference number
+            level['reference_level'] = str(len(reference_levels_list))
 
-                reference_levels_list.append(TWEETS_LEVEL)
+            reference_levels_list.append(level)
 
         return reference_levels_list
 
+    @timed_stage('move_referenced_tweet_data_up')
     def move_referenced_tweet_data_up(self, reference_levels_list, up_a_level_column_list):
         '''
         Copies data from selected columns in tweets_flat, so that they appear in the level at which they are referenced.
         Example: The 'tweet_text' of a level 1 tweet appears as the 'referenced_tweet_text' of a level 0 tweet.
         '''
 
-        # Crete lists to hold values from referenced tweets
-        dfs_to_move_up = []
-        ref_tweets_up_one_level_list = []
+        # Loop through each level below tweets_flat and move its data to the same level as the referencing tweet
         combined_levels = []
-
-        # Loop through each level in reference_levels_list and move referenced tweet data to same level as referencing tweet
-        # dfs_to_move_up[0] match on level.columns will not work but it is discarded anyway
-        for level in reference_levels_list:
-            for col in up_a_level_column_list:
-                if col in level.columns:
-                    ref_tweets_up_one_level_list.append(col)
-            ref_tweets_up_one_level = level[ref_tweets_up_one_level_list]
-            dfs_to_move_up.append(ref_tweets_up_one_level)
-            ref_tweets_up_one_level_list = []
-
-        # Rename columns
-        for i in range(1, len(dfs_to_move_up)):
-            df_to_move = dfs_to_move_up[i].rename(columns=TWEET_fields.dfs_move_up_colnames, errors='ignore')\
+        for i in range(1, len(reference_levels_list)):
+            level = reference_levels_list[i]
+            df_to_move = level[[col for col in up_a_level_column_list if col in level.columns]] \
+                .rename(columns=TWEET_fields.dfs_move_up_colnames, errors='ignore') \
                 .drop_duplicates(subset=['referenced_tweet_id', 'tweet_id', 'tweet_type'])
             # Combine tweet data with relevant referenced tweet data
-            combined_level = pd.merge(reference_levels_list[i - 1], df_to_move, on='tweet_id', how='left')
-            # Replace colnames '.' with '_'
-            old_cols = combined_level.columns
-            new_cols = old_cols.str.replace(".", "_", regex=True).str.replace("__", "", regex=True).tolist()
-            cols = dict(zip(old_cols, new_cols))
-            combined_level.rename(columns=cols)\
-                .sort_index(axis=1)\
-                .reset_index(drop=True)
-            combined_levels.append(combined_level)
+            combined_levels.append(pd.merge(reference_levels_list[i - 1], df_to_move, on='tweet_id', how='left'))
 
+        last_level = reference_levels_list[-1]
         if len(combined_levels) > 1:
-            # Concat everything in combined_levels
-            concatted = pd.concat(combined_levels)
-            # Put last item in reference_levels_list at bottom
-            TWEETS = pd.concat([concatted, reference_levels_list[-1]])
-            # Now that 'type' has been moved up a level, rename values in 'tweet_type' column
+            # Concat everything in combined_levels, and put last item in reference_levels_list at bottom
+            TWEETS = pd.concat(combined_levels + [last_level])
         else:
-            level.columns = level.columns.str.replace(".", "_", regex=True)
-            try:
-                TWEETS = pd.concat([combined_level, level])
-            except:
-                TWEETS = level
+            # Replace colnames '.' with '_'
+            last_level.columns = last_level.columns.str.replace(".", "_", regex=True)
+            TWEETS = pd.concat(combined_levels + [last_level]) if len(combined_levels) > 0 else last_level
 
+        # Now that 'type' has been moved up a level, rename values in 'tweet_type' column
         if 'tweet_type' in TWEETS.columns:
             TWEETS['tweet_type'] = TWEETS['tweet_type'].replace(
                 {'retweeted': 'retweet',
@@ -162,6 +192,7 @@ class ProcessTweets:
 
         return TWEETS
 
+    @timed_stage('fix_retweet_truncation')
     def fix_retweet_truncation(self, TWEETS):
         '''
         There is a known issue with the Twitter API where retweet text is truncated to 140 characters. This function uses
@@ -186,6 +217,7 @@ class ProcessTweets:
 
         return TWEETS
 
+    @timed_stage('extract_quote_reply_users')
     def extract_quote_reply_users(self, TWEETS, URLS):
         '''
         Extracts author usernames where they do not exist with respect to quote tweets and replies; they are retrieved
@@ -219,6 +251,7 @@ class ProcessTweets:
 
         return TWEETS
 
+    @timed_stage('process_boolean_cols')
     def process_boolean_cols(self, TWEETS):
         '''
         Process boolean columns.
@@ -268,6 +301,7 @@ class ProcessTweets:
 
         return TWEETS
 
+    @timed_stage('fill_blanks_and_nas')
     def fill_blanks_and_nas(self, TWEETS):
         '''
         Converts converts blanks to nans; converts nans in int and float fields to 0 for consistency and to prevent ValueError.
@@ -288,6 +322,7 @@ class ProcessTweets:
 
 class ProcessTables:
 
+    @timed_stage('build_author_description_table')
     def build_author_description_table(self, TWEETS, entities_mentions):
         '''
         Build author_description table. Table is an amalgamation of author description hashtags, mentions and urls, for
@@ -303,10 +338,7 @@ class ProcessTables:
             if f'{desc_type}_entities.description.hashtags' in desc_col.columns:
                 descr_htags = desc_col[[f'{desc_type}_id', f'{desc_type}_entities.description.hashtags']] \
                     .dropna() \
-                    .set_index([f'{desc_type}_id'])[f'{desc_type}_entities.description.hashtags'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                    .pipe(explode_list_column, f'{desc_type}_id', f'{desc_type}_entities.description.hashtags')
                 descr_htags_tags = pd.json_normalize(descr_htags[0]) \
                     .add_prefix(f'{desc_type}_description_hashtags_')
                 author_descr = pd.concat([descr_htags[f'{desc_type}_id'], descr_htags_tags], axis=1)
@@ -319,10 +351,7 @@ class ProcessTables:
             if f'{desc_type}_entities.description.cashtags' in desc_col.columns:
                 descr_ctags = desc_col[[f'{desc_type}_id', f'{desc_type}_entities.description.cashtags']] \
                     .dropna() \
-                    .set_index([f'{desc_type}_id'])[f'{desc_type}_entities.description.cashtags'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                    .pipe(explode_list_column, f'{desc_type}_id', f'{desc_type}_entities.description.cashtags')
                 descr_ctags_tags = pd.json_normalize(descr_ctags[0]) \
                     .add_prefix(f'{desc_type}_description_cashtags_')
                 author_cashtags = pd.concat([descr_ctags[f'{desc_type}_id'], descr_ctags_tags], axis=1)
@@ -336,10 +365,7 @@ class ProcessTables:
             if f'{desc_type}_entities.description.mentions' in desc_col.columns:
                 descr_mentions = desc_col[[f'{desc_type}_id', f'{desc_type}_entities.description.mentions']] \
                     .dropna() \
-                    .set_index([f'{desc_type}_id'])[f'{desc_type}_entities.description.mentions'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                    .pipe(explode_list_column, f'{desc_type}_id', f'{desc_type}_entities.description.mentions')
                 descr_mentions_mntns = pd.json_normalize(descr_mentions[0]) \
                     .add_prefix(f'{desc_type}_description_mentions_')
                 descr_mentions = pd.concat([descr_mentions[f'{desc_type}_id'], descr_mentions_mntns], axis=1)
@@ -352,10 +378,7 @@ class ProcessTables:
             if f'{desc_type}_entities.description.urls' in desc_col.columns:
                 descr_urls = desc_col[[f'{desc_type}_id', f'{desc_type}_entities.description.urls']] \
                     .dropna() \
-                    .set_index([f'{desc_type}_id'])[f'{desc_type}_entities.description.urls'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                    .pipe(explode_list_column, f'{desc_type}_id', f'{desc_type}_entities.description.urls')
                 descr_urls_urls = pd.json_normalize(descr_urls[0]) \
                     .add_prefix(f'{desc_type}_description_urls_')
                 descr_urls = pd.concat([descr_urls[f'{desc_type}_id'], descr_urls_urls], axis=1)
@@ -379,6 +402,7 @@ class ProcessTables:
 
         return AUTHOR_DESCRIPTION
 
+    @timed_stage('build_author_urls_table')
     def build_author_urls_table(self, TWEETS, entities_mentions):
         '''
         Builds table of urls from the profiles of tweet authors, mentioned authors and in_reply_to authors. Similar to
@@ -393,10 +417,7 @@ class ProcessTables:
             if f'{desc_type}_entities.url.urls' in desc_col.columns:
                 author_urls = desc_col[[f'{desc_type}_id', f'{desc_type}_entities.url.urls']].dropna()
                 if len(author_urls) > 0:
-                    author_urls = author_urls.set_index([f'{desc_type}_id'])[f'{desc_type}_entities.url.urls'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                    author_urls = author_urls.pipe(explode_list_column, f'{desc_type}_id', f'{desc_type}_entities.url.urls')
                 author_urls_urls = pd.json_normalize(author_urls[0]).add_prefix('author_')
                 AUTHOR_URLS = pd.concat([author_urls[f'{desc_type}_id'], author_urls_urls], axis=1) \
                     .reset_index(drop=True) \
@@ -415,6 +436,7 @@ class ProcessTables:
 
         return AUTHOR_URLS
 
+    @timed_stage('build_media_table')
     def build_media_table(self, TWEETS):
         '''
         Builds media table; a few variant options due to variation in the json format (tweet downloader specifically).
@@ -427,10 +449,7 @@ class ProcessTables:
         if 'attachments_media' in TWEETS.columns:
             media_data = TWEETS[['tweet_id', 'attachments_media']].dropna()
             if len(media_data) > 0:
-                media_data = media_data.set_index(['tweet_id'])['attachments_media'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                media_data = media_data.pipe(explode_list_column, 'tweet_id', 'attachments_media')
             media_data_media = pd.json_normalize(media_data[0]).add_prefix('media_')
             media_data = pd.concat([media_data['tweet_id'], media_data_media], axis=1) \
                 .rename(columns={'media_public_metrics.view_count': 'media_public_metrics_view_count',
@@ -463,6 +482,7 @@ class ProcessTables:
 
         return MEDIA
 
+    @timed_stage('build_poll_options_table')
     def build_poll_options_table(self, TWEETS):
         '''
         Builds poll options table from nested attachments_poll_options column. Extracts column, expands and flattens data.
@@ -472,10 +492,7 @@ class ProcessTables:
         if 'attachments_poll_options' in TWEETS.columns:
             poll_options = TWEETS[['attachments_poll_id', 'attachments_poll_options']].dropna()
             if len(poll_options) > 0:
-                poll_options = poll_options.set_index(['attachments_poll_id'])['attachments_poll_options'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                poll_options = poll_options.pipe(explode_list_column, 'attachments_poll_id', 'attachments_poll_options')
             poll_options_polls = pd.json_normalize(poll_options[0]).add_prefix('poll_')
             POLL_OPTIONS = pd.concat([poll_options['attachments_poll_id'], poll_options_polls], axis=1) \
                 .astype({'poll_position': 'object'}) \
@@ -495,6 +512,7 @@ class ProcessTables:
 
         return POLL_OPTIONS
 
+    @timed_stage('build_context_annotations_table')
     def build_context_annotations_table(self, TWEETS):
         '''
         Builds context_annotations table from nested 'context_annotations' field. Extracts column, expands and flattens
@@ -504,10 +522,7 @@ class ProcessTables:
         if 'context_annotations' in TWEETS.columns:
             context_annotations = TWEETS[['tweet_id', 'context_annotations']].dropna()
             if len(context_annotations) > 0:
-                context_annotations = context_annotations.set_index(['tweet_id'])['context_annotations'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                context_annotations = context_annotations.pipe(explode_list_column, 'tweet_id', 'context_annotations')
             context_annotations_ann = pd.json_normalize(context_annotations[0]).add_prefix('tweet_context_annotation_')
             context_annotations = pd.concat([context_annotations['tweet_id'], context_annotations_ann], axis=1)
             context_annotations.columns = context_annotations.columns.str.replace(".", "_", regex=True)
@@ -525,6 +540,7 @@ class ProcessTables:
 
         return CONTEXT_ANNOTATIONS
 
+    @timed_stage('build_annotations_table')
     def build_annotations_table(self, TWEETS):
         '''
         Builds annotations table from nested 'entities_annotations' field. Extracts column, expands and flattens data. Links to
@@ -534,10 +550,7 @@ class ProcessTables:
         if 'entities_annotations' in TWEETS.columns:
             entities_annotations = TWEETS[['tweet_id', 'entities_annotations']].dropna()
             if len(entities_annotations) > 0:
-                entities_annotations = entities_annotations.set_index(['tweet_id'])['entities_annotations'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                entities_annotations = entities_annotations.pipe(explode_list_column, 'tweet_id', 'entities_annotations')
                 entities_annotations_ann = pd.json_normalize(entities_annotations[0]).add_prefix('tweet_annotation_')
                 ANNOTATIONS = pd.concat([entities_annotations['tweet_id'], entities_annotations_ann], axis=1) \
                     .reset_index(drop=True) \
@@ -553,6 +566,7 @@ class ProcessTables:
 
         return ANNOTATIONS
 
+    @timed_stage('build_hashtags_table')
     def build_hashtags_table(self, TWEETS):
         '''
         Builds hashtags table from nested 'entities_hashtags' field. Extracts column, expands and flattens
@@ -562,10 +576,7 @@ class ProcessTables:
         if 'entities_hashtags' in TWEETS.columns:
             entities_hashtags = TWEETS[['tweet_id', 'entities_hashtags']].dropna()
             if len(entities_hashtags) > 0:
-                entities_hashtags = entities_hashtags.set_index(['tweet_id'])['entities_hashtags'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                entities_hashtags = entities_hashtags.pipe(explode_list_column, 'tweet_id', 'entities_hashtags')
                 entities_hashtags_tag = pd.json_normalize(entities_hashtags[0]).add_prefix('hashtags_')
                 if 'hashtags_text' in entities_hashtags_tag:
                     entities_hashtags_tag = entities_hashtags_tag.rename(columns={'hashtags_text':'hashtags_tag'})
@@ -585,6 +596,7 @@ class ProcessTables:
 
         return HASHTAGS
 
+    @timed_stage('build_cashtags_table')
     def build_cashtags_table(self, TWEETS):
         '''
         Builds cashtags table from nested 'entities_cashtags' field. Extracts column, expands and flattens
@@ -594,10 +606,7 @@ class ProcessTables:
         if 'entities_cashtags' in TWEETS.columns:
             entities_cashtags = TWEETS[['tweet_id', 'entities_cashtags']].dropna()
             if len(entities_cashtags) > 0:
-                entities_cashtags = entities_cashtags.set_index(['tweet_id'])['entities_cashtags'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                entities_cashtags = entities_cashtags.pipe(explode_list_column, 'tweet_id', 'entities_cashtags')
                 entities_cashtags_tag = pd.json_normalize(entities_cashtags[0]).add_prefix('cashtags_')
                 if 'cashtags_text' in entities_cashtags_tag:
                     entities_cashtags_tag = entities_cashtags_tag.rename(columns={'hashtags_text':'hashtags_tag'})
@@ -617,6 +626,7 @@ class ProcessTables:
 
         return CASHTAGS
 
+    @timed_stage('extract_entities_data')
     def extract_entities_data(self, TWEETS):
         '''
         Pulls 'entities_mentions' data from TWEETS table; used to build other tables from nested fields in TWEETS. Extracts
@@ -625,11 +635,7 @@ class ProcessTables:
 
         entities_mentions = TWEETS[['tweet_id', 'entities_mentions']].dropna()
         if len(entities_mentions) > 0:
-            entities_mentions = entities_mentions \
-                .set_index(['tweet_id'])['entities_mentions'] \
-                .apply(pd.Series) \
-                .stack() \
-                .reset_index()
+            entities_mentions = entities_mentions.pipe(explode_list_column, 'tweet_id', 'entities_mentions')
             entities_mentions_mntns = pd.json_normalize(entities_mentions[0]) \
                 .add_prefix('tweet_mentions_author_')
             entities_mentions = pd.concat([entities_mentions['tweet_id'], entities_mentions_mntns], axis=1) \
@@ -642,6 +648,7 @@ class ProcessTables:
 
         return entities_mentions
 
+    @timed_stage('build_mentions_table')
     def build_mentions_table(self, entities_mentions):
         '''
         Builds MENTIONS table from 'entities_mentions' table. Extracts column, expands and flattens
@@ -660,6 +667,7 @@ class ProcessTables:
 
         return MENTIONS
 
+    @timed_stage('build_urls_table')
     def build_urls_table(self, TWEETS):
         '''
         Builds urls table from nested 'entities_urls' field. Extracts column, expands and flattens
@@ -669,10 +677,7 @@ class ProcessTables:
         if 'entities_urls' in TWEETS.columns:
             entities_urls = TWEETS[['tweet_id', 'entities_urls']].dropna()
             if len(entities_urls) > 0:
-                entities_urls = entities_urls.set_index(['tweet_id'])['entities_urls'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                entities_urls = entities_urls.pipe(explode_list_column, 'tweet_id', 'entities_urls')
                 entities_urls_urls = pd.json_normalize(entities_urls[0]) \
                     .add_prefix('urls_')
                 # TODO: DEAL WITH URLS_IMAGES - put in media table?
@@ -690,6 +695,7 @@ class ProcessTables:
 
         return URLS
 
+    @timed_stage('build_interactions_table')
     def build_interactions_table(self, TWEETS, MENTIONS):
         '''
         Uses mentions and tweet data to generate a new table with all mentions (includes replies, quotes and retweets).
@@ -728,6 +734,7 @@ class ProcessTables:
 
         return INTERACTIONS
 
+    @timed_stage('build_edit_history_table')
     def build_edit_history_table(self, TWEETS):
         '''
         Builds urls table from 'edit_history_tweet_ids' list field. Extracts column, expands and flattens
@@ -737,10 +744,7 @@ class ProcessTables:
         if 'edit_history_tweet_ids' in TWEETS.columns:
             edit_history_tweet_ids = TWEETS[['tweet_id', 'edit_history_tweet_ids']].dropna()
             if len(edit_history_tweet_ids) > 0:
-                edit_history_tweet_ids = edit_history_tweet_ids.set_index(['tweet_id'])['edit_history_tweet_ids'] \
-                    .apply(pd.Series) \
-                    .stack() \
-                    .reset_index()
+                edit_history_tweet_ids = edit_history_tweet_ids.pipe(explode_list_column, 'tweet_id', 'edit_history_tweet_ids')
                 EDIT_HISTORY = edit_history_tweet_ids[['tweet_id', 0]]\
                     .reset_index(drop=True) \
                     .rename(columns={0:'edit_history_tweet_ids'}) \
@@ -0,0 +1,329 @@
+'''
+Contains the query packing planner. When query is a list, short subqueries are OR-combined into packed queries of up to
+1024 characters, so that one search_all collection covers many subqueries. Each tweet returned by a packed query is then
+attributed to the subqueries it matches by a local matcher, which understands a subset of the Twitter search syntax:
+keywords, "exact phrases", #hashtags, @mentions, $cashtags, from:, to:, lang:, is: and has: operators, OR, grouping with
+parentheses and negation with '-'. Subqueries using any other operator are never packed; they are collected on their own.
+'''
+
+import re
+import logging
+
+import pandas as pd
+
+
+# Name of the QUERY_MEMBERSHIP table in BigQuery
+membership_tablename = 'query_membership'
+
+# Longest query accepted by the full-archive search endpoint (see validate_params.py)
+max_query_length = 1024
+
+# Splits a query into quoted phrases, parentheses and space-separated terms
+query_token_pattern = re.compile(r'-?"[^"]*"|-?\(|\)|[^\s()]+')
+
+# Splits tweet text into tokens, as the Twitter API does for keyword matching (on punctuation, symbols and spaces)
+text_token_pattern = re.compile(r'\w+')
+
+supported_is = ['retweet', 'reply', 'quote', 'verified']
+supported_has = ['media', 'images', 'videos', 'links', 'hashtags', 'mentions', 'cashtags', 'geo']
+
+
+class UnsupportedQuery(Exception):
+    '''
+    Raised when a query uses syntax the local matcher does not understand; such a query is not packed.
+    '''
+    pass
+
+
+class QueryPack:
+
+    def __init__(self, subqueries):
+        '''
+        One packed query: the OR-combination of one or more subqueries, with a matcher for each. A pack of a single
+        subquery is collected exactly as the subquery itself.
+        '''
+
+        self.subqueries = subqueries
+        if len(subqueries) == 1:
+            self.query = subqueries[0]
+            self.matchers = None
+        else:
+            self.query = combine_queries(subqueries)
+            self.matchers = [parse_query(subquery) for subquery in subqueries]
+
+    def is_packed(self):
+        return self.matchers is not None
+
+    def build_membership_table(self, tweets):
+        '''
+        Attributes each tweet in a chunk of flattened tweets (a dataframe of level 0 tweets) to the subqueries it
+        matches. Returns the QUERY_MEMBERSHIP table, with one row per (tweet_id, query) pair. Tweets that the local
+        matcher cannot attribute to any subquery are recorded against the packed query itself.
+        '''
+
+        rows = []
+        unattributed = 0
+        for tweet in tweets.to_dict('records'):
+            tweet = TweetFields(tweet)
+            matched = [subquery for subquery, matcher in zip(self.subqueries, self.matchers) if matcher.matches(tweet)]
+            if len(matched) == 0:
+                matched = [self.query]
+                unattributed = unattributed + 1
+            rows.extend([(tweet.tweet_id, subquery) for subquery in matched])
+
+        if unattributed > 0:
+            logging.info(f'{unattributed} tweets could not be attributed to a single query; recorded against the packed query')
+
+        QUERY_MEMBERSHIP = pd.DataFrame(rows, columns=['tweet_id', 'query'], dtype=object)
+        # Named, so that it is told apart from the other tables of a chunk (see SchemaFuncs.get_schema_type())
+        QUERY_MEMBERSHIP.attrs['tablename'] = membership_tablename
+
+        return QUERY_MEMBERSHIP
+
+
+def plan_query_packs(queries, max_length=max_query_length):
+    '''
+    Groups a list of subqueries into QueryPacks, in order. Consecutive packable subqueries are combined while the packed
+    query stays within max_length characters; subqueries the local matcher does not support get a pack of their own.
+    '''
+
+    packs = []
+    current = []
+    for subquery in queries:
+        try:
+            parse_query(subquery)
+        except UnsupportedQuery as error:
+            logging.info(f'Query will not be packed ({error}): {subquery}')
+            # Packs keep the order of the list
+            if len(current) > 0:
+                packs.append(QueryPack(current))
+                current = []
+            packs.append(QueryPack([subquery]))
+            continue
+
+        if len(current) > 0 and len(combine_queries(current + [subquery])) > max_length:
+            packs.append(QueryPack(current))
+            current = []
+        current.append(subquery)
+
+    if len(current) > 0:
+        packs.append(QueryPack(current))
+
+    logging.info(f'Packed {len(queries)} queries into {len(packs)} searches')
+
+    return packs
+
+def combine_queries(subqueries):
+    if len(subqueries) == 1:
+        return subqueries[0]
+    return ' OR '.join([f'({subquery})' for subquery in subqueries])
+
+def tokenize_text(text):
+    return text_token_pattern.findall(text.casefold())
+
+
+# Query parsing. A query is parsed into a tree of nodes, each with a matches(tweet) method:
+#     query  := group ('OR' group)*
+#     group  := term+                 (terms separated by spaces must all match)
+#     term   := ['-'] ( '(' query ')' | "phrase" | keyword | #tag | @user | $tag | operator:value )
+
+def parse_query(query):
+    '''
+    Parses a query into a matcher; raises UnsupportedQuery if the query uses unsupported syntax.
+    '''
+
+    tokens = query_token_pattern.findall(query)
+    if len(tokens) == 0:
+        raise UnsupportedQuery('empty query')
+
+    node, position = parse_or(tokens, 0)
+    if position != len(tokens):
+        raise UnsupportedQuery("unbalanced ')'")
+
+    return node
+
+def parse_or(tokens, position):
+    groups = []
+    while True:
+        group, position = parse_and(tokens, position)
+        groups.append(group)
+        if position < len(tokens) and tokens[position] == 'OR':
+            position = position + 1
+            continue
+        break
+
+    return (groups[0] if len(groups) == 1 else AnyOf(groups)), position
+
+def parse_and(tokens, position):
+    terms = []
+    while position < len(tokens) and tokens[position] not in ['OR', ')']:
+        term, position = parse_term(tokens, position)
+        terms.append(term)
+
+    if len(terms) == 0:
+        raise UnsupportedQuery('empty group')
+
+    return (terms[0] if len(terms) == 1 else AllOf(terms)), position
+
+def parse_term(tokens, position):
+    token = tokens[position]
+
+    if token in ['(', '-(']:
+        node, position = parse_or(tokens, position + 1)
+        if position >= len(tokens) or tokens[position] != ')':
+            raise UnsupportedQuery("unbalanced '('")
+        return (Not(node) if token == '-(' else node), position + 1
+
+    negated = token.startswith('-') and len(token) > 1
+    if negated:
+        token = token[1:]
+
+    node = parse_operand(token)
+
+    return (Not(node) if negated else node), position + 1
+
+def parse_operand(token):
+    if token.startswith('"'):
+        return Phrase(token.strip('"'))
+    elif token.startswith('#') and len(token) > 1:
+        return EntityMatch('hashtags', token[1:])
+    elif token.startswith('@') and len(token) > 1:
+        return EntityMatch('mentions', token[1:])
+    elif token.startswith('$') and len(token) > 1 and not token[1].isdigit():
+        return EntityMatch('cashtags', token[1:])
+    elif ':' in token:
+        operator, value = token.split(':', 1)
+        if operator in ['from', 'to', 'lang'] and len(value) > 0:
+            return FieldMatch(operator, value)
+        elif operator == 'is' and value in supported_is:
+            return Flag(operator, value)
+        elif operator == 'has' and value in supported_has:
+            return Flag(operator, value)
+        raise UnsupportedQuery(f"operator '{token}' is not supported by the local matcher")
+    return Phrase(token)
+
+
+class AnyOf:
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def matches(self, tweet):
+        return any(node.matches(tweet) for node in self.nodes)
+
+
+class AllOf:
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def matches(self, tweet):
+        return all(node.matches(tweet) for node in self.nodes)
+
+
+class Not:
+    def __init__(self, node):
+        self.node = node
+
+    def matches(self, tweet):
+        return not self.node.matches(tweet)
+
+
+class Phrase:
+    def __init__(self, phrase):
+        '''
+        A keyword or "exact phrase": a tokenized, case-insensitive match on the tweet text.
+        '''
+
+        tokens = tokenize_text(phrase)
+        if len(tokens) == 0:
+            raise UnsupportedQuery(f"keyword '{phrase}' has no word characters")
+        self.phrase = f" {' '.join(tokens)} "
+
+    def matches(self, tweet):
+        return self.phrase in tweet.text
+
+
+class EntityMatch:
+    def __init__(self, entity_type, value):
+        self.entity_type = entity_type
+        self.value = value.casefold()
+
+    def matches(self, tweet):
+        return self.value in tweet.entities[self.entity_type]
+
+
+class FieldMatch:
+    def __init__(self, operator, value):
+        self.operator = operator
+        self.value = value.casefold()
+
+    def matches(self, tweet):
+        if self.operator == 'lang':
+            return tweet.lang == self.value
+        # from: and to: accept a username or a user ID
+        return self.value in tweet.users[self.operator]
+
+
+class Flag:
+    def __init__(self, operator, value):
+        self.key = f'{operator}:{value}'
+
+    def matches(self, tweet):
+        return self.key in tweet.flags
+
+
+class TweetFields:
+
+    def __init__(self, tweet):
+        '''
+        The fields of one flattened tweet (a dict, as written by twarc's expansions.flatten) that the matcher needs,
+        normalised for matching. Retweets are matched on the text and entities of the retweeted tweet, as the Twitter
+        API does.
+        '''
+
+        self.tweet_id = str(tweet['id'])
+        referenced = as_list(tweet.get('referenced_tweets'))
+        reference_types = [as_dict(ref).get('type') for ref in referenced]
+
+        matched_tweet = tweet
+        for ref in referenced:
+            if as_dict(ref).get('type') == 'retweeted' and 'text' in as_dict(ref):
+                matched_tweet = ref
+
+        self.text = f" {' '.join(tokenize_text(str(matched_tweet.get('text', ''))))} "
+        self.lang = str(tweet.get('lang', '')).casefold()
+
+        entities = as_dict(matched_tweet.get('entities'))
+        own_entities = as_dict(tweet.get('entities'))
+        self.entities = {'hashtags': set(as_dict(item).get('tag', '').casefold() for item in as_list(entities.get('hashtags'))),
+                         'cashtags': set(as_dict(item).get('tag', '').casefold() for item in as_list(entities.get('cashtags'))),
+                         'mentions': set(as_dict(item).get('username', '').casefold()
+                                         for item in as_list(entities.get('mentions')) + as_list(own_entities.get('mentions')))}
+
+        author = as_dict(tweet.get('author'))
+        in_reply_to_user = as_dict(tweet.get('in_reply_to_user'))
+        self.users = {'from': set(str(value).casefold() for value in [tweet.get('author_id'), author.get('username')] if value),
+                      'to': set(str(value).casefold() for value in [tweet.get('in_reply_to_user_id'), in_reply_to_user.get('username')] if value)}
+
+        attachments = as_dict(tweet.get('attachments'))
+        media_types = [as_dict(media).get('type') for media in as_list(attachments.get('media'))]
+        flags = {'is:retweet': 'retweeted' in reference_types,
+                 'is:reply': 'replied_to' in reference_types,
+                 'is:quote': 'quoted' in reference_types,
+                 'is:verified': author.get('verified') == True,
+                 'has:media': len(as_list(attachments.get('media_keys'))) > 0,
+                 'has:images': 'photo' in media_types,
+                 'has:videos': 'video' in media_types or 'animated_gif' in media_types,
+                 'has:links': len(as_list(own_entities.get('urls'))) > 0,
+                 'has:hashtags': len(self.entities['hashtags']) > 0,
+                 'has:mentions': len(self.entities['mentions']) > 0,
+                 'has:cashtags': len(self.entities['cashtags']) > 0,
+                 'has:geo': len(as_dict(tweet.get('geo'))) > 0}
+        self.flags = set(key for key, value in flags.items() if value)
+
+
+def as_dict(value):
+    # Missing nested fields are NaN in a dataframe
+    return value if isinstance(value, dict) else dict()
+
+def as_list(value):
+    return value if isinstance(value, list) else []
@@ -0,0 +1,78 @@
+'''
+Contains a token bucket rate limiter, shared by concurrent workers so that together they stay within the request limits
+of the Twitter API endpoints.
+'''
+
+import time
+import threading
+
+
+# Full-archive search and counts limits for the Academic Research track, as (requests, seconds) pairs:
+# 1 request per second, and 300 requests per 15-minute window, per bearer token
+SEARCH_ALL_LIMITS = [(1, 1), (300, 900)]
+COUNTS_ALL_LIMITS = [(1, 1), (300, 900)]
+
+
+def scale_limits(limits, token_count):
+    '''
+    The limits for requests spread across token_count bearer tokens, each with its own budget (see api_client.py).
+    '''
+
+    return [(requests * max(token_count, 1), seconds) for requests, seconds in limits]
+
+
+class TokenBucket:
+
+    def __init__(self, capacity, period):
+        '''
+        A bucket holding up to 'capacity' tokens, refilled at a rate of capacity/period tokens per second.
+        '''
+
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        '''
+        Seconds until one token is available (0 if a token is available now).
+        '''
+
+        self.refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens = self.tokens - 1
+
+
+class RateLimiter:
+
+    def __init__(self, limits):
+        '''
+        Combines one token bucket per (requests, seconds) limit. A request may only be made once every bucket has a
+        token available. Thread safe; one instance is shared by all workers collecting from the same endpoint.
+        '''
+
+        self.buckets = [TokenBucket(capacity, period) for capacity, period in limits]
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Blocks until a request may be made, then takes a token from each bucket.
+        '''
+
+        while True:
+            with self.lock:
+                wait = max(bucket.wait_time() for bucket in self.buckets)
+                if wait <= 0:
+                    for bucket in self.buckets:
+                        bucket.take()
+                    return
+            time.sleep(wait)
@@ -0,0 +1,182 @@
+'''
+Contains the writer and reader for the raw archive: the flattened tweet objects collected for each interval, saved one
+json object per line to my_collections/<dataset>/collected_json. Files may be gzip- or zstd-compressed (.jsonl.gz,
+.jsonl.zst); compressed files are read back as a stream, without decompressing to disk.
+'''
+
+import io
+import os
+import gzip
+import json
+import time
+import logging
+
+from humanfriendly import format_size, format_timespan
+
+# zstandard is only needed for zstd-compressed archives
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# File name suffix for each raw_compression option in config.yml
+compression_suffixes = {None: '',
+                        'gzip': '.gz',
+                        'zstd': '.zst'}
+
+# Patterns matching raw archive files, compressed or not
+archive_file_patterns = ['*.jsonl', '*.jsonl.gz', '*.jsonl.zst']
+
+
+def get_compression_suffix(compression):
+    '''
+    Returns the file name suffix for a compression option; raises ValueError for unknown options.
+    '''
+
+    if compression not in compression_suffixes:
+        raise ValueError(f"raw_compression must be one of 'gzip', 'zstd' or None, not '{compression}'")
+
+    return compression_suffixes[compression]
+
+def get_file_compression(a_file):
+    '''
+    Infers the compression of an archive file from its name.
+    '''
+
+    if a_file.endswith('.gz'):
+        return 'gzip'
+    elif a_file.endswith('.zst'):
+        return 'zstd'
+    return None
+
+def require_zstandard():
+    if zstandard is None:
+        raise ImportError("Reading or writing .zst files requires the 'zstandard' package. "
+                          "Install it with 'pip install zstandard'.")
+
+def open_archive(a_file, mode='r'):
+    '''
+    Opens a raw archive file in text mode, compressed or not, for reading ('r') or appending ('a'). Compression is
+    inferred from the file name. Appending to a compressed file adds a new gzip member or zstd frame; readers here read
+    across all of them.
+    '''
+
+    compression = get_file_compression(a_file)
+
+    if compression == 'gzip':
+        return gzip.open(a_file, mode + 't', encoding='utf-8')
+    elif compression == 'zstd':
+        require_zstandard()
+        if mode == 'r':
+            raw = zstandard.ZstdDecompressor().stream_reader(open(a_file, 'rb'), read_across_frames=True, closefd=True)
+        else:
+            raw = zstandard.ZstdCompressor().stream_writer(open(a_file, mode + 'b'), closefd=True)
+        return io.TextIOWrapper(raw, encoding='utf-8')
+    return open(a_file, mode, encoding='utf-8')
+
+
+class RawArchiveWriter:
+
+    def __init__(self, a_file, buffer_size=1024*1024, fsync='window'):
+        '''
+        Keeps one file handle open for the whole interval (window) and writes each page of tweets in a single call,
+        through a buffer of buffer_size bytes. Data are flushed and fsync'd to disk at the end of every page
+        (fsync='page'), only when the window is complete (fsync='window'), or left to the operating system (fsync='none').
+        The file is only created once the first page of tweets is written. Files ending in .gz or .zst are compressed.
+        '''
+
+        if fsync not in ['page', 'window', 'none']:
+            raise ValueError(f"fsync must be 'page', 'window' or 'none', not '{fsync}'")
+
+        self.a_file = a_file
+        self.buffer_size = buffer_size
+        self.fsync = fsync
+        self.f = None
+        self.bytes_written = 0
+        self.tweets_written = 0
+        self.pages_written = 0
+        self.write_time = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def write_page(self, tweets):
+        '''
+        Writes one page of flattened tweets (a list of dicts) as json lines.
+        '''
+
+        if len(tweets) == 0:
+            return
+
+        page_start = time.perf_counter()
+
+        if self.f is None:
+            if get_file_compression(self.a_file) is None:
+                self.f = open(self.a_file, 'a', encoding='utf-8', buffering=self.buffer_size)
+            else:
+                self.f = open_archive(self.a_file, 'a')
+
+        # json.dumps escapes non-ascii characters, so one character is one (uncompressed) byte
+        lines = ''.join([json.dumps(tweet) + '\n' for tweet in tweets])
+        self.f.write(lines)
+        if self.fsync == 'page':
+            self.sync()
+
+        self.bytes_written = self.bytes_written + len(lines)
+        self.tweets_written = self.tweets_written + len(tweets)
+        self.pages_written = self.pages_written + 1
+        self.write_time = self.write_time + (time.perf_counter() - page_start)
+
+    def sync(self):
+        '''
+        Flushes the write buffer (and compressor) and forces the data to disk.
+        '''
+
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def file_size(self):
+        '''
+        Size of the file on disk once everything written so far has been flushed; None for compressed files, whose size
+        is not a safe point to resume from.
+        '''
+
+        if get_file_compression(self.a_file) is not None:
+            return None
+        if self.f is None:
+            return os.path.getsize(self.a_file) if os.path.isfile(self.a_file) else 0
+
+        self.f.flush()
+        return os.fstat(self.f.fileno()).st_size
+
+    def close(self):
+        '''
+        Closes the file at the end of the window, and logs how much was written and how quickly.
+        '''
+
+        if self.f is None:
+            return
+
+        close_start = time.perf_counter()
+        if self.fsync in ['page', 'window']:
+            self.sync()
+        self.f.close()
+        self.f = None
+        self.write_time = self.write_time + (time.perf_counter() - close_start)
+
+        logging.info(f'Wrote {self.tweets_written} tweets ({format_size(self.bytes_written)}) in {self.pages_written} pages '
+                     f'to {self.a_file} in {format_timespan(self.write_time)} '
+                     f'({format_size(self.bytes_per_second())}/s)')
+
+    def bytes_per_second(self):
+        '''
+        Write throughput: bytes written per second spent writing (including flushes and fsyncs).
+        '''
+
+        if self.write_time > 0:
+            return self.bytes_written / self.write_time
+        return 0
@@ -0,0 +1,74 @@
+'''
+Contains the seen tweet ID store: a record of every (level 0) tweet uploaded to a dataset, saved to
+my_collections/<dataset>/seen_tweet_ids.sqlite. When query is a list, a tweet matching several subqueries is collected
+once per subquery; the store lets later subqueries skip tweets already uploaded under an earlier one, before they are
+flattened and uploaded again.
+'''
+
+import sqlite3
+import logging
+import threading
+
+
+# Number of IDs per SQL statement; keeps below SQLite's limit on query parameters
+batch_size = 500
+
+
+class SeenTweetIds:
+
+    def __init__(self, db_file):
+        '''
+        Opens (or creates) the store. Tweet IDs are kept as the table's integer primary key, so lookups are index
+        searches and the file stays small. Thread safe, as chunks are checked in the processing thread when
+        pipeline is True.
+        '''
+
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.duplicates_skipped = 0
+        with self.lock, self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS seen (tweet_id INTEGER PRIMARY KEY)')
+
+    def find_seen(self, tweet_ids):
+        '''
+        Returns the set of tweet_ids (as strings) that are already in the store.
+        '''
+
+        tweet_ids = [int(tweet_id) for tweet_id in tweet_ids]
+        seen = set()
+        with self.lock:
+            for i in range(0, len(tweet_ids), batch_size):
+                batch = tweet_ids[i:i + batch_size]
+                rows = self.connection.execute(f"SELECT tweet_id FROM seen WHERE tweet_id IN ({','.join('?'*len(batch))})", batch)
+                seen.update(str(tweet_id) for (tweet_id,) in rows)
+
+        return seen
+
+    def drop_seen(self, tweets):
+        '''
+        Removes tweets already uploaded to the dataset from a chunk of flattened tweets (a dataframe with an 'id'
+        column), and counts them. Chunks without an 'id' column (e.g. unflattened twarc responses) are returned as is.
+        '''
+
+        if 'id' not in tweets.columns or len(tweets) == 0:
+            return tweets
+
+        seen = self.find_seen(tweets['id'])
+        if len(seen) == 0:
+            return tweets
+
+        is_seen = tweets['id'].astype(str).isin(seen)
+        skipped = int(is_seen.sum())
+        self.duplicates_skipped = self.duplicates_skipped + skipped
+        logging.info(f'Skipped {skipped} tweets already uploaded under an earlier query in this dataset')
+
+        return tweets.loc[~is_seen]
+
+    def add(self, tweet_ids):
+        '''
+        Records tweet_ids as uploaded.
+        '''
+
+        rows = [(int(tweet_id),) for tweet_id in tweet_ids]
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO seen VALUES (?)', rows)
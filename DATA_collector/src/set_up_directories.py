@@ -8,6 +8,8 @@ from time import sleep
 
 from .logging_archive_search import *
 from .config import *
+from .raw_archive import get_compression_suffix, archive_file_patterns
+from .manifest import CollectionManifest
 
 
 # Get current working directory
@@ -122,12 +124,13 @@ def set_log_file_path(logfile_filepath, folder):
         logging.info(f"log files will be written to this existing location")
     logging.info('-----------------------------------------------------------------------------------------')
 
-def set_up_expected_files(start_date, end_date, json_filepath, option_selection, query, dataset, interval, query_count):
+def set_up_expected_files(start_date, end_date, json_filepath, option_selection, query, dataset, interval, query_count, windows=None):
     '''
     Divides search into multiple queries, based on the interval chosen in config.yml.
     This saves on memory by 'chunking' long and voluminous searches into separate collections based on number of days
     (n_intervals). Interval parameter can be any number. 0.25 = 6 hours. 0.5 = 12 hours. 1 =  24 hours. 90 = ~3 months,
     and so on. Interval is generated automatically in data.calculate_interval().
+    If a list of (start, end) windows is given (see data.calculate_windows()), one file is expected per window instead.
     '''
 
     if query_count == None:
@@ -139,64 +142,80 @@ def set_up_expected_files(start_date, end_date, json_filepath, option_selection,
     expected_files = dict()
     current_date = start_date
     saved_search_path = json_filepath
+    # '.gz' or '.zst' if collected json is to be compressed
+    suffix = get_compression_suffix(Collection.raw_compression)
 
     if option_selection == 'lv':
         print(option_selection)
         dataset = query
-    # Generate dictionary of file names and start and end dates
-    # TODO make last filename end date correct
-
-    # if interval == 1:
-    #     while current_date < end_date:
-    #         expected_files[
-    #             saved_search_path + f"{dataset}{query_count}_{current_date.isoformat()[:-6]}_{end_date.isoformat()[:-6]}_tweets.jsonl".replace(":", "").replace(" ", "")] = (
-    #             current_date,
-    #             current_date + window_length
-    #         )
-    #         current_date += window_length
-    # else:
-    while current_date < end_date:
-        expected_files[
-            saved_search_path + f"{dataset}{query_count}_{current_date.isoformat()[:-6]}_{(current_date+window_length).isoformat()[:-6]}_tweets.jsonl".replace(":", "").replace(" ", "")] = (
-            current_date,
-            current_date + window_length
-        )
-        current_date += window_length
-
-    # for item in expected_files:
-
-    # TODO make this nicer - this is very makeshift.
-    #  The idea is to change the last end date in the dict to the end date in the config.
-    #  It is based on the window length so usually the end date is extended to the next interval.
-
-    last_file_start_date = current_date-window_length
-    last_file_end_date = end_date
-    last_file_name = saved_search_path + f"{dataset}{query_count}_{last_file_start_date.isoformat()[:-6]}_{last_file_end_date.isoformat()[:-6]}_tweets.jsonl".replace(":", "").replace(" ", "")
-
-    # Converting tuples to lists so that the last expected file can be edited
-    kvps = list(expected_files.items())
-    kvps_list = list(kvps[-1])
-
-    # Change last expected file filename
-    kvps_list[0] = last_file_name
-    kvps_list_list = list(kvps_list[-1])
-
-    # Change last expected file end date
-    kvps_list_list[-1] = Query.end_date
-
-    # Convert backt to tuples
-    kvps_list_list = tuple(kvps_list_list)
-    kvps_list[-1] = kvps_list_list
-    kvps[-1] = tuple(kvps_list)
-
-    # New expected files with correct end date
-    expected_files = dict(kvps)
-
-    collected_files = glob.glob(saved_search_path + "*json")
+
+    if windows is not None:
+        # Windows of roughly equal tweet volume, cut from the counts for this query
+        for window_start, window_end in windows:
+            expected_files[
+                saved_search_path + f"{dataset}{query_count}_{window_start.isoformat()[:-6]}_{window_end.isoformat()[:-6]}_tweets.jsonl{suffix}".replace(":", "").replace(" ", "")] = (
+                window_start,
+                window_end
+            )
+    else:
+        # Generate dictionary of file names and start and end dates
+        # TODO make last filename end date correct
+
+        # if interval == 1:
+        #     while current_date < end_date:
+        #         expected_files[
+        #             saved_search_path + f"{dataset}{query_count}_{current_date.isoformat()[:-6]}_{end_date.isoformat()[:-6]}_tweets.jsonl".replace(":", "").replace(" ", "")] = (
+        #             current_date,
+        #             current_date + window_length
+        #         )
+        #         current_date += window_length
+        # else:
+        while current_date < end_date:
+            expected_files[
+                saved_search_path + f"{dataset}{query_count}_{current_date.isoformat()[:-6]}_{(current_date+window_length).isoformat()[:-6]}_tweets.jsonl{suffix}".replace(":", "").replace(" ", "")] = (
+                current_date,
+                current_date + window_length
+            )
+            current_date += window_length
+
+        # for item in expected_files:
+
+        # TODO make this nicer - this is very makeshift.
+        #  The idea is to change the last end date in the dict to the end date in the config.
+        #  It is based on the window length so usually the end date is extended to the next interval.
+
+        last_file_start_date = current_date-window_length
+        last_file_end_date = end_date
+        last_file_name = saved_search_path + f"{dataset}{query_count}_{last_file_start_date.isoformat()[:-6]}_{last_file_end_date.isoformat()[:-6]}_tweets.jsonl{suffix}".replace(":", "").replace(" ", "")
+
+        # Converting tuples to lists so that the last expected file can be edited
+        kvps = list(expected_files.items())
+        kvps_list = list(kvps[-1])
+
+        # Change last expected file filename
+        kvps_list[0] = last_file_name
+        kvps_list_list = list(kvps_list[-1])
+
+        # Change last expected file end date
+        kvps_list_list[-1] = Query.end_date
+
+        # Convert backt to tuples
+        kvps_list_list = tuple(kvps_list_list)
+        kvps_list[-1] = kvps_list_list
+        kvps[-1] = tuple(kvps_list)
+
+        # New expected files with correct end date
+        expected_files = dict(kvps)
+
+    # A file is collected if the manifest marks it complete. Files on disk that the manifest does not know about were
+    # collected before the manifest existed, and are also treated as collected. Incomplete files are resumed.
+    manifest = CollectionManifest(saved_search_path)
+    collected_files = []
+    for pattern in archive_file_patterns:
+        collected_files.extend(glob.glob(saved_search_path + pattern))
     collected_files = set([filename.replace('\\', '/') for filename in collected_files])
-    files_to_collect = set(expected_files) - collected_files
-    files_to_collect = sorted(files_to_collect)
-    not_to_collect = result = [i for i in expected_files if i in collected_files]
+    not_to_collect = [i for i in expected_files if manifest.is_complete(i) or (i in collected_files and manifest.get_window(i) is None)]
+    files_to_collect = sorted(set(expected_files) - set(not_to_collect))
     return files_to_collect, not_to_collect, expected_files
 
 def get_json_input_files():
@@ -204,7 +223,10 @@ def get_json_input_files():
     Sets the location for json input files
     '''
     json_input_filepath = f'{cwd}/json_input_files/'
-    json_input_files = glob.glob(json_input_filepath + "*jsonl")
+    # .jsonl files, and gzip or zstd compressed .jsonl.gz/.jsonl.zst files
+    json_input_files = []
+    for pattern in archive_file_patterns:
+        json_input_files.extend(glob.glob(json_input_filepath + pattern))
 
     # json_input_filepath = '//rstore.qut.edu.au/projects/cif/auspubsphere/dmrc_DATA_collection/ausvotes2022_backfill/processed/'
     # json_input_file = glob.glob(json_input_filepath + "*.json")
@@ -0,0 +1,302 @@
+'''
+Contains the stage timers: the wall time, rows in and rows out of every stage of processing and uploading each chunk
+of tweets (reading json, flattening, unpacking referenced tweets, building each table, schema transforms, writing csv
+files and each BigQuery load job). Timers are always on; each costs two clock reads and a dict.
+
+Stages are grouped by chunk: the stages run while processing a chunk or uploading it are recorded together, with the
+total time taken. Chunks processed in worker processes (see process_pool.py and bulk_ingest.py) send their records back
+to the main process. At the end of a search, a run report with every chunk and a summary per stage is saved to
+my_collections/<dataset>/run_report_<date>_<time>.json, and the slowest stages are logged.
+
+If memory_profile is True in config.yml, each stage also records the resident memory of the process before and after
+it, and each processing chunk the memory taken by each table (DataFrame.memory_usage(deep=True)). Stages and chunks are
+appended to my_collections/<dataset>/memory_profile_<date>_<time>.jsonl as they complete, so the profile of a process
+killed for running out of memory shows how far it got. If memory_profile is True or memory_ceiling_mb is set, the peak
+resident memory of each chunk is measured, and a warning is logged when it comes close to memory_ceiling_mb.
+'''
+
+import os
+import json
+import time
+import logging
+import functools
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+import pandas as pd
+
+from .config import Collection
+from .memory import current_rss, PeakMemory, megabyte
+
+
+# Stages listed in the log summary, slowest first
+summary_stages = 5
+
+# Chunks whose peak resident memory reaches this fraction of memory_ceiling_mb are warned about
+ceiling_warning_fraction = 0.9
+
+
+def count_rows(value):
+    '''
+    Rows in a dataframe, or summed over a list of dataframes (e.g. reference levels); None for anything else.
+    '''
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        counts = [len(item) for item in value if isinstance(item, (pd.DataFrame, pd.Series))]
+        if len(counts) > 0:
+            return sum(counts)
+    return None
+
+def to_mb(memory):
+    if memory is None:
+        return None
+    return round(memory / megabyte, 1)
+
+def timed_stage(stage):
+    '''
+    Decorates a function as a stage: rows in are those of its first dataframe argument, and rows out those of the
+    dataframe (or list of dataframes) it returns, or of the first item of a returned tuple. If memory_profile is True,
+    resident memory is read before and after.
+    '''
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            rows_in = next((rows for rows in map(count_rows, args) if rows is not None), None)
+            rss_before = current_rss() if Collection.memory_profile else None
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            rows_out = count_rows(result[0] if isinstance(result, tuple) else result)
+            memory = None
+            if Collection.memory_profile:
+                memory = {'rss_before_mb': to_mb(rss_before), 'rss_after_mb': to_mb(current_rss())}
+            stage_timers.record(stage, seconds, rows_in, rows_out, memory)
+            return result
+        return wrapper
+
+    return decorator
+
+
+class StageTimers:
+
+    def __init__(self):
+        '''
+        Records stages for the current search. Thread safe: each thread (collection workers, pipeline stages) records
+        into the chunk it is working on.
+        '''
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self, report_dir=None):
+        '''
+        Clears the records, for a search whose run report (and memory profile) will be saved to report_dir.
+        '''
+
+        with self.lock:
+            self.started = datetime.now()
+            self.report_dir = report_dir
+            self.chunks = []
+            self.chunk_counts = dict()
+
+    @contextmanager
+    def chunk(self, kind):
+        '''
+        Groups the stages recorded in this thread, until the block ends, as one chunk of the given kind ('processing'
+        or 'upload'), and records the block's total time, and its peak resident memory if memory is profiled or has a
+        ceiling. Chunks in other threads (e.g. the pipeline's upload stage) and other memory measurements may overlap
+        this one (see PeakMemory). Also usable as a decorator.
+        '''
+
+        record = {'kind': kind, 'seconds': None, 'stages': []}
+        outer = getattr(self.local, 'record', None)
+        self.local.record = record
+        peak_memory = PeakMemory().start() if Collection.memory_profile or Collection.memory_ceiling_mb else None
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            if peak_memory is not None:
+                memory_used = peak_memory.stop()
+                record['peak_rss_mb'] = to_mb(peak_memory.peak)
+                record['memory_used_mb'] = to_mb(memory_used)
+            self.local.record = outer
+            self.add_chunks([record])
+
+    @contextmanager
+    def stage(self, stage, rows_in=None):
+        '''
+        Times a block as a stage. Yields a dict whose 'rows_out' may be set within the block.
+        '''
+
+        counts = {'rows_out': None}
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.record(stage, time.perf_counter() - start, rows_in, counts['rows_out'])
+
+    def record(self, stage, seconds, rows_in=None, rows_out=None, memory=None):
+        rows = rows_out if rows_out is not None else rows_in
+        entry = {'stage': stage,
+                 'seconds': round(seconds, 6),
+                 'rows_in': rows_in,
+                 'rows_out': rows_out,
+                 'rows_per_second': round(rows / seconds, 1) if rows is not None and seconds > 0 else None}
+        if memory is not None:
+            entry.update(memory)
+            self.write_profile({'event': 'stage', **entry})
+        record = getattr(self.local, 'record', None)
+        if record is not None:
+            record['stages'].append(entry)
+        else:
+            # A stage outside any chunk is a chunk of its own
+            self.add_chunks([{'kind': stage, 'seconds': entry['seconds'], 'stages': [entry]}])
+
+    def record_tables(self, tablenames, list_of_dataframes):
+        '''
+        If memory_profile is True, records the memory taken by each table of the chunk being processed in this thread.
+        '''
+
+        record = getattr(self.local, 'record', None)
+        if not Collection.memory_profile or record is None:
+            return
+        record['tables_mb'] = {tablename: to_mb(dataframe.memory_usage(deep=True).sum())
+                               for tablename, dataframe in zip(tablenames, list_of_dataframes) if dataframe is not None}
+
+    def add_chunks(self, records):
+        '''
+        Adds chunk records, numbering them in order of arrival within their kind. Also used for records sent back by
+        worker processes.
+        '''
+
+        added = []
+        with self.lock:
+            for record in records:
+                count = self.chunk_counts.get(record['kind'], 0) + 1
+                self.chunk_counts[record['kind']] = count
+                added.append({'chunk': count, **record})
+            self.chunks.extend(added)
+
+        for record in added:
+            if 'peak_rss_mb' in record:
+                if Collection.memory_profile:
+                    self.write_profile({'event': 'chunk', **record})
+                self.check_ceiling(record)
+
+    def check_ceiling(self, record):
+        '''
+        Warns if a chunk's peak resident memory came within ceiling_warning_fraction of memory_ceiling_mb, naming the
+        stage that added the most memory, if stages were profiled.
+        '''
+
+        ceiling = Collection.memory_ceiling_mb
+        peak = record['peak_rss_mb']
+        if not ceiling or peak is None or peak < ceiling_warning_fraction * ceiling:
+            return
+
+        growth = [(entry['rss_after_mb'] - entry['rss_before_mb'], entry['stage']) for entry in record['stages']
+                  if entry.get('rss_before_mb') is not None and entry.get('rss_after_mb') is not None]
+        detail = ''
+        if len(growth) > 0:
+            most, stage = max(growth)
+            detail = f'; {stage} added the most ({round(most, 1)} MB)'
+        logging.warning(f'{record["kind"].capitalize()} chunk {record["chunk"]} reached {peak} MB of resident memory, '
+                        f'{round(peak / ceiling * 100)}% of memory_ceiling_mb ({ceiling} MB){detail}. '
+                        f'Set a lower max_chunk_mb to process smaller chunks')
+
+    def write_profile(self, line):
+        '''
+        Appends a line to the memory profile of this search, if it has a report_dir (worker processes have none; their
+        chunks are written once sent back).
+        '''
+
+        if self.report_dir is None:
+            return
+        profile_file = os.path.join(self.report_dir, f'memory_profile_{self.started.strftime("%Y%m%d_%H%M%S")}.jsonl')
+        with self.lock:
+            os.makedirs(self.report_dir, exist_ok=True)
+            with open(profile_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'time': str(datetime.now()), **line}) + '\n')
+
+    def take_chunks(self):
+        '''
+        Returns the chunk records so far and clears them; used by worker processes to send their records back.
+        '''
+
+        with self.lock:
+            chunks = [{key: value for key, value in record.items() if key != 'chunk'} for record in self.chunks]
+            self.chunks = []
+            self.chunk_counts = dict()
+        return chunks
+
+    def summarise(self):
+        '''
+        Returns the chunks and seconds of each kind of chunk, and each stage's calls, seconds, rows in and rows out
+        summed over every chunk, with its rows per second. Rows are None for stages that do not count them.
+        '''
+
+        kinds = dict()
+        stages = dict()
+        with self.lock:
+            for record in self.chunks:
+                kind_totals = kinds.setdefault(record['kind'], {'chunks': 0, 'seconds': 0.0})
+                kind_totals['chunks'] = kind_totals['chunks'] + 1
+                kind_totals['seconds'] = kind_totals['seconds'] + record['seconds']
+                for entry in record['stages']:
+                    totals = stages.setdefault(entry['stage'], {'calls': 0, 'seconds': 0.0, 'rows_in': None, 'rows_out': None})
+                    totals['calls'] = totals['calls'] + 1
+                    totals['seconds'] = totals['seconds'] + entry['seconds']
+                    for rows in ['rows_in', 'rows_out']:
+                        if entry[rows] is not None:
+                            totals[rows] = (totals[rows] or 0) + entry[rows]
+        for totals in kinds.values():
+            totals['seconds'] = round(totals['seconds'], 3)
+        for totals in stages.values():
+            rows = totals['rows_out'] if totals['rows_out'] is not None else totals['rows_in']
+            totals['rows_per_second'] = round(rows / totals['seconds'], 1) if rows is not None and totals['seconds'] > 0 else None
+            totals['seconds'] = round(totals['seconds'], 3)
+
+        return kinds, stages
+
+    def write_report(self, **details):
+        '''
+        Saves the run report (details, a summary per stage and every chunk) to the report_dir given to reset(), and
+        logs the slowest stages. Returns the report's path, or None if there is nothing to report.
+        '''
+
+        kinds, stages = self.summarise()
+        report_dir = self.report_dir
+        if len(stages) == 0 or report_dir is None:
+            return None
+
+        finished = datetime.now()
+        with self.lock:
+            report = {'started': str(self.started),
+                      'finished': str(finished),
+                      **details,
+                      'chunks_by_kind': kinds,
+                      'stages': stages,
+                      'chunks': list(self.chunks)}
+
+        report_file = os.path.join(report_dir, f'run_report_{finished.strftime("%Y%m%d_%H%M%S")}.json')
+        os.makedirs(report_dir, exist_ok=True)
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+        logging.info('Stage timings: ' + ', '.join(f'{kind} {totals["seconds"]}s ({totals["chunks"]} chunks)' for kind, totals in kinds.items()))
+        slowest = sorted(stages.items(), key=lambda item: item[1]['seconds'], reverse=True)[:summary_stages]
+        logging.info('Slowest stages: ' + ', '.join(f'{stage} {totals["seconds"]}s' for stage, totals in slowest))
+        logging.info(f'Run report saved to {report_file}')
+
+        return report_file
+
+
+# One set of timers per process, shared by every module that records stages
+stage_timers = StageTimers()
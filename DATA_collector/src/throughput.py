@@ -0,0 +1,166 @@
+'''
+Contains the throughput history: the tweets handled and time spent in each stage (collection, processing, upload) of
+every search, by schematype, saved to my_collections/throughput_history.json. Search duration estimates are fitted on
+this history, so they reflect this machine, its connection and the chosen schema.
+
+Each stage is recorded with the number of workers it ran on (collection_workers and process_workers in config.yml).
+Estimates are fitted on worker-seconds per tweet, and divided by the workers each stage will run on, so that runs with
+different numbers of workers can be pooled.
+'''
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+
+
+history_filename = 'throughput_history.json'
+
+stages = ['collection', 'processing', 'upload']
+
+# Used until there is history for a schematype: the original estimate, in seconds per tweet, for a whole search
+default_seconds_per_tweet = 0.4784919736026976/2
+
+# Runs kept per schematype; older runs are dropped, so estimates follow changes in machine or connection
+max_runs = 50
+
+
+class StageThroughput:
+
+    def __init__(self):
+        '''
+        Accumulates tweets and busy seconds for each stage of the current search. Thread safe, as collection workers
+        and pipeline stages add to it from their own threads.
+        '''
+
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.tweets = {stage: 0 for stage in stages}
+            self.seconds = {stage: 0.0 for stage in stages}
+
+    def add(self, stage, tweets, seconds):
+        with self.lock:
+            self.tweets[stage] = self.tweets[stage] + tweets
+            self.seconds[stage] = self.seconds[stage] + seconds
+
+    def tweets_per_second(self, stage):
+        if self.seconds[stage] > 0:
+            return self.tweets[stage] / self.seconds[stage]
+        return 0
+
+
+def get_stage_workers(run, stage):
+    '''
+    The workers a stage of a past run ran on. Runs recorded before stages had their own count recorded the collection
+    workers for the whole run, and ran every other stage on one worker.
+    '''
+
+    if 'workers' in run['stages'][stage]:
+        return run['stages'][stage]['workers']
+    if stage == 'collection':
+        return run.get('workers', 1)
+    return 1
+
+
+class ThroughputHistory:
+
+    def __init__(self, history_file):
+        self.history_file = history_file
+        self.lock = threading.Lock()
+
+        if os.path.isfile(history_file):
+            with open(history_file, encoding='utf-8') as f:
+                self.runs = json.load(f)['runs']
+        else:
+            self.runs = []
+
+    def record_run(self, schematype, stage_throughput, workers=None):
+        '''
+        Adds the stages of a completed search to the history, with the workers each stage ran on (a dict of stage to
+        number of workers; 1 for stages not given). Collection time, summed over the collection workers, is divided by
+        their number, to approximate the elapsed time of that stage.
+        '''
+
+        workers = workers or dict()
+        run = {'date': str(datetime.now()), 'schematype': schematype, 'stages': dict()}
+        for stage in stages:
+            if stage_throughput.tweets[stage] > 0:
+                stage_workers = workers.get(stage, 1)
+                seconds = stage_throughput.seconds[stage]
+                if stage == 'collection':
+                    seconds = seconds / stage_workers
+                run['stages'][stage] = {'tweets': stage_throughput.tweets[stage], 'seconds': round(seconds, 3),
+                                        'workers': stage_workers}
+                logging.info(f'{stage.capitalize()}: {stage_throughput.tweets[stage]} tweets at '
+                             f'{round(stage_throughput.tweets_per_second(stage), 1)} tweets/second')
+
+        if len(run['stages']) == 0:
+            return
+
+        with self.lock:
+            self.runs.append(run)
+            # Keep the most recent max_runs runs of each schematype
+            kept = []
+            for previous_run in reversed(self.runs):
+                if sum([1 for other in kept if other['schematype'] == previous_run['schematype']]) < max_runs:
+                    kept.append(previous_run)
+            self.runs = list(reversed(kept))
+            self.save()
+
+    def fit_stage(self, schematype, stage):
+        '''
+        Fits worker_seconds = overhead + seconds_per_tweet * tweets over past runs of one stage, by least squares, where
+        worker_seconds is the stage's elapsed seconds times the workers it ran on. Falls back to a plain ratio (no
+        overhead) when there are too few runs, or the fit is not sensible. Returns (overhead, seconds_per_tweet, number
+        of runs), in worker-seconds, or None if there is no history for the stage.
+        '''
+
+        points = [(run['stages'][stage]['tweets'], run['stages'][stage]['seconds'] * get_stage_workers(run, stage))
+                  for run in self.runs if run['schematype'] == schematype and stage in run['stages']]
+        if len(points) == 0:
+            return None
+
+        tweets = np.array([point[0] for point in points], dtype=float)
+        seconds = np.array([point[1] for point in points], dtype=float)
+
+        if len(points) >= 3 and len(set(tweets)) > 1:
+            seconds_per_tweet, overhead = np.polyfit(tweets, seconds, 1)
+            if seconds_per_tweet > 0 and overhead >= 0:
+                return overhead, seconds_per_tweet, len(points)
+
+        return 0.0, seconds.sum() / tweets.sum(), len(points)
+
+    def estimate(self, tweet_count, schematype, pipeline=False, workers=None):
+        '''
+        Estimates the seconds a search of tweet_count tweets will take, from the fitted time of each stage, divided by
+        the workers it will run on (a dict of stage to number of workers; 1 for stages not given). Stages run one after
+        another, unless pipeline is True, when they overlap and the slowest stage sets the pace. Returns (seconds,
+        number of past runs), or (None, 0) if any stage has no history for this schematype.
+        '''
+
+        workers = workers or dict()
+        stage_seconds = []
+        run_count = 0
+        for stage in stages:
+            fit = self.fit_stage(schematype, stage)
+            if fit is None:
+                return None, 0
+            overhead, seconds_per_tweet, runs = fit
+            stage_seconds.append((overhead + seconds_per_tweet * tweet_count) / max(workers.get(stage, 1), 1))
+            run_count = max(run_count, runs)
+
+        if pipeline:
+            return max(stage_seconds), run_count
+        return sum(stage_seconds), run_count
+
+    def save(self):
+        temp_file = self.history_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump({'runs': self.runs}, f, indent=1)
+        os.replace(temp_file, self.history_file)
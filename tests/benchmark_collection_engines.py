@@ -0,0 +1,133 @@
+'''
+Benchmarks the two collection engines, Twarc ('twarc') and the asyncio engine ('async', see src/async_engine.py),
+against the local mock API in mock_twitter_api.py. Each engine collects the same windows with the same number of
+concurrent workers, through collect_intervals_concurrently() in data.py, and the collected files are compared.
+
+Usage, from the DATA_collector directory (config/config.yml is read for the schema settings, but no request goes to
+Twitter and nothing is uploaded):
+    python ../tests/benchmark_collection_engines.py --windows 8 --workers 4 --latency 0.3
+
+By default requests are paced to the 1 request per second limit of the real API, as in a real collection. With
+--no-pacing that pacing is removed from both engines, to compare their request overheads alone.
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import datetime as dt
+
+sys.path.insert(0, os.getcwd())
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_twitter_api import MockOptions, start_mock_server
+from src import data
+from src.api_client import ArchiveClient, twitter_api_url
+from src.async_engine import AsyncArchiveClient
+
+
+class UnpacedArchiveClient(ArchiveClient):
+    '''
+    Twarc client without the 1.05 second sleep between pages, for --no-pacing.
+    '''
+
+    def search_all(self, query, start_time=None, end_time=None, max_results=100, next_token=None):
+        return self._search(url=f'{twitter_api_url}/2/tweets/search/all', query=query, since_id=None, until_id=None,
+                            start_time=start_time, end_time=end_time, max_results=max_results, expansions=None,
+                            tweet_fields=None, user_fields=None, media_fields=None, poll_fields=None,
+                            place_fields=None, next_token=next_token, sort_order=None, sleep_between=0)
+
+
+def get_windows(start, windows, window_hours, directory):
+    expected_files = dict()
+    for number in range(windows):
+        window_start = start + dt.timedelta(hours=number*window_hours)
+        expected_files[f'{directory}/window_{number}.json'] = (window_start, window_start + dt.timedelta(hours=window_hours))
+    return expected_files
+
+def read_tweets(expected_files):
+    tweets = []
+    for a_file in sorted(expected_files):
+        with open(a_file, encoding='utf-8') as f:
+            tweets.extend([json.loads(line)['id'] for line in f])
+    return tweets
+
+def run_engine(create_client, expected_files, workers, pacing):
+    '''
+    Collects expected_files with clients from create_client, which is also used for the client of each worker thread.
+    Without pacing, the shared rate limiter in collect_intervals_concurrently() is also lifted.
+    '''
+
+    original_create_client, limits = data.create_client, data.SEARCH_ALL_LIMITS
+    data.create_client = create_client
+    if not pacing:
+        data.SEARCH_ALL_LIMITS = [(100000, 1)]
+
+    start = time.perf_counter()
+    try:
+        client = create_client(['benchmark'])
+        collected = list(data.collect_intervals_concurrently(list(expected_files), expected_files, client, 'benchmark',
+                                                             workers, manifest=None))
+    finally:
+        data.create_client, data.SEARCH_ALL_LIMITS = original_create_client, limits
+
+    return len(collected), read_tweets(expected_files), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the twarc and async collection engines against the mock API')
+    parser.add_argument('--windows', type=int, default=8, help='Windows (files) to collect')
+    parser.add_argument('--window-hours', type=int, default=6, help='Length of each window')
+    parser.add_argument('--workers', type=int, default=4, help='Windows collected concurrently')
+    parser.add_argument('--latency', type=float, default=0.3, help='Seconds the mock API takes to respond')
+    parser.add_argument('--tweets-per-day', type=int, default=2000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--connections', type=int, default=10, help='async_connections for the async engine')
+    parser.add_argument('--no-pacing', action='store_true', help='Do not pace requests to 1 per second')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    options = MockOptions(latency=args.latency, tweets_per_day=args.tweets_per_day, page_size=args.page_size,
+                          rate_limit=100000)
+    server = start_mock_server(options=options)
+    api_base_url = f'http://localhost:{server.server_address[1]}'
+    start = dt.datetime(2022, 11, 20, tzinfo=dt.timezone.utc)
+
+    def create_twarc_client(bearer_tokens):
+        if args.no_pacing:
+            return UnpacedArchiveClient(bearer_tokens, api_base_url)
+        return ArchiveClient(bearer_tokens, api_base_url)
+
+    def create_async_client(bearer_tokens):
+        client = AsyncArchiveClient(bearer_tokens, api_base_url, args.connections)
+        if args.no_pacing:
+            client.engine.sleep_between = 0
+        return client
+
+    results = dict()
+    directory = tempfile.mkdtemp(prefix='engine_benchmark_')
+    try:
+        for name, create_client in [('twarc', create_twarc_client), ('async', create_async_client)]:
+            os.makedirs(f'{directory}/{name}')
+            expected_files = get_windows(start, args.windows, args.window_hours, f'{directory}/{name}')
+            results[name] = run_engine(create_client, expected_files, args.workers, not args.no_pacing)
+    finally:
+        shutil.rmtree(directory)
+        server.shutdown()
+
+    print(f'\n{args.windows} windows, {args.workers} workers, {args.latency}s latency, '
+          f'{"no pacing" if args.no_pacing else "paced to 1 request/second"}\n')
+    print(f'{"engine":<8}{"files":>7}{"tweets":>9}{"seconds":>10}{"tweets/s":>11}')
+    for name, (files, tweets, seconds) in results.items():
+        print(f'{name:<8}{files:>7}{len(tweets):>9}{seconds:>10.2f}{len(tweets)/seconds:>11.1f}')
+    print(f'\nSpeed-up: {results["twarc"][2]/results["async"][2]:.2f}x')
+    print(f'Same tweets collected: {results["twarc"][1] == results["async"][1]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+'''
+Benchmarks explode_list_column() in process_tables.py, which un-nests the list columns of a chunk of tweets for every
+table builder, against the .set_index(...).apply(pd.Series).stack() pattern it replaced. Each builder is run on the same
+chunk with both, the resulting tables are compared, and the time taken by each is reported per table.
+
+Tweets are generated by the synthetic archive of mock_twitter_api.py, or read from a collected json file with --input.
+
+Usage, from the DATA_collector directory (config/config.yml must exist, as src/ reads it on import):
+    python ../tests/benchmark_explode.py --tweets 50000
+    python ../tests/benchmark_explode.py --input my_collections/<dataset>/collected_json/<file>.json
+'''
+
+import os
+import sys
+import time
+import argparse
+
+import pandas as pd
+
+sys.path.insert(0, os.getcwd())
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from twarc import expansions
+from mock_twitter_api import MockOptions, SyntheticArchive, to_seconds
+from src import process_tables
+from src.process_tables import ProcessTweets, ProcessTables
+from src.data import build_tweet_chunk
+from src.fields import TWEET_fields
+
+
+def legacy_explode_list_column(frame, key, column):
+    # The pattern previously used by every table builder
+    return frame.set_index([key])[column].apply(pd.Series).stack().reset_index()
+
+def generate_tweets(tweet_count, seed):
+    '''
+    Collects tweet_count flattened tweets from the synthetic archive, page by page, as collect_interval() would.
+    '''
+
+    archive = SyntheticArchive(MockOptions(tweets_per_day=20000, page_size=500, seed=seed))
+    start = to_seconds('2022-01-01T00:00:00Z')
+    end = to_seconds('2022-12-31T00:00:00Z')
+
+    tweets = []
+    next_token = None
+    while len(tweets) < tweet_count:
+        page = archive.search_response('benchmark', start, end, 500, next_token)
+        tweets.extend(expansions.flatten(page))
+        next_token = page['meta'].get('next_token')
+        if next_token is None:
+            break
+
+    return build_tweet_chunk(tweets[:tweet_count])
+
+def read_tweets(input_file, tweet_count):
+    return pd.read_json(input_file, lines=True, dtype=False, nrows=tweet_count)
+
+def build_tweets_table(chunk):
+    '''
+    Builds the TWEETS table from a chunk, as process_tweet_chunk() does before the one-to-many tables are built.
+    '''
+
+    tweets = chunk.rename(columns={'id': 'tweet_id', 'id_str': 'tweet_id'}, errors='ignore')
+    tweets['tweet_id'] = tweets['tweet_id'].astype(object)
+    process_tweets = ProcessTweets()
+    tweets_flat = process_tweets.flatten_top_tweet_level(tweets)
+    reference_levels_list = process_tweets.unpack_referenced_tweets([tweets_flat])
+    TWEETS = process_tweets.move_referenced_tweet_data_up(reference_levels_list, TWEET_fields.up_a_level_column_list)
+    TWEETS = process_tweets.fix_retweet_truncation(TWEETS)
+
+    return tweets_flat, TWEETS
+
+def get_builders(tweets_flat, TWEETS):
+    data_processor = ProcessTables()
+    entities_mentions = data_processor.extract_entities_data(TWEETS)
+
+    return {'referenced_tweets': lambda: pd.concat(ProcessTweets().unpack_referenced_tweets([tweets_flat])[1:]),
+            'mentions': lambda: data_processor.extract_entities_data(TWEETS),
+            'author_description': lambda: data_processor.build_author_description_table(TWEETS, entities_mentions),
+            'author_urls': lambda: data_processor.build_author_urls_table(TWEETS, entities_mentions),
+            'media': lambda: data_processor.build_media_table(TWEETS.copy()),
+            'poll_options': lambda: data_processor.build_poll_options_table(TWEETS),
+            'context_annotations': lambda: data_processor.build_context_annotations_table(TWEETS),
+            'annotations': lambda: data_processor.build_annotations_table(TWEETS),
+            'hashtags': lambda: data_processor.build_hashtags_table(TWEETS),
+            'cashtags': lambda: data_processor.build_cashtags_table(TWEETS),
+            'urls': lambda: data_processor.build_urls_table(TWEETS),
+            'edit_history': lambda: data_processor.build_edit_history_table(TWEETS)}
+
+def time_builder(build, explode, repeats):
+    '''
+    Runs a builder repeats times with the given explode function; returns the fastest time and the table built.
+    '''
+
+    original = process_tables.explode_list_column
+    process_tables.explode_list_column = explode
+    try:
+        times = []
+        for repeat in range(repeats):
+            start = time.perf_counter()
+            table = build()
+            times.append(time.perf_counter() - start)
+    finally:
+        process_tables.explode_list_column = original
+
+    return min(times), table
+
+def same_table(legacy, vectorised):
+    if legacy is None or vectorised is None:
+        return legacy is None and vectorised is None
+    try:
+        pd.testing.assert_frame_equal(legacy.reset_index(drop=True), vectorised.reset_index(drop=True))
+    except AssertionError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark explode_list_column() against .apply(pd.Series).stack()')
+    parser.add_argument('--tweets', type=int, default=50000, help='Tweets in the chunk')
+    parser.add_argument('--input', help='Collected json file to read tweets from, instead of generating them')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs of each builder; the fastest is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.input:
+        chunk = read_tweets(args.input, args.tweets)
+    else:
+        chunk = generate_tweets(args.tweets, args.seed)
+    tweets_flat, TWEETS = build_tweets_table(chunk)
+    print(f'\n{len(chunk)} tweets, {len(TWEETS)} rows in TWEETS (including referenced tweets)\n')
+
+    print(f'{"table":<22}{"rows":>9}{"stack (s)":>12}{"explode (s)":>13}{"speed-up":>10}  same')
+    legacy_total = vectorised_total = 0
+    for name, build in get_builders(tweets_flat, TWEETS).items():
+        legacy_seconds, legacy_table = time_builder(build, legacy_explode_list_column, args.repeats)
+        vectorised_seconds, vectorised_table = time_builder(build, process_tables.explode_list_column, args.repeats)
+        legacy_total = legacy_total + legacy_seconds
+        vectorised_total = vectorised_total + vectorised_seconds
+        rows = len(vectorised_table) if vectorised_table is not None else 0
+        print(f'{name:<22}{rows:>9}{legacy_seconds:>12.3f}{vectorised_seconds:>13.3f}'
+              f'{legacy_seconds/vectorised_seconds:>9.1f}x  {same_table(legacy_table, vectorised_table)}')
+
+    print(f'{"total":<22}{"":>9}{legacy_total:>12.3f}{vectorised_total:>13.3f}{legacy_total/vectorised_total:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+Benchmarks the two flattening engines, pandas ('pandas') and columnar ('columnar', see src/columnar.py), on a collected
+json file. Each engine reads the file in chunks and builds every table from each chunk with process_tweet_chunk(); the
+time taken to read the chunks, to flatten the one-to-one nested columns, and to build all tables is reported, and the
+tables built by the two engines are compared.
+
+Usage, from the DATA_collector directory (config/config.yml is read for the schema settings; nothing is uploaded):
+    python ../tests/benchmark_flatten_engines.py my_collections/<dataset>/collected_json/<file>.json
+'''
+
+import os
+import sys
+import time
+import argparse
+
+import pandas as pd
+
+sys.path.insert(0, os.getcwd())
+
+from src import data, columnar
+from src.config import Collection
+from src.process_tables import ProcessTweets
+
+
+def timed(function):
+    '''
+    Wraps function, adding the time spent in each call to wrapper.seconds.
+    '''
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            wrapper.seconds = wrapper.seconds + time.perf_counter() - start
+    wrapper.seconds = 0
+
+    return wrapper
+
+def run_engine(engine, a_file, chunksize):
+    '''
+    Builds the tables of every chunk of a_file with the given flatten_engine. Returns the tables, and the seconds spent
+    reading, flattening and in total.
+    '''
+
+    original_engine = Collection.flatten_engine
+    original_flatteners = ProcessTweets.flatten_top_tweet_level, columnar.flatten_top_tweet_level
+    Collection.flatten_engine = engine
+    ProcessTweets.flatten_top_tweet_level = timed(ProcessTweets.flatten_top_tweet_level)
+    columnar.flatten_top_tweet_level = timed(columnar.flatten_top_tweet_level)
+
+    tables = []
+    read_seconds = 0
+    start = time.perf_counter()
+    try:
+        with open(a_file, encoding='utf-8') as f:
+            if engine == 'columnar':
+                chunks = data.read_decoded_chunks(f, chunksize)
+            else:
+                chunks = pd.read_json(f, lines=True, dtype=False, chunksize=chunksize)
+            while True:
+                read_start = time.perf_counter()
+                chunk = next(chunks, None)
+                read_seconds = read_seconds + time.perf_counter() - read_start
+                if chunk is None:
+                    break
+                tables.append(data.process_tweet_chunk(chunk))
+        flatten_seconds = ProcessTweets.flatten_top_tweet_level.seconds + columnar.flatten_top_tweet_level.seconds
+    finally:
+        Collection.flatten_engine = original_engine
+        ProcessTweets.flatten_top_tweet_level, columnar.flatten_top_tweet_level = original_flatteners
+
+    return tables, read_seconds, flatten_seconds, time.perf_counter() - start
+
+def same_tables(pandas_tables, columnar_tables):
+    for pandas_chunk, columnar_chunk in zip(pandas_tables, columnar_tables):
+        for pandas_table, columnar_table in zip(pandas_chunk, columnar_chunk):
+            if pandas_table is None or columnar_table is None:
+                if not (pandas_table is None and columnar_table is None):
+                    return False
+                continue
+            try:
+                pd.testing.assert_frame_equal(pandas_table, columnar_table)
+            except AssertionError:
+                return False
+    return len(pandas_tables) == len(columnar_tables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pandas and columnar flattening engines')
+    parser.add_argument('file', help='Collected json file')
+    parser.add_argument('--chunksize', type=int, default=50000, help='Lines per chunk')
+    args = parser.parse_args()
+
+    results = dict()
+    for engine in ['pandas', 'columnar']:
+        results[engine] = run_engine(engine, args.file, args.chunksize)
+
+    tweet_count = sum(len(chunk[0].loc[chunk[0]['reference_level'] == '0']) for chunk in results['pandas'][0])
+    print(f'\n{args.file}: {len(results["pandas"][0])} chunks, {tweet_count} tweets\n')
+    print(f'{"engine":<10}{"read (s)":>10}{"flatten (s)":>13}{"total (s)":>11}{"tweets/s":>10}')
+    for engine, (tables, read_seconds, flatten_seconds, seconds) in results.items():
+        print(f'{engine:<10}{read_seconds:>10.2f}{flatten_seconds:>13.2f}{seconds:>11.2f}{tweet_count/seconds:>10.0f}')
+    print(f'\nSpeed-up: read {results["pandas"][1]/results["columnar"][1]:.2f}x, '
+          f'flatten {results["pandas"][2]/results["columnar"][2]:.2f}x, total {results["pandas"][3]/results["columnar"][3]:.2f}x')
+    print(f'Same tables built: {same_tables(results["pandas"][0], results["columnar"][0])}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+'''
+Benchmarks processing: process_json_data(test=True) on synthetic corpora of 10,000, 100,000 and 1,000,000 tweets (see
+synthetic_corpus.py), for each schematype, reporting tweets per second and peak resident memory. Each run is made in a
+fresh process, so its peak memory is its own. Runs entirely offline: nothing is collected or uploaded.
+
+Corpora are written once to --corpus-dir and reused by later runs with the same size, seed and distribution. The
+distribution of tweets is set with the options of synthetic_corpus.py, e.g. --retweet-ratio 0.6 --max-hashtags 4.
+
+Usage, from the DATA_collector directory (config/config.yml must exist, as src/ reads it on import):
+    python ../tests/benchmark_processing.py
+    python ../tests/benchmark_processing.py --sizes 10000 100000 --schematypes DATA --flatten-engine columnar
+'''
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.getcwd())
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_corpus import write_corpus, add_distribution_arguments, get_distribution
+
+
+schematypes = ['DATA', 'TCAT', 'TweetQuery']
+
+
+def get_corpus(corpus_dir, tweet_count, distribution, seed):
+    '''
+    Returns the path of the corpus of tweet_count tweets, writing it first if it is not already in corpus_dir.
+    '''
+
+    settings = json.dumps(vars(distribution), sort_keys=True)
+    name = hashlib.md5(f'{seed}:{settings}'.encode('utf-8')).hexdigest()[:8]
+    corpus_file = os.path.join(corpus_dir, f'synthetic_{tweet_count}_{name}.json')
+    if not os.path.isfile(corpus_file):
+        os.makedirs(corpus_dir, exist_ok=True)
+        print(f'Writing {tweet_count} tweets to {corpus_file}...')
+        temp_file = corpus_file + '.tmp'
+        write_corpus(temp_file, tweet_count, distribution, seed)
+        os.replace(temp_file, corpus_file)
+
+    return corpus_file
+
+def run_case(corpus_file, schematype, flatten_engine):
+    '''
+    Runs in a fresh worker process: processes corpus_file as schematype with process_json_data(test=True). Returns the
+    seconds taken, the peak resident memory and the memory used above that of the process before it started, in bytes.
+    '''
+
+    from src import data
+    from src.config import Schematype, Collection
+    from src.memory import PeakMemory
+
+    # Tables are logged as they are built
+    logging.disable(logging.INFO)
+    Schematype.DATA = schematype == 'DATA'
+    Schematype.TCAT = schematype == 'TCAT'
+    Schematype.TweetQuery = schematype == 'TweetQuery'
+    if flatten_engine is not None:
+        Collection.flatten_engine = flatten_engine
+
+    peak_memory = PeakMemory().start()
+    start = time.perf_counter()
+    data.process_json_data(corpus_file, '', None, 'benchmark', 'benchmark', 'benchmark', None, None, 0, 0, schematype, test=True)
+    seconds = time.perf_counter() - start
+    memory_used = peak_memory.stop()
+
+    return seconds, peak_memory.peak, memory_used
+
+def run_in_fresh_process(corpus_file, schematype, flatten_engine):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(run_case, corpus_file, schematype, flatten_engine).result()
+
+def to_mb(memory):
+    if memory is None:
+        return None
+    return round(memory / 1024 / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark processing of synthetic tweets, per schematype')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='Tweets per corpus')
+    parser.add_argument('--schematypes', nargs='+', choices=schematypes, default=schematypes)
+    parser.add_argument('--flatten-engine', choices=['pandas', 'columnar'], default=None,
+                        help='flatten_engine to use (default: as in config.yml)')
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'dmrc_benchmark_corpus'),
+                        help='Directory for the synthetic corpora')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic archive')
+    parser.add_argument('--output', help='Also save the results to this json file')
+    add_distribution_arguments(parser)
+    args = parser.parse_args()
+
+    distribution = get_distribution(args)
+    results = []
+    for tweet_count in args.sizes:
+        corpus_file = get_corpus(args.corpus_dir, tweet_count, distribution, args.seed)
+        for schematype in args.schematypes:
+            print(f'Processing {tweet_count} tweets as {schematype}...')
+            seconds, peak_rss, memory_used = run_in_fresh_process(corpus_file, schematype, args.flatten_engine)
+            results.append({'tweets': tweet_count,
+                            'schematype': schematype,
+                            'seconds': round(seconds, 2),
+                            'tweets_per_second': round(tweet_count / seconds, 1),
+                            'peak_rss_mb': to_mb(peak_rss),
+                            'memory_used_mb': to_mb(memory_used)})
+
+    print(f'\n{"tweets":>9}  {"schematype":<12}{"seconds":>9}{"tweets/s":>10}{"peak MB":>10}{"used MB":>10}')
+    for result in results:
+        print(f'{result["tweets"]:>9}  {result["schematype"]:<12}{result["seconds"]:>9.2f}{result["tweets_per_second"]:>10.0f}'
+              f'{result["peak_rss_mb"] or 0:>10.0f}{result["memory_used_mb"] or 0:>10.0f}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'distribution': vars(distribution), 'seed': args.seed, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+'''
+Set-up shared by the unit tests. Modules in DATA_collector/src read config/config.yml from the working directory when
+imported (and may create folders there), so the tests run in a temporary directory holding tests/config/config.yml.
+
+Usage, from the repository root:
+    python -m pytest tests
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(tests_dir), 'DATA_collector'))
+
+work_dir = tempfile.mkdtemp(prefix='dmrc_tests_')
+shutil.copytree(os.path.join(tests_dir, 'config'), os.path.join(work_dir, 'config'))
+os.chdir(work_dir)
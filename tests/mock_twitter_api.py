@@ -0,0 +1,553 @@
+'''
+A local stand-in for the Twitter API v2 full-archive endpoints, /2/tweets/search/all and /2/tweets/counts/all, for
+benchmarking collection offline. Responses are synthetic but shaped like the real API: pages of tweets with includes
+(users, referenced tweets, media, polls and places) for twarc's expansions.flatten, next_token pagination, counts
+buckets aligned to days/hours/minutes, and x-rate-limit headers, with 429 responses once a token's budget is spent.
+
+Tweets are generated deterministically from the query and the time period, so search and counts always agree, and
+repeated runs return the same tweets. Each query gets its own daily volume, with occasional busy days. The mix of
+retweets, replies and quotes, and how often tweets carry each kind of entity, attachment and annotation, can be tuned
+with a TweetDistribution (see synthetic_corpus.py, which writes tweets straight to a json file).
+
+Usage, from the repository root:
+    python tests/mock_twitter_api.py --port 8000 --latency 0.3 --tweets-per-day 2000
+
+then set api_base_url: 'http://localhost:8000' in config.yml (bearer_token may be any string) and run DATA_collector
+as usual. The server can also be started from Python with start_mock_server().
+'''
+
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+import datetime as dt
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# Start of the synthetic timeline; the full-archive search starts at 2006-03-21
+timeline_start = dt.datetime(2006, 3, 21, tzinfo=dt.timezone.utc)
+day_seconds = 86400
+# Twitter snowflake epoch, in milliseconds
+snowflake_epoch = 1288834974657
+
+counts_buckets_per_page = {'day': 31, 'hour': 168, 'minute': 1440}
+bucket_seconds = {'day': 86400, 'hour': 3600, 'minute': 60}
+
+words = ['the', 'news', 'today', 'people', 'vote', 'climate', 'water', 'city', 'game', 'music', 'love', 'time',
+         'market', 'health', 'science', 'school', 'storm', 'fire', 'policy', 'report', 'video', 'photo', 'live',
+         'watch', 'great', 'new', 'big', 'local', 'world', 'update', 'breaking', 'community', 'weekend', 'data']
+hashtags = ['auspol', 'climate', 'news', 'covid19', 'ai', 'sport', 'music', 'qldpol', 'election', 'science']
+cashtags = ['TSLA', 'AAPL', 'BTC', 'ETH', 'GOOG']
+languages = ['en', 'en', 'en', 'en', 'es', 'fr', 'de', 'ja', 'pt', 'und']
+sources = ['Twitter for iPhone', 'Twitter for Android', 'Twitter Web App', 'TweetDeck']
+
+
+class TweetDistribution:
+
+    def __init__(self, retweet_ratio=0.35, reply_ratio=0.15, quote_ratio=0.08, reference_depth=2,
+                 hashtag_ratio=0.4, max_hashtags=1, mention_ratio=0.0, max_mentions=1, url_ratio=0.3, max_urls=1,
+                 cashtag_ratio=0.05, media_ratio=0.2, poll_ratio=0.01, place_ratio=0.02, annotation_ratio=0.2,
+                 context_annotation_ratio=0.3, edit_ratio=0.0, max_edits=1):
+        '''
+        retweet_ratio, reply_ratio, quote_ratio: share of tweets that retweet, reply to or quote another tweet
+        reference_depth: levels of referenced tweets below a tweet (a quoted tweet may itself quote another)
+        hashtag_ratio, mention_ratio, url_ratio: share of tweets with hashtags, mentions of other users (besides
+            the author replied to) or urls; each has from 1 to max_hashtags, max_mentions or max_urls of them
+        cashtag_ratio, media_ratio, place_ratio, annotation_ratio, context_annotation_ratio: share of tweets with one
+            cashtag, media attachment, place, annotation or context annotation
+        poll_ratio: share of tweets without media that have a poll
+        edit_ratio: share of tweets that were edited, from 1 to max_edits times
+        The defaults give the tweets served by the mock API.
+        '''
+
+        self.retweet_ratio = retweet_ratio
+        self.reply_ratio = reply_ratio
+        self.quote_ratio = quote_ratio
+        self.reference_depth = reference_depth
+        self.hashtag_ratio = hashtag_ratio
+        self.max_hashtags = max_hashtags
+        self.mention_ratio = mention_ratio
+        self.max_mentions = max_mentions
+        self.url_ratio = url_ratio
+        self.max_urls = max_urls
+        self.cashtag_ratio = cashtag_ratio
+        self.media_ratio = media_ratio
+        self.poll_ratio = poll_ratio
+        self.place_ratio = place_ratio
+        self.annotation_ratio = annotation_ratio
+        self.context_annotation_ratio = context_annotation_ratio
+        self.edit_ratio = edit_ratio
+        self.max_edits = max_edits
+
+    def has(self, tweet_random, ratio):
+        # Draws nothing for a ratio of 0, so features that are off leave the other tweets unchanged
+        return ratio > 0 and tweet_random.random() < ratio
+
+    def count(self, tweet_random, most):
+        if most <= 1:
+            return 1
+        return tweet_random.randint(1, most)
+
+
+class MockOptions:
+
+    def __init__(self, latency=0.0, jitter=0.0, tweets_per_day=1000, page_size=500, rate_limit=300, rate_window=900,
+                 users=5000, seed=0, distribution=None):
+        '''
+        latency: seconds added to every response (plus up to jitter seconds at random)
+        tweets_per_day: average daily volume for a query
+        page_size: largest page returned by search/all, whatever max_results is requested
+        rate_limit, rate_window: requests allowed per bearer token and endpoint in each window of rate_window seconds
+        users: size of the synthetic user pool
+        distribution: the TweetDistribution of generated tweets
+        '''
+
+        self.latency = latency
+        self.jitter = jitter
+        self.tweets_per_day = tweets_per_day
+        self.page_size = page_size
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.users = users
+        self.seed = seed
+        self.distribution = distribution if distribution is not None else TweetDistribution()
+
+
+class RateLimits:
+
+    def __init__(self, limit, window):
+        '''
+        Fixed-window request budgets, per bearer token and endpoint, as reported in x-rate-limit headers.
+        '''
+
+        self.limit = limit
+        self.window = window
+        self.windows = dict()
+        self.lock = threading.Lock()
+
+    def take(self, token, endpoint):
+        '''
+        Takes one request from the budget. Returns (allowed, remaining, reset).
+        '''
+
+        now = time.time()
+        with self.lock:
+            reset, used = self.windows.get((token, endpoint), (0, 0))
+            if now >= reset:
+                reset, used = int(now + self.window), 0
+            allowed = used < self.limit
+            if allowed:
+                used = used + 1
+            self.windows[(token, endpoint)] = (reset, used)
+
+        return allowed, self.limit - used, reset
+
+
+class SyntheticArchive:
+
+    def __init__(self, options):
+        self.options = options
+
+    def query_seed(self, query):
+        return int(hashlib.md5(f'{self.options.seed}:{query}'.encode('utf-8')).hexdigest()[:8], 16)
+
+    def tweets_on_day(self, seed, day):
+        '''
+        Number of tweets for a query on a day (days since timeline_start). Volume varies from day to day, with an
+        occasional busy day ten times the usual volume.
+        '''
+
+        day_random = random.Random(seed * 100003 + day)
+        volume = self.options.tweets_per_day * (0.2 + 1.6 * day_random.random())
+        if day_random.random() < 0.05:
+            volume = volume * 10
+        return int(volume)
+
+    def day_range(self, seed, day, start, end):
+        '''
+        Tweets on a day are spread evenly through it; returns the (first, last + 1) indexes of the day's tweets that
+        fall between start and end (seconds since timeline_start).
+        '''
+
+        count = self.tweets_on_day(seed, day)
+        if count == 0:
+            return 0, 0
+        spacing = day_seconds / count
+        day_start = day * day_seconds
+        first = max(0, math.ceil((start - day_start) / spacing - 0.5))
+        last = min(count, math.ceil((end - day_start) / spacing - 0.5))
+        return first, max(first, last)
+
+    def tweet_time(self, seed, day, index):
+        count = self.tweets_on_day(seed, day)
+        return day * day_seconds + (index + 0.5) * day_seconds / count
+
+    def count(self, seed, start, end):
+        total = 0
+        for day in range(int(start // day_seconds), int(math.ceil(end / day_seconds))):
+            first, last = self.day_range(seed, day, start, end)
+            total = total + (last - first)
+        return total
+
+    def search_page(self, query, start, end, max_results, next_token):
+        '''
+        Returns up to max_results (seconds, day, index) tweet positions, newest first, and the next_token (or None).
+        The token is the position of the next tweet to return.
+        '''
+
+        seed = self.query_seed(query)
+        if next_token is not None:
+            day, index = [int(part) for part in next_token.split('_')]
+        else:
+            day, index = int(math.ceil(end / day_seconds)) - 1, None
+
+        first_day = int(start // day_seconds)
+        positions = []
+        while day >= first_day:
+            first, last = self.day_range(seed, day, start, end)
+            if index is None:
+                index = last - 1
+            while index >= first:
+                if len(positions) == max_results:
+                    return positions, f'{day}_{index}'
+                positions.append((self.tweet_time(seed, day, index), day, index))
+                index = index - 1
+            day, index = day - 1, None
+
+        return positions, None
+
+    def build_user(self, user_id):
+        user_random = random.Random(user_id)
+        username = f'user{user_id}'
+        description = f'{user_random.choice(words)} {user_random.choice(words)} #{user_random.choice(hashtags)}'
+        return {'id': str(user_id),
+                'username': username,
+                'name': f'User {user_id}',
+                'created_at': '2010-01-01T00:00:00.000Z',
+                'description': description,
+                'entities': {'description': {'hashtags': [{'start': description.index('#'), 'end': len(description),
+                                                           'tag': description.split('#')[1]}]}},
+                'location': user_random.choice(['Brisbane', 'Sydney', 'London', 'New York', '']),
+                'profile_image_url': f'https://pbs.twimg.com/profile_images/{user_id}.jpg',
+                'protected': False,
+                'public_metrics': {'followers_count': user_random.randint(0, 100000),
+                                   'following_count': user_random.randint(0, 5000),
+                                   'tweet_count': user_random.randint(1, 100000),
+                                   'listed_count': user_random.randint(0, 500)},
+                'url': '',
+                'verified': user_random.random() < 0.05}
+
+    def build_text(self, tweet_random, mention):
+        '''
+        Builds tweet text with entities (hashtags, cashtags, mentions and urls) and their character offsets.
+        '''
+
+        distribution = self.options.distribution
+        parts = [tweet_random.choice(words) for i in range(tweet_random.randint(4, 14))]
+        entities = {'hashtags': [], 'cashtags': [], 'mentions': [], 'urls': []}
+
+        text = ''
+        def add(part, entity_type=None, entity=None):
+            nonlocal text
+            if text:
+                text = text + ' '
+            if entity_type is not None:
+                entities[entity_type].append({'start': len(text), 'end': len(text) + len(part), **entity})
+            text = text + part
+
+        if mention is not None:
+            add(f'@{mention}', 'mentions', {'username': mention})
+        for part in parts:
+            add(part)
+        if distribution.has(tweet_random, distribution.mention_ratio):
+            for i in range(distribution.count(tweet_random, distribution.max_mentions)):
+                username = f'user{1000 + tweet_random.randrange(self.options.users)}'
+                add(f'@{username}', 'mentions', {'username': username})
+        if tweet_random.random() < distribution.hashtag_ratio:
+            for i in range(distribution.count(tweet_random, distribution.max_hashtags)):
+                tag = tweet_random.choice(hashtags)
+                add(f'#{tag}', 'hashtags', {'tag': tag})
+        if tweet_random.random() < distribution.cashtag_ratio:
+            tag = tweet_random.choice(cashtags)
+            add(f'${tag}', 'cashtags', {'tag': tag})
+        if tweet_random.random() < distribution.url_ratio:
+            for i in range(distribution.count(tweet_random, distribution.max_urls)):
+                link = f'https://t.co/{tweet_random.getrandbits(32):x}'
+                add(link, 'urls', {'url': link, 'expanded_url': f'https://example.com/{tweet_random.getrandbits(24)}',
+                                   'display_url': 'example.com/…'})
+
+        if tweet_random.random() < distribution.annotation_ratio:
+            # Named entity annotation on the first word
+            start = len(f'@{mention} ') if mention is not None else 0
+            entities['annotations'] = [{'start': start, 'end': start + len(parts[0]) - 1, 'normalized_text': parts[0],
+                                        'probability': round(tweet_random.random(), 4),
+                                        'type': tweet_random.choice(['Person', 'Place', 'Organization', 'Other'])}]
+
+        return text, {key: value for key, value in entities.items() if len(value) > 0}
+
+    def build_tweet(self, tweet_id, seconds, includes, depth=0):
+        '''
+        Builds one tweet, adding the users, media, polls, places and referenced tweets it refers to into includes.
+        About a third of tweets are retweets, and some are replies or quotes; referenced tweets may reference others.
+        '''
+
+        distribution = self.options.distribution
+        tweet_random = random.Random(tweet_id)
+        author_id = 1000 + tweet_random.randrange(self.options.users)
+        includes['users'][str(author_id)] = self.build_user(author_id)
+        created_at = timeline_start + dt.timedelta(seconds=seconds)
+
+        tweet = {'id': str(tweet_id),
+                 'author_id': str(author_id),
+                 'conversation_id': str(tweet_id),
+                 'created_at': created_at.isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+                 'edit_history_tweet_ids': [str(tweet_id)],
+                 'lang': tweet_random.choice(languages),
+                 'possibly_sensitive': tweet_random.random() < 0.02,
+                 'public_metrics': {'retweet_count': tweet_random.randint(0, 50), 'reply_count': tweet_random.randint(0, 10),
+                                    'like_count': tweet_random.randint(0, 200), 'quote_count': tweet_random.randint(0, 5)},
+                 'reply_settings': 'everyone',
+                 'source': tweet_random.choice(sources)}
+
+        reference_type = None
+        if depth < distribution.reference_depth:
+            roll = tweet_random.random()
+            if roll < distribution.retweet_ratio:
+                reference_type = 'retweeted'
+            elif roll < distribution.retweet_ratio + distribution.reply_ratio:
+                reference_type = 'replied_to'
+            elif roll < distribution.retweet_ratio + distribution.reply_ratio + distribution.quote_ratio:
+                reference_type = 'quoted'
+
+        mention = None
+        if reference_type is not None:
+            # Referenced tweets are older than the tweets referencing them
+            referenced_seconds = max(0, seconds - tweet_random.randint(60, 7 * day_seconds))
+            referenced_id = self.snowflake(referenced_seconds, tweet_random.getrandbits(22))
+            referenced = self.build_tweet(referenced_id, referenced_seconds, includes, depth + 1)
+            includes['tweets'][str(referenced_id)] = referenced
+            tweet['referenced_tweets'] = [{'type': reference_type, 'id': str(referenced_id)}]
+            mention = includes['users'][referenced['author_id']]['username']
+            if reference_type == 'replied_to':
+                tweet['in_reply_to_user_id'] = referenced['author_id']
+                tweet['conversation_id'] = referenced['conversation_id']
+
+        if reference_type == 'retweeted':
+            tweet['text'] = f'RT @{mention}: {referenced["text"]}'[:140]
+            tweet['entities'] = {'mentions': [{'start': 3, 'end': 4 + len(mention), 'username': mention}]}
+        else:
+            text, entities = self.build_text(tweet_random, mention if reference_type == 'replied_to' else None)
+            tweet['text'] = text
+            if len(entities) > 0:
+                tweet['entities'] = entities
+
+        for mentioned in tweet.get('entities', {}).get('mentions', []):
+            user_id = int(mentioned['username'][len('user'):])
+            includes['users'][str(user_id)] = self.build_user(user_id)
+
+        if reference_type != 'retweeted':
+            if tweet_random.random() < distribution.media_ratio:
+                media_key = f'3_{tweet_id}'
+                media_type = tweet_random.choice(['photo', 'photo', 'video', 'animated_gif'])
+                tweet['attachments'] = {'media_keys': [media_key]}
+                includes['media'][media_key] = {'media_key': media_key, 'type': media_type,
+                                                'url': f'https://pbs.twimg.com/media/{tweet_id}.jpg',
+                                                'width': 1200, 'height': 800,
+                                                'public_metrics': {'view_count': tweet_random.randint(0, 10000)} if media_type != 'photo' else {}}
+            elif tweet_random.random() < distribution.poll_ratio:
+                poll_id = f'9{tweet_id}'
+                tweet['attachments'] = {'poll_ids': [poll_id]}
+                includes['polls'][poll_id] = {'id': poll_id, 'voting_status': 'closed', 'duration_minutes': 1440,
+                                              'end_datetime': tweet['created_at'],
+                                              'options': [{'position': 1, 'label': 'yes', 'votes': tweet_random.randint(0, 100)},
+                                                          {'position': 2, 'label': 'no', 'votes': tweet_random.randint(0, 100)}]}
+            if tweet_random.random() < distribution.place_ratio:
+                place_id = f'{tweet_random.getrandbits(32):x}'
+                tweet['geo'] = {'place_id': place_id}
+                includes['places'][place_id] = {'id': place_id, 'full_name': 'Brisbane, Queensland', 'country': 'Australia',
+                                                'country_code': 'AU', 'place_type': 'city', 'name': 'Brisbane',
+                                                'geo': {'type': 'Feature', 'bbox': [152.67, -27.77, 153.32, -27.02]}}
+
+        if tweet_random.random() < distribution.context_annotation_ratio:
+            tweet['context_annotations'] = [{'domain': {'id': '10', 'name': 'Person', 'description': 'Named people'},
+                                             'entity': {'id': str(tweet_random.getrandbits(40)), 'name': 'Someone'}}]
+
+        if distribution.has(tweet_random, distribution.edit_ratio):
+            # Earlier versions of the tweet, a few minutes apart, then this one
+            edits = distribution.count(tweet_random, distribution.max_edits)
+            earlier = [str(self.snowflake(max(0, seconds - 300 * (edits - i)), tweet_random.getrandbits(22))) for i in range(edits)]
+            tweet['edit_history_tweet_ids'] = earlier + [str(tweet_id)]
+
+        return tweet
+
+    def snowflake(self, seconds, sequence):
+        milliseconds = int((timeline_start.timestamp() + seconds) * 1000)
+        return ((milliseconds - snowflake_epoch) << 22) | (sequence & 0x3FFFFF)
+
+    def search_response(self, query, start, end, max_results, next_token):
+        seed = self.query_seed(query)
+        positions, next_token = self.search_page(query, start, end, max_results, next_token)
+
+        includes = {'users': dict(), 'tweets': dict(), 'media': dict(), 'polls': dict(), 'places': dict()}
+        data = [self.build_tweet(self.snowflake(seconds, (seed % 1024) << 12 | index % 4096), seconds, includes)
+                for seconds, day, index in positions]
+
+        response = {'data': data,
+                    'includes': {key: list(value.values()) for key, value in includes.items() if len(value) > 0},
+                    'meta': {'result_count': len(data)}}
+        if len(data) > 0:
+            response['meta']['newest_id'] = data[0]['id']
+            response['meta']['oldest_id'] = data[-1]['id']
+        else:
+            del response['data']
+            del response['includes']
+        if next_token is not None:
+            response['meta']['next_token'] = next_token
+
+        return response
+
+    def counts_response(self, query, start, end, granularity, next_token):
+        '''
+        Buckets start at start_time, then at each day/hour/minute boundary, as in the real API.
+        '''
+
+        seed = self.query_seed(query)
+        length = bucket_seconds[granularity]
+        bucket_start = float(next_token) if next_token is not None else start
+
+        data = []
+        while bucket_start < end and len(data) < counts_buckets_per_page[granularity]:
+            bucket_end = min(end, (bucket_start // length + 1) * length)
+            data.append({'start': to_timestamp(bucket_start), 'end': to_timestamp(bucket_end),
+                         'tweet_count': self.count(seed, bucket_start, bucket_end)})
+            bucket_start = bucket_end
+
+        response = {'data': data, 'meta': {'total_tweet_count': sum([bucket['tweet_count'] for bucket in data])}}
+        if bucket_start < end:
+            response['meta']['next_token'] = repr(bucket_start)
+
+        return response
+
+
+def to_seconds(timestamp):
+    '''
+    Seconds since timeline_start for an API timestamp, e.g. '2022-11-22T00:00:00Z'.
+    '''
+
+    date = dt.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    return (date - timeline_start).total_seconds()
+
+def to_timestamp(seconds):
+    date = timeline_start + dt.timedelta(seconds=seconds)
+    return date.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+class MockTwitterHandler(BaseHTTPRequestHandler):
+
+    # Set by start_mock_server()
+    archive = None
+    rate_limits = None
+    options = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        endpoints = {'/2/tweets/search/all': self.search_all,
+                     '/2/tweets/counts/all': self.counts_all}
+
+        if url.path not in endpoints:
+            return self.send_json(404, {'title': 'Not Found Error', 'detail': f'No endpoint {url.path}'})
+
+        authorization = self.headers.get('Authorization', '')
+        if not authorization.startswith('Bearer '):
+            return self.send_json(401, {'title': 'Unauthorized', 'detail': 'Unauthorized', 'status': 401})
+
+        allowed, remaining, reset = self.rate_limits.take(authorization, url.path)
+        rate_limit_headers = {'x-rate-limit-limit': self.options.rate_limit,
+                              'x-rate-limit-remaining': remaining,
+                              'x-rate-limit-reset': reset}
+        if not allowed:
+            return self.send_json(429, {'title': 'Too Many Requests', 'detail': 'Too Many Requests', 'status': 429},
+                                  rate_limit_headers)
+
+        if 'query' not in params:
+            return self.send_json(400, {'title': 'Invalid Request', 'detail': "The 'query' parameter is required"},
+                                  rate_limit_headers)
+
+        time.sleep(self.options.latency + random.random() * self.options.jitter)
+        self.send_json(200, endpoints[url.path](params), rate_limit_headers)
+
+    def search_all(self, params):
+        start, end = self.get_period(params)
+        max_results = min(int(params.get('max_results', 10)), self.options.page_size)
+        return self.archive.search_response(params['query'], start, end, max_results, params.get('next_token'))
+
+    def counts_all(self, params):
+        start, end = self.get_period(params)
+        granularity = params.get('granularity', 'hour')
+        return self.archive.counts_response(params['query'], start, end, granularity, params.get('next_token'))
+
+    def get_period(self, params):
+        now = (dt.datetime.now(dt.timezone.utc) - timeline_start).total_seconds()
+        start = to_seconds(params['start_time']) if 'start_time' in params else now - 30 * day_seconds
+        end = to_seconds(params['end_time']) if 'end_time' in params else now
+        return max(0, start), end
+
+    def send_json(self, status, body, headers=None):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or dict()).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def start_mock_server(host='localhost', port=0, options=None):
+    '''
+    Starts the mock API in a background thread and returns the server; its base URL is
+    f'http://{host}:{server.server_address[1]}'. Call server.shutdown() to stop it.
+    '''
+
+    options = options or MockOptions()
+    handler = type('Handler', (MockTwitterHandler,), {'archive': SyntheticArchive(options),
+                                                      'rate_limits': RateLimits(options.rate_limit, options.rate_window),
+                                                      'options': options})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local mock of the Twitter API v2 full-archive search and counts endpoints.')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many extra seconds, at random')
+    parser.add_argument('--tweets-per-day', type=int, default=1000, help='Average daily volume for a query')
+    parser.add_argument('--page-size', type=int, default=500, help='Largest page returned by search/all')
+    parser.add_argument('--rate-limit', type=int, default=300, help='Requests per token and endpoint per window')
+    parser.add_argument('--rate-window', type=int, default=900, help='Rate limit window, in seconds')
+    parser.add_argument('--users', type=int, default=5000, help='Size of the synthetic user pool')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    options = MockOptions(args.latency, args.jitter, args.tweets_per_day, args.page_size, args.rate_limit,
+                          args.rate_window, args.users, args.seed)
+    server = start_mock_server(args.host, args.port, options)
+    print(f'Mock Twitter API listening on http://{args.host}:{server.server_address[1]}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,78 @@
+'''
+Writes a synthetic corpus of tweets: a json file of Twarc-flattened tweets, one per line, as collect_interval() writes
+them, generated by the synthetic archive of mock_twitter_api.py. The same arguments always give the same file.
+
+The mix of retweets, replies and quotes, the depth of referenced tweets, and how often tweets carry hashtags, mentions,
+urls, media, polls, annotations and edit history are set with the options of TweetDistribution (see
+mock_twitter_api.py); run with --help to list them.
+
+Usage, from the repository root:
+    python tests/synthetic_corpus.py corpus.json --tweets 100000 --retweet-ratio 0.6 --max-hashtags 4 --edit-ratio 0.1
+'''
+
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from twarc import expansions
+from mock_twitter_api import MockOptions, SyntheticArchive, TweetDistribution, to_seconds
+
+
+# Tweets are taken from this period, newest first; at tweets_per_day, it holds several million
+corpus_start = '2022-01-01T00:00:00Z'
+corpus_end = '2022-12-31T00:00:00Z'
+tweets_per_day = 20000
+page_size = 500
+
+
+def write_corpus(corpus_file, tweet_count, distribution=None, seed=0):
+    '''
+    Writes tweet_count flattened tweets to corpus_file. Returns the number written, which is less than tweet_count only
+    if the synthetic archive runs out of tweets.
+    '''
+
+    archive = SyntheticArchive(MockOptions(tweets_per_day=tweets_per_day, page_size=page_size, seed=seed,
+                                           distribution=distribution))
+    start = to_seconds(corpus_start)
+    end = to_seconds(corpus_end)
+
+    written = 0
+    next_token = None
+    with open(corpus_file, 'w', encoding='utf-8') as f:
+        while written < tweet_count:
+            page = archive.search_response('corpus', start, end, page_size, next_token)
+            for tweet in expansions.flatten(page)[:tweet_count - written]:
+                f.write(json.dumps(tweet) + '\n')
+                written = written + 1
+            next_token = page['meta'].get('next_token')
+            if next_token is None:
+                break
+
+    return written
+
+def add_distribution_arguments(parser):
+    # One option per setting of TweetDistribution, e.g. --retweet-ratio, with the same default
+    for name, default in vars(TweetDistribution()).items():
+        parser.add_argument(f'--{name.replace("_", "-")}', type=type(default), default=default)
+
+def get_distribution(args):
+    return TweetDistribution(**{name: getattr(args, name) for name in vars(TweetDistribution())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic corpus of Twarc-flattened tweets')
+    parser.add_argument('file', help='json file to write')
+    parser.add_argument('--tweets', type=int, default=10000, help='Tweets to write')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic archive')
+    add_distribution_arguments(parser)
+    args = parser.parse_args()
+
+    written = write_corpus(args.file, args.tweets, get_distribution(args), args.seed)
+    print(f'Wrote {written} tweets to {args.file}')
+
+
+if __name__ == '__main__':
+    main()
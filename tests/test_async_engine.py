@@ -0,0 +1,127 @@
+import json
+import time
+import datetime as dt
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from src import data
+from src.api_client import ArchiveClient
+from src.async_engine import AsyncArchiveClient, AsyncEngine, search_all_path
+from src.rate_limit import RateLimiter
+
+from tests.mock_twitter_api import MockOptions, start_mock_server
+
+
+start = dt.datetime(2022, 3, 1, tzinfo=dt.timezone.utc)
+end = start + dt.timedelta(days=1)
+
+
+def start_server(**options):
+    server = start_mock_server(options=MockOptions(tweets_per_day=300, page_size=100, **options))
+    return server, f'http://localhost:{server.server_address[1]}'
+
+@pytest.fixture
+def mock_api():
+    server, base_url = start_server()
+    yield server, base_url
+    server.shutdown()
+
+def async_client(tokens, base_url, sleep_between=0.0):
+    # An engine of its own, so that requests need not be paced as for the live API
+    client = AsyncArchiveClient(tokens, base_url)
+    client.engine = AsyncEngine(base_url, 2, sleep_between=sleep_between)
+    return client
+
+def search(client, **kwargs):
+    pages = list(client.search_all(query='cats', start_time=start, end_time=end, max_results=100, **kwargs))
+    if isinstance(client, AsyncArchiveClient):
+        client.engine.close()
+    return pages
+
+def exhaust(server, token, path=search_all_path):
+    # Uses up the mock's budget for a token, as if another process had
+    while server.RequestHandlerClass.rate_limits.take(f'Bearer {token}', path)[0]:
+        pass
+
+def read_tweets(a_file):
+    # Tweets written by collect_interval(), less the time each page was retrieved
+    with open(a_file) as f:
+        tweets = [json.loads(line) for line in f]
+    for tweet in tweets:
+        del tweet['__twarc']['retrieved_at']
+    return tweets
+
+def without_twarc_metadata(pages):
+    return [{key: value for key, value in page.items() if key != '__twarc'} for page in pages]
+
+
+def test_same_pages_as_twarc(mock_api):
+    server, base_url = mock_api
+    twarc_pages = search(ArchiveClient(['twarc-token'], base_url))
+    async_pages = search(async_client(['async-token'], base_url))
+
+    # Several pages, followed through next_token
+    assert len(twarc_pages) > 1
+    assert 'next_token' in twarc_pages[0]['meta']
+    assert without_twarc_metadata(async_pages) == without_twarc_metadata(twarc_pages)
+    assert all('__twarc' in page for page in async_pages)
+
+def test_resumes_from_next_token(mock_api):
+    server, base_url = mock_api
+    pages = search(async_client(['resume-token'], base_url))
+    resumed = search(async_client(['resume-token'], base_url), next_token=pages[0]['meta']['next_token'])
+
+    assert without_twarc_metadata(resumed) == without_twarc_metadata(pages[1:])
+
+def test_rate_limited_token_is_switched(mock_api):
+    server, base_url = mock_api
+    tokens = ['rotate-token-1', 'rotate-token-2']
+    exhaust(server, tokens[0])
+    client = async_client(tokens, base_url)
+    started = time.monotonic()
+    pages = search(client)
+
+    # The first token is refused once, then the second makes every request, without waiting for a reset
+    assert len(pages) > 1
+    assert client.token_pool.rate_limited == {tokens[0]: 1, tokens[1]: 0}
+    assert client.token_pool.requests[tokens[1]] == len(pages)
+    assert time.monotonic() - started < 5
+
+def test_waits_for_reset_when_every_token_is_limited():
+    server, base_url = start_server(rate_window=2)
+    try:
+        exhaust(server, 'reset-token')
+        client = async_client(['reset-token'], base_url)
+        started = time.monotonic()
+        pages = search(client)
+
+        assert len(pages) > 1
+        assert client.token_pool.rate_limited['reset-token'] == 1
+        assert time.monotonic() - started >= 1
+    finally:
+        server.shutdown()
+
+def test_requests_paced_per_token(mock_api):
+    server, base_url = mock_api
+    started = time.monotonic()
+    pages = search(async_client(['paced-token'], base_url, sleep_between=0.3))
+
+    assert time.monotonic() - started >= 0.3 * (len(pages) - 1)
+
+def test_collect_interval_paced_by_shared_rate_limiter(mock_api, tmp_path):
+    server, base_url = mock_api
+    twarc_file = data.collect_interval(ArchiveClient(['twarc-file-token'], base_url), 'cats', start, end, str(tmp_path / 'twarc.json'))
+
+    # Each page takes a token from the shared rate limiter, whose bucket holds one request per 0.3s
+    client = async_client(['limiter-token'], base_url)
+    started = time.monotonic()
+    async_file = data.collect_interval(client, 'cats', start, end, str(tmp_path / 'async.json'), rate_limiter=RateLimiter([(1, 0.3)]))
+    elapsed = time.monotonic() - started
+    client.engine.close()
+
+    pages = client.token_pool.requests['limiter-token']
+    assert pages > 1
+    assert elapsed >= 0.3 * (pages - 1)
+    assert read_tweets(async_file) == read_tweets(twarc_file)
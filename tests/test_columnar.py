@@ -0,0 +1,79 @@
+import json
+
+import pandas as pd
+import pytest
+
+from src import data, columnar
+from src.config import Collection
+from src.process_tables import one_to_one_nested_cols
+
+from tests.mock_twitter_api import TweetDistribution
+from tests.synthetic_corpus import write_corpus
+
+
+@pytest.fixture(scope='module')
+def tweets(tmp_path_factory):
+    corpus_file = str(tmp_path_factory.mktemp('corpus') / 'corpus.json')
+    write_corpus(corpus_file, 300, TweetDistribution(mention_ratio=0.3, max_hashtags=3, edit_ratio=0.1, poll_ratio=0.1), seed=5)
+    with open(corpus_file) as f:
+        return [json.loads(line) for line in f]
+
+def write_tweets(a_file, tweets):
+    with open(a_file, 'w') as f:
+        for tweet in tweets:
+            f.write(json.dumps(tweet) + '\n')
+    return a_file
+
+def build_tables(a_file, engine, monkeypatch):
+    monkeypatch.setattr(Collection, 'flatten_engine', engine)
+    return list(data.iter_processed_chunks(a_file, 'DATA'))
+
+def assert_same_tables(a_file, monkeypatch):
+    pandas_chunks = build_tables(a_file, 'pandas', monkeypatch)
+    columnar_chunks = build_tables(a_file, 'columnar', monkeypatch)
+
+    assert len(columnar_chunks) == len(pandas_chunks) > 0
+    for pandas_tables, columnar_tables in zip(pandas_chunks, columnar_chunks):
+        assert len(columnar_tables) == len(pandas_tables)
+        for pandas_table, columnar_table in zip(pandas_tables, columnar_tables):
+            # Tables with no rows in a chunk are None
+            if pandas_table is None:
+                assert columnar_table is None
+                continue
+            pd.testing.assert_frame_equal(columnar_table, pandas_table)
+
+def can_flatten(tweets):
+    # As process_tweet_chunk() passes a chunk to the columnar engine
+    chunk = data.build_tweet_chunk(tweets).rename(columns={'id': 'tweet_id'})
+    return columnar.can_flatten(chunk, [nested_col for nested_col in one_to_one_nested_cols if nested_col in chunk.columns])
+
+
+@pytest.mark.parametrize('chunksize', [50000, 70])
+def test_same_tables_as_pandas(tweets, chunksize, tmp_path, monkeypatch):
+    monkeypatch.setattr(data, 'get_chunksize', lambda schematype: chunksize)
+    assert can_flatten(tweets)
+    assert_same_tables(write_tweets(str(tmp_path / 'corpus.json'), tweets), monkeypatch)
+
+def test_duplicate_ids_fall_back_to_pandas(tweets, tmp_path, monkeypatch):
+    # The same tweets collected twice, e.g. by overlapping queries
+    tweets = tweets + tweets[:5]
+    assert not can_flatten(tweets)
+    assert_same_tables(write_tweets(str(tmp_path / 'duplicates.json'), tweets), monkeypatch)
+
+def test_missing_ids_fall_back_to_pandas(tweets, tmp_path, monkeypatch):
+    tweets = [dict(tweet) for tweet in tweets]
+    del tweets[3]['id']
+    assert not can_flatten(tweets)
+    assert_same_tables(write_tweets(str(tmp_path / 'missing.json'), tweets), monkeypatch)
+
+@pytest.mark.parametrize('nested_col, value', [('public_metrics', 'unavailable'), ('geo', [])])
+def test_non_dict_nested_values_fall_back_to_pandas(tweets, nested_col, value, tmp_path, monkeypatch):
+    tweets = [dict(tweet) for tweet in tweets]
+    tweets[3][nested_col] = value
+    assert not can_flatten(tweets)
+    assert_same_tables(write_tweets(str(tmp_path / 'non_dict.json'), tweets), monkeypatch)
+
+def test_fallback_is_taken(tweets, monkeypatch):
+    chunk = data.build_tweet_chunk(tweets + tweets[:1]).rename(columns={'id': 'tweet_id'})
+    assert columnar.flatten_top_tweet_level(chunk) is None
+    assert columnar.flatten_top_tweet_level(chunk.drop_duplicates('tweet_id')) is not None
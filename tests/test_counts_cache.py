@@ -0,0 +1,83 @@
+import datetime as dt
+
+import pytest
+
+from src import counts_cache
+from src.counts_cache import CountsCache
+
+
+start = dt.datetime(2022, 1, 1, tzinfo=dt.timezone.utc)
+day = dt.timedelta(days=1)
+
+
+class CountsFetcher:
+    '''
+    Stands in for the counts_all endpoint: 100 tweets per whole day (partial days pro rata), recording each fetch.
+    '''
+
+    def __init__(self, tweets_per_day=100):
+        self.tweets_per_day = tweets_per_day
+        self.fetches = []
+
+    def __call__(self, fetch_start, fetch_end):
+        self.fetches.append((fetch_start, fetch_end))
+        buckets = []
+        bucket_start = fetch_start
+        while bucket_start < fetch_end:
+            bucket_end = min(counts_cache.floor_to_bucket(bucket_start, 'day') + day, fetch_end)
+            buckets.append((bucket_start, bucket_end, round(self.tweets_per_day * ((bucket_end - bucket_start) / day))))
+            bucket_start = bucket_end
+        return buckets
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(counts_cache, 'utc_now', lambda: start + 30 * day)
+    return CountsCache(str(tmp_path / 'counts_cache.sqlite'))
+
+
+def test_cached_buckets_are_not_fetched_again(cache):
+    fetch = CountsFetcher()
+    first = cache.get_counts('cats', start, start + 5 * day, 'day', fetch)
+    assert len(first) == 5
+    assert fetch.fetches == [(start, start + 5 * day)]
+
+    fetch = CountsFetcher()
+    second = cache.get_counts('cats', start + 2 * day, start + 7 * day, 'day', fetch)
+    assert fetch.fetches == [(start + 5 * day, start + 7 * day)]
+    assert [bucket[0] for bucket in second] == [start + i * day for i in range(2, 7)]
+
+def test_queries_differing_in_spacing_share_buckets(cache):
+    cache.get_counts('cats  OR dogs', start, start + 3 * day, 'day', CountsFetcher())
+    fetch = CountsFetcher()
+    cache.get_counts(' cats OR dogs', start, start + 3 * day, 'day', fetch)
+
+    assert fetch.fetches == []
+
+def test_partial_buckets_are_always_fetched(cache):
+    period_start = start + dt.timedelta(hours=12)
+    cache.get_counts('cats', period_start, start + 3 * day, 'day', CountsFetcher())
+    fetch = CountsFetcher()
+    counts = cache.get_counts('cats', period_start, start + 3 * day, 'day', fetch)
+
+    assert fetch.fetches == [(period_start, start + day)]
+    assert counts[0] == (period_start, start + day, 50)
+
+def test_recent_buckets_are_not_cached(cache, monkeypatch):
+    now = start + 30 * day
+    recent_start = now - 3 * day
+    cache.get_counts('cats', recent_start, recent_start + 3 * day, 'day', CountsFetcher(100))
+
+    # Only the day that ended at least 48 hours ago is kept
+    fetch = CountsFetcher(200)
+    counts = cache.get_counts('cats', recent_start, recent_start + 3 * day, 'day', fetch)
+    assert fetch.fetches == [(recent_start + day, recent_start + 3 * day)]
+    assert [bucket[2] for bucket in counts] == [100, 200, 200]
+
+    # Once they are old enough, buckets are cached
+    monkeypatch.setattr(counts_cache, 'utc_now', lambda: now + 5 * day)
+    cache.get_counts('cats', recent_start, recent_start + 3 * day, 'day', CountsFetcher(300))
+    fetch = CountsFetcher(400)
+    counts = cache.get_counts('cats', recent_start, recent_start + 3 * day, 'day', fetch)
+    assert fetch.fetches == []
+    assert [bucket[2] for bucket in counts] == [100, 300, 300]
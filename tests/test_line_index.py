@@ -0,0 +1,90 @@
+import os
+import json
+
+import pytest
+
+from src import line_index
+from src.line_index import LineIndex, get_line_index, has_truncated_final_line, index_suffix
+
+
+def write_lines(tmp_path, lines, name='tweets.json'):
+    a_file = str(tmp_path / name)
+    with open(a_file, 'w', encoding='utf-8') as f:
+        f.write(''.join(lines))
+    return a_file
+
+def tweet_lines(count):
+    return [json.dumps({'id': str(i), 'text': 'a' * (i % 7)}) + '\n' for i in range(count)]
+
+
+def test_index_counts_lines_and_tweets(tmp_path):
+    lines = tweet_lines(10)
+    lines.insert(4, '\n')
+    index = LineIndex.build(write_lines(tmp_path, lines))
+
+    assert index.line_count == 11
+    assert index.tweet_count == 10
+    assert not index.truncated
+    assert index.read_lines(0, 11).decode() == ''.join(lines)
+
+def test_final_line_without_newline(tmp_path):
+    lines = tweet_lines(3)
+    complete = LineIndex.build(write_lines(tmp_path, lines[:2] + [lines[2].rstrip('\n')], 'complete.json'))
+    truncated_file = write_lines(tmp_path, lines[:2] + [lines[2][:10]], 'truncated.json')
+    truncated = LineIndex.build(truncated_file)
+
+    assert complete.line_count == 3 and not complete.truncated
+    assert truncated.line_count == 2 and truncated.truncated_bytes == 10
+    assert has_truncated_final_line(truncated_file)
+    # The truncated line is left out of every range
+    assert list(truncated.iter_lines(0, truncated.line_count)) == lines[:2]
+
+def test_iter_lines_across_blocks(tmp_path, monkeypatch):
+    lines = tweet_lines(100)
+    index = LineIndex.build(write_lines(tmp_path, lines))
+    # Blocks smaller than a line are read a line at a time
+    for block_bytes in [5, 64, 1000]:
+        monkeypatch.setattr(line_index, 'scan_block_bytes', block_bytes)
+        assert list(index.iter_lines(0, 100)) == lines
+        assert list(index.iter_lines(30, 70)) == lines[30:70]
+
+def test_scan_in_blocks(tmp_path, monkeypatch):
+    a_file = write_lines(tmp_path, tweet_lines(100))
+    expected = LineIndex.build(a_file).starts
+    monkeypatch.setattr(line_index, 'scan_block_bytes', 16)
+
+    assert (LineIndex.build(a_file).starts == expected).all()
+
+@pytest.mark.parametrize('parts', [1, 2, 3, 7, 200])
+def test_split_covers_every_line_once(tmp_path, parts):
+    index = LineIndex.build(write_lines(tmp_path, tweet_lines(50)))
+    ranges = index.split(parts)
+
+    assert ranges[0][0] == 0 and ranges[-1][1] == 50
+    assert all(stop == next_start for (start, stop), (next_start, next_stop) in zip(ranges, ranges[1:]))
+    assert all(start < stop for start, stop in ranges)
+    assert len(ranges) <= parts
+
+def test_split_empty_file(tmp_path):
+    assert LineIndex.build(write_lines(tmp_path, [])).split(4) == []
+
+def test_iter_line_chunks_gives_row_numbers(tmp_path):
+    lines = tweet_lines(5)
+    lines.insert(2, '\n')
+    index = LineIndex.build(write_lines(tmp_path, lines))
+
+    # The blank line holds no tweet, so is not counted in the rows before later chunks
+    assert [first_row for first_row, data in index.iter_line_chunks(0, 6, 2)] == [0, 2, 3]
+
+def test_saved_index_is_reused_until_file_changes(tmp_path):
+    a_file = write_lines(tmp_path, tweet_lines(5))
+    assert get_line_index(a_file).line_count == 5
+    assert os.path.isfile(a_file + index_suffix)
+
+    with open(a_file, 'a', encoding='utf-8') as f:
+        f.write(tweet_lines(6)[5])
+    assert get_line_index(a_file).line_count == 6
+
+def test_compressed_file_cannot_be_indexed(tmp_path):
+    with pytest.raises(ValueError):
+        get_line_index(str(tmp_path / 'tweets.json.gz'))
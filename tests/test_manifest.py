@@ -0,0 +1,175 @@
+import os
+import datetime as dt
+
+import pytest
+
+from src import data
+from src.config import Collection
+from src.set_up_directories import set_up_expected_files
+from src.manifest import CollectionManifest, StreamProgress
+
+
+class FakeClient:
+    '''
+    Returns the given tweets from search_all, newest first, in pages of 100, as the API does.
+    '''
+
+    def __init__(self, tweet_ids):
+        self.tweet_ids = tweet_ids
+
+    def search_all(self, **kwargs):
+        self.searches = getattr(self, 'searches', 0) + 1
+        for page_start in range(0, len(self.tweet_ids), 100):
+            page_ids = self.tweet_ids[page_start:page_start + 100]
+            yield {'data': [{'id': str(tweet_id), 'text': 'a tweet', 'author_id': '1'} for tweet_id in page_ids], 'meta': {}}
+
+
+@pytest.fixture
+def a_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(Collection, 'keep_raw_json', False)
+    return str(tmp_path / 'window.json')
+
+def stream(a_file, tweet_ids, chunksize=250, stop_after_uploads=None):
+    '''
+    Streams a window as collect_archive_data() does, recording each StreamProgress once the chunks before it are
+    "uploaded". Returns the tweet ids uploaded. If stop_after_uploads is given, stops (as if interrupted) after that many
+    chunks are uploaded.
+    '''
+
+    manifest = CollectionManifest(os.path.dirname(a_file))
+    uploaded = []
+    chunks = 0
+    for item in data.collect_interval_chunks(FakeClient(tweet_ids), 'query', 'start', 'end', a_file, chunksize, manifest=manifest):
+        if isinstance(item, StreamProgress):
+            item.record()
+            continue
+        if chunks == stop_after_uploads:
+            break
+        uploaded.extend(int(tweet_id) for tweet_id in item['id'])
+        chunks = chunks + 1
+    return uploaded
+
+
+def test_manifest_records_pages_and_resumes(tmp_path):
+    a_file = str(tmp_path / 'window.json')
+    manifest = CollectionManifest(str(tmp_path))
+    manifest.start_window(a_file, 'query', 'start', 'end')
+    with open(a_file, 'w') as f:
+        f.write('page one\n')
+    manifest.record_page(a_file, 'token1', 100, os.path.getsize(a_file))
+    with open(a_file, 'a') as f:
+        f.write('half a page')
+
+    # A new manifest reads the saved one, and resumes after the last recorded page
+    manifest = CollectionManifest(str(tmp_path))
+    assert manifest.resume_window(a_file, 'query', 'start', 'end') == 'token1'
+    with open(a_file) as f:
+        assert f.read() == 'page one\n'
+    assert not manifest.is_complete(a_file)
+
+    manifest.complete_window(a_file)
+    assert CollectionManifest(str(tmp_path)).is_complete(a_file)
+
+def test_compressed_window_restarts(tmp_path):
+    a_file = str(tmp_path / 'window.json.gz')
+    manifest = CollectionManifest(str(tmp_path))
+    manifest.start_window(a_file, 'query', 'start', 'end')
+    with open(a_file, 'w') as f:
+        f.write('page one\n')
+    manifest.record_page(a_file, 'token1', 100, None)
+
+    assert manifest.resume_window(a_file, 'query', 'start', 'end') is None
+    assert not os.path.isfile(a_file)
+    assert manifest.get_window(a_file)['pages'] == 0
+
+def test_streamed_window_completes_after_last_upload(a_file):
+    tweet_ids = list(range(1000, 0, -1))
+    manifest = CollectionManifest(os.path.dirname(a_file))
+    items = list(data.collect_interval_chunks(FakeClient(tweet_ids), 'query', 'start', 'end', a_file, 300, manifest=manifest))
+
+    # Every chunk is followed by its StreamProgress, and nothing is complete until they are recorded
+    assert [type(item) for item in items] == [data.pd.DataFrame, StreamProgress] * 4
+    assert [item.complete for item in items[1::2]] == [False, False, False, True]
+    assert not manifest.is_complete(a_file)
+    for item in items[1::2]:
+        item.record()
+    assert manifest.is_complete(a_file)
+    assert manifest.get_uploaded_chunks(a_file) == [[300, '701'], [300, '401'], [300, '101'], [100, '1']]
+
+def test_empty_streamed_window_completes(a_file):
+    manifest = CollectionManifest(os.path.dirname(a_file))
+    items = list(data.collect_interval_chunks(FakeClient([]), 'query', 'start', 'end', a_file, 300, manifest=manifest))
+
+    assert len(items) == 1 and items[0].complete
+    items[0].record()
+    assert manifest.is_complete(a_file)
+
+def test_restarted_stream_skips_uploaded_chunks(a_file):
+    tweet_ids = list(range(1000, 0, -1))
+    uploaded = stream(a_file, tweet_ids, stop_after_uploads=2)
+    assert not CollectionManifest(os.path.dirname(a_file)).is_complete(a_file)
+
+    uploaded = uploaded + stream(a_file, tweet_ids)
+    assert uploaded == tweet_ids
+    assert CollectionManifest(os.path.dirname(a_file)).is_complete(a_file)
+
+def test_restarted_stream_with_changed_tweets_uploads_again(a_file):
+    tweet_ids = list(range(1000, 0, -1))
+    uploaded = stream(a_file, tweet_ids, stop_after_uploads=3)
+
+    # A tweet in the second chunk was deleted: the first chunk is still skipped, the rest is uploaded again
+    tweet_ids.remove(600)
+    uploaded = uploaded + stream(a_file, tweet_ids)
+    assert set(uploaded) == set(tweet_ids) | {600}
+    assert uploaded[750:] == tweet_ids[250:]
+    manifest = CollectionManifest(os.path.dirname(a_file))
+    assert manifest.is_complete(a_file)
+    assert manifest.get_uploaded_chunks(a_file)[:2] == [[250, '751'], [250, '500']]
+
+def test_restarted_stream_with_fewer_tweets_completes(a_file):
+    tweet_ids = list(range(1000, 0, -1))
+    uploaded = stream(a_file, tweet_ids, stop_after_uploads=2)
+
+    # The first chunk is still skipped; the tweets left of the second are uploaded again
+    uploaded = uploaded + stream(a_file, tweet_ids[:400])
+    assert uploaded == tweet_ids[:500] + tweet_ids[250:400]
+    assert CollectionManifest(os.path.dirname(a_file)).is_complete(a_file)
+
+def test_collected_window_is_uploaded_after_crash(tmp_path, monkeypatch):
+    json_filepath = str(tmp_path) + '/'
+    window_start = dt.datetime(2022, 1, 1, tzinfo=dt.timezone.utc)
+    windows = [(window_start, window_start + dt.timedelta(days=1))]
+    to_collect, not_to_collect, expected_files = set_up_expected_files(window_start, windows[0][1], json_filepath, 1, 'query', 'dataset', 1, None, windows)
+    a_file = to_collect[0]
+
+    # Collected, then the collection stops part-way through uploading the file
+    manifest = CollectionManifest(json_filepath)
+    data.collect_interval(FakeClient(list(range(300, 0, -1))), 'query', *windows[0], a_file, manifest=manifest)
+    assert manifest.is_collected(a_file) and not manifest.is_complete(a_file)
+
+    uploaded = []
+    def upload_processed_chunk(list_of_dataframes, *args):
+        if len(uploaded) == 1:
+            raise RuntimeError('interrupted')
+        uploaded.append(list_of_dataframes)
+        return 0
+    monkeypatch.setattr(data, 'iter_processed_chunks', lambda a_file, *args: iter(['chunk 1', 'chunk 2']))
+    monkeypatch.setattr(data, 'upload_processed_chunk', upload_processed_chunk)
+    with pytest.raises(RuntimeError):
+        data.process_in_pipeline(iter([a_file]), '', None, 'p', 'dataset', 'query', None, None, 0, 0, 'DATA', manifest=manifest)
+
+    # On a rerun, the window is still to be collected, but its file is uploaded again rather than collected again
+    to_collect, not_to_collect, expected_files = set_up_expected_files(window_start, windows[0][1], json_filepath, 1, 'query', 'dataset', 1, None, windows)
+    assert to_collect == [a_file]
+    manifest = CollectionManifest(json_filepath)
+    client = FakeClient(list(range(300, 0, -1)))
+    assert data.collect_interval(client, 'query', *windows[0], a_file, manifest=manifest) == a_file
+    assert getattr(client, 'searches', 0) == 0
+
+    uploaded_again = []
+    monkeypatch.setattr(data, 'upload_processed_chunk', lambda list_of_dataframes, *args: uploaded_again.append(list_of_dataframes) or 0)
+    data.process_in_pipeline(iter([a_file]), '', None, 'p', 'dataset', 'query', None, None, 0, 0, 'DATA', manifest=manifest)
+    assert uploaded_again == ['chunk 1', 'chunk 2']
+    assert manifest.is_complete(a_file)
+    to_collect, not_to_collect, expected_files = set_up_expected_files(window_start, windows[0][1], json_filepath, 1, 'query', 'dataset', 1, None, windows)
+    assert to_collect == [] and not_to_collect == [a_file]
@@ -0,0 +1,56 @@
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from src import memory
+from src.memory import PeakMemory, current_rss, megabyte
+
+
+pytestmark = pytest.mark.skipif(current_rss() is None, reason='resident memory cannot be read here')
+
+
+def use_memory(mb, seconds=0.3):
+    # Held long enough to be seen by the sampling thread
+    held = np.ones(mb * megabyte // 8)
+    time.sleep(seconds)
+    del held
+
+
+def test_measures_memory_used():
+    peak_memory = PeakMemory().start()
+    use_memory(200)
+
+    assert peak_memory.stop() >= 150 * megabyte
+    assert memory.active_measurements == 0
+
+def test_nested_measurement_keeps_outer_peak():
+    outer = PeakMemory().start()
+    use_memory(200)
+    inner = PeakMemory().start()
+    use_memory(50)
+    inner_used = inner.stop()
+
+    assert outer.stop() >= 150 * megabyte
+    assert 25 * megabyte <= inner_used < 150 * megabyte
+    assert memory.active_measurements == 0
+
+def test_overlapping_measurements_in_threads():
+    # The second measurement starts and stops in another thread while the first is active, and must not lose its peak
+    first = PeakMemory().start()
+    use_memory(200)
+    results = dict()
+
+    def measure():
+        second = PeakMemory().start()
+        use_memory(100)
+        results['second'] = second.stop()
+
+    thread = threading.Thread(target=measure)
+    thread.start()
+    thread.join()
+
+    assert first.stop() >= 150 * megabyte
+    assert 75 * megabyte <= results['second'] < 150 * megabyte
+    assert memory.active_measurements == 0
@@ -0,0 +1,93 @@
+import random
+import datetime as dt
+
+import pytest
+
+from src.partition import partition_by_counts, parse_counts_buckets
+
+
+start = dt.datetime(2022, 1, 1, tzinfo=dt.timezone.utc)
+day = dt.timedelta(days=1)
+
+
+def day_buckets(counts):
+    return [(start + i * day, start + (i + 1) * day, count) for i, count in enumerate(counts)]
+
+def check_windows(windows, start_date, end_date):
+    # Windows cover the period in order, without gaps or empty windows
+    assert windows[0][0] == start_date
+    assert windows[-1][1] == end_date
+    for (window_start, window_end), (next_start, _) in zip(windows, windows[1:]):
+        assert window_end == next_start
+    for window_start, window_end in windows:
+        assert window_start < window_end
+
+def window_tweets(windows, buckets):
+    # Tweets in each window, assuming tweets are spread evenly within each bucket
+    counts = []
+    for window_start, window_end in windows:
+        count = 0
+        for bucket_start, bucket_end, tweet_count in buckets:
+            overlap = (min(window_end, bucket_end) - max(window_start, bucket_start)).total_seconds()
+            if overlap > 0:
+                count = count + tweet_count * overlap / (bucket_end - bucket_start).total_seconds()
+        counts.append(count)
+    return counts
+
+
+def test_parse_counts_buckets_sorts_buckets():
+    pages = [{'data': [{'start': '2022-01-02T00:00:00.000Z', 'end': '2022-01-03T00:00:00.000Z', 'tweet_count': 5}]},
+             {'data': [{'start': '2022-01-01T00:00:00.000Z', 'end': '2022-01-02T00:00:00.000Z', 'tweet_count': 7}]}]
+
+    assert parse_counts_buckets(pages) == [(start, start + day, 7), (start + day, start + 2 * day, 5)]
+
+def test_quiet_buckets_are_merged():
+    buckets = day_buckets([10, 10, 10, 10])
+
+    assert partition_by_counts(buckets, start, start + 4 * day, 1000) == [(start, start + 4 * day)]
+
+def test_busy_bucket_is_split():
+    buckets = day_buckets([4000])
+    windows = partition_by_counts(buckets, start, start + day, 1000)
+
+    check_windows(windows, start, start + day)
+    assert len(windows) == 4
+    assert all(abs(count - 1000) < 1 for count in window_tweets(windows, buckets))
+
+def test_single_bucket_within_window():
+    windows = partition_by_counts(day_buckets([500]), start, start + day, 1000)
+
+    assert windows == [(start, start + day)]
+
+def test_zero_counts():
+    assert partition_by_counts(day_buckets([0, 0, 0]), start, start + 3 * day, 1000) == [(start, start + 3 * day)]
+    assert partition_by_counts([], start, start + 3 * day, 1000) == [(start, start + 3 * day)]
+
+def test_window_full_at_bucket_end_does_not_overshoot():
+    # The first bucket fills a window up to (about) its end; later windows must not start before their buckets
+    buckets = day_buckets([100000000, 5, 5, 5, 5])
+    windows = partition_by_counts(buckets, start, start + 5 * day, 1000)
+
+    check_windows(windows, start, start + 5 * day)
+    assert windows[-1] == (start + day, start + 5 * day)
+
+def test_dense_bucket_gives_windows_of_a_second():
+    buckets = day_buckets([10 ** 9])
+    windows = partition_by_counts(buckets, start, start + day, 1000)
+
+    check_windows(windows, start, start + day)
+    assert all(window_end - window_start == dt.timedelta(seconds=1) for window_start, window_end in windows)
+
+def test_invalid_tweets_per_window():
+    with pytest.raises(ValueError):
+        partition_by_counts(day_buckets([10]), start, start + day, 0)
+
+def test_random_counts_give_ordered_windows():
+    rng = random.Random(0)
+    for case in range(200):
+        counts = [rng.choice([0, 5, 999, 1000, 1001, 10 ** 5, 10 ** 6]) for i in range(rng.randint(1, 6))]
+        buckets = day_buckets(counts)
+        end_date = start + len(counts) * day
+        windows = partition_by_counts(buckets, start, end_date, rng.choice([1000, 5000]))
+
+        check_windows(windows, start, end_date)
@@ -0,0 +1,112 @@
+import pandas as pd
+import pytest
+
+from src import data
+from src.bq_schema import SchemaFuncs, QueryMembership_schema
+from src.seen_ids import SeenTweetIds
+from src.query_packing import QueryPack, plan_query_packs, parse_query, TweetFields, UnsupportedQuery, membership_tablename
+
+
+def make_tweet(tweet_id='1', text='', **fields):
+    return {'id': tweet_id, 'text': text, 'lang': 'en', **fields}
+
+def matches(query, tweet):
+    return parse_query(query).matches(TweetFields(tweet))
+
+
+def test_keywords_and_phrases():
+    tweet = make_tweet(text='The quick brown fox, jumping!')
+
+    assert matches('quick fox', tweet)
+    assert matches('"brown fox"', tweet)
+    assert matches('QUICK', tweet)
+    assert not matches('"fox brown"', tweet)
+    assert not matches('quick cat', tweet)
+    assert not matches('jump', tweet)
+
+def test_or_grouping_and_negation():
+    tweet = make_tweet(text='cats and dogs')
+
+    assert matches('cats OR birds', tweet)
+    assert matches('(birds OR dogs) cats', tweet)
+    assert matches('cats -birds', tweet)
+    assert not matches('cats -dogs', tweet)
+    assert not matches('birds OR fish', tweet)
+
+def test_entities_and_operators():
+    tweet = make_tweet(text='hello #Python @alice $ACME',
+                       entities={'hashtags': [{'tag': 'Python'}], 'mentions': [{'username': 'alice'}],
+                                 'cashtags': [{'tag': 'ACME'}]},
+                       author={'username': 'bob'}, author_id='42')
+
+    assert matches('#python', tweet)
+    assert matches('@Alice', tweet)
+    assert matches('$acme', tweet)
+    assert matches('from:bob', tweet)
+    assert matches('from:42', tweet)
+    assert matches('lang:en has:hashtags', tweet)
+    assert not matches('lang:fr', tweet)
+    assert not matches('is:retweet', tweet)
+
+def test_retweets_match_the_retweeted_text():
+    tweet = make_tweet(text='RT @carol: original words', referenced_tweets=[{'type': 'retweeted', 'text': 'original words in full'}])
+
+    assert matches('full', tweet)
+    assert matches('is:retweet', tweet)
+
+def test_unsupported_operators_are_not_packed():
+    with pytest.raises(UnsupportedQuery):
+        parse_query('cats place_country:AU')
+
+    packs = plan_query_packs(['cats', 'dogs', 'cats place_country:AU', 'birds'])
+    assert [pack.subqueries for pack in packs] == [['cats', 'dogs'], ['cats place_country:AU'], ['birds']]
+    assert [pack.is_packed() for pack in packs] == [True, False, False]
+    assert packs[0].query == '(cats) OR (dogs)'
+
+def test_packs_stay_within_max_length():
+    queries = [f'word{i}' for i in range(10)]
+    packs = plan_query_packs(queries, max_length=40)
+
+    assert all(len(pack.query) <= 40 for pack in packs)
+    assert [subquery for pack in packs for subquery in pack.subqueries] == queries
+
+def test_membership_table():
+    query_pack = QueryPack(['cats', 'dogs'])
+    tweets = pd.DataFrame([make_tweet('1', 'cats'), make_tweet('2', 'cats and dogs'), make_tweet('3', 'birds')])
+    QUERY_MEMBERSHIP = query_pack.build_membership_table(tweets)
+
+    assert QUERY_MEMBERSHIP.values.tolist() == [['1', 'cats'], ['2', 'cats'], ['2', 'dogs'], ['3', query_pack.query]]
+    assert QUERY_MEMBERSHIP.attrs['tablename'] == membership_tablename
+
+def test_membership_of_chunk_already_uploaded(tmp_path, monkeypatch):
+    # Every tweet of the chunk was uploaded under an earlier query; the chunk still matches these queries
+    query_pack = QueryPack(['cats', 'dogs'])
+    tweets = pd.DataFrame([make_tweet('1', 'cats'), make_tweet('2', 'cats and dogs')])
+    seen_ids = SeenTweetIds(str(tmp_path / 'seen_tweet_ids.sqlite'))
+    seen_ids.add(['1', '2'])
+
+    chunks = list(data.process_chunks([tweets], seen_ids, query_pack))
+
+    assert len(chunks) == 1 and len(chunks[0]) == 1
+    QUERY_MEMBERSHIP = chunks[0][0]
+    assert QUERY_MEMBERSHIP.values.tolist() == [['1', 'cats'], ['2', 'cats'], ['2', 'dogs']]
+    assert seen_ids.duplicates_skipped == 2
+
+    # It is uploaded as the only table of its chunk
+    list_of_dataframes, list_of_csv, list_of_tablenames, list_of_schema, tweet_count = SchemaFuncs().get_schema_type(chunks[0], 5)
+    assert list_of_tablenames == [QueryMembership_schema.tablename]
+    assert list_of_dataframes[0] is QUERY_MEMBERSHIP
+    assert tweet_count == 5
+
+    pushed = []
+    monkeypatch.setattr(data, 'write_processed_data_to_csv', lambda *args: None)
+    monkeypatch.setattr(data, 'push_processed_tables_to_bq', lambda bq, project, dataset, list_of_tablenames, *args: pushed.append(list_of_tablenames))
+    assert data.upload_processed_chunk(chunks[0], '', None, 'p', 'd', 'q', None, None, 0, 5, 'DATA', seen_ids) == 5
+    assert pushed == [[QueryMembership_schema.tablename]]
+
+def test_chunk_already_uploaded_without_pack_is_skipped(tmp_path):
+    tweets = pd.DataFrame([make_tweet('1', 'cats')])
+    seen_ids = SeenTweetIds(str(tmp_path / 'seen_tweet_ids.sqlite'))
+    seen_ids.add(['1'])
+
+    assert list(data.process_chunks([tweets], seen_ids, QueryPack(['cats']))) == []
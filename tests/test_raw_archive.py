@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from src.raw_archive import RawArchiveWriter, get_compression_suffix, get_file_compression, open_archive
+
+# zstandard is optional; zstd archives are only tested if it is installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+compressions = [None, 'gzip', pytest.param('zstd', marks=pytest.mark.skipif(zstandard is None, reason='zstandard is not installed'))]
+
+
+def make_pages(first_id, page_count, page_size=3):
+    # Pages of flattened tweets, including non-ascii text, which json.dumps escapes
+    return [[{'id': str(first_id + page * page_size + i), 'text': 'café \U0001F600', 'public_metrics': {'like_count': i}}
+             for i in range(page_size)]
+            for page in range(page_count)]
+
+def read_archive(a_file):
+    with open_archive(a_file) as f:
+        return [json.loads(line) for line in f]
+
+def archive_file(tmp_path, compression):
+    return str(tmp_path / f'window_tweets.jsonl{get_compression_suffix(compression)}')
+
+
+@pytest.mark.parametrize('compression', compressions)
+@pytest.mark.parametrize('fsync', ['page', 'window', 'none'])
+def test_round_trip(tmp_path, compression, fsync):
+    a_file = archive_file(tmp_path, compression)
+    pages = make_pages(1, 4)
+    with RawArchiveWriter(a_file, buffer_size=64, fsync=fsync) as writer:
+        for page in pages:
+            writer.write_page(page)
+
+    assert get_file_compression(a_file) == compression
+    assert writer.tweets_written == 12 and writer.pages_written == 4
+    assert read_archive(a_file) == [tweet for page in pages for tweet in page]
+
+@pytest.mark.parametrize('compression', compressions)
+def test_append_on_resume(tmp_path, compression):
+    a_file = archive_file(tmp_path, compression)
+    pages = make_pages(1, 5)
+    with RawArchiveWriter(a_file) as writer:
+        for page in pages[:2]:
+            writer.write_page(page)
+
+    # A resumed window appends to the file written before the interruption, as a new gzip member or zstd frame
+    with RawArchiveWriter(a_file) as writer:
+        for page in pages[2:]:
+            writer.write_page(page)
+
+    assert writer.tweets_written == 9
+    assert read_archive(a_file) == [tweet for page in pages for tweet in page]
+
+def test_empty_page_creates_no_file(tmp_path):
+    a_file = archive_file(tmp_path, 'gzip')
+    with RawArchiveWriter(a_file) as writer:
+        writer.write_page([])
+
+    assert not (tmp_path / 'window_tweets.jsonl.gz').exists()
+    assert writer.tweets_written == 0
+
+def test_file_size_of_uncompressed_archive(tmp_path):
+    a_file = archive_file(tmp_path, None)
+    with RawArchiveWriter(a_file, buffer_size=1024*1024) as writer:
+        assert writer.file_size() == 0
+        writer.write_page(make_pages(1, 1)[0])
+        size = writer.file_size()
+
+    # Everything written is flushed before the size is taken, so it is a safe point to resume from
+    with open(a_file, 'rb') as f:
+        assert size == len(f.read()) == writer.bytes_written
+    assert RawArchiveWriter(a_file).file_size() == size
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+def test_file_size_of_compressed_archive_is_unknown(tmp_path, compression):
+    assert RawArchiveWriter(archive_file(tmp_path, compression)).file_size() is None
+
+@pytest.mark.parametrize('a_file, compression', [('a_tweets.jsonl', None), ('a_tweets.jsonl.gz', 'gzip'),
+                                                 ('a_tweets.jsonl.zst', 'zstd'), ('a_tweets.json', None)])
+def test_get_file_compression(a_file, compression):
+    assert get_file_compression(a_file) == compression
+
+def test_unknown_compression():
+    with pytest.raises(ValueError):
+        get_compression_suffix('bzip2')
+
+def test_unknown_fsync(tmp_path):
+    with pytest.raises(ValueError):
+        RawArchiveWriter(archive_file(tmp_path, None), fsync='always')
@@ -0,0 +1,39 @@
+import pytest
+
+from src import data
+from src.config import Collection
+
+from tests.mock_twitter_api import TweetDistribution
+from tests.synthetic_corpus import write_corpus
+
+
+reference_columns = ['tweet_id', 'referenced_tweet_id', 'tweet_type', 'reference_level']
+
+
+@pytest.fixture(scope='module')
+def corpus_file(tmp_path_factory):
+    corpus_file = str(tmp_path_factory.mktemp('corpus') / 'deep.json')
+    write_corpus(corpus_file, 500, TweetDistribution(reference_depth=3, quote_ratio=0.4), seed=3)
+    return corpus_file
+
+def build_tweets(corpus_file, max_depth, monkeypatch):
+    monkeypatch.setattr(Collection, 'max_reference_depth', max_depth)
+    TWEETS = next(iter(data.iter_processed_chunks(corpus_file, 'DATA')))[0]
+    TWEETS['reference_level'] = TWEETS['reference_level'].astype(int)
+    return TWEETS
+
+@pytest.mark.parametrize('max_depth', [1, 2])
+def test_depth_limit_keeps_references_of_last_level(corpus_file, max_depth, monkeypatch):
+    every_level = build_tweets(corpus_file, 0, monkeypatch)
+    limited = build_tweets(corpus_file, max_depth, monkeypatch)
+
+    # The levels kept are as they are with every level unpacked, including the tweet_type and referenced_tweet_id of
+    # the last level, but no rows are added for the tweets it references
+    assert every_level['reference_level'].max() > max_depth
+    assert limited['reference_level'].max() == max_depth
+    expected = every_level[every_level['reference_level'] <= max_depth][reference_columns].reset_index(drop=True)
+    assert limited[reference_columns].reset_index(drop=True).equals(expected)
+
+    last_level = limited[limited['reference_level'] == max_depth]
+    assert set(last_level['tweet_type']) == {'original', 'retweet', 'reply', 'quote'}
+    assert last_level['referenced_tweet_text'].isna().all()
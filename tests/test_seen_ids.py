@@ -0,0 +1,84 @@
+import pandas as pd
+import pytest
+
+from src import data, seen_ids as seen_ids_module
+from src.seen_ids import SeenTweetIds
+
+
+@pytest.fixture
+def seen_ids(tmp_path):
+    return SeenTweetIds(str(tmp_path / 'seen_tweet_ids.sqlite'))
+
+def processed_chunk(tweet_ids, referenced_ids=()):
+    # The TWEETS table of a processed chunk: level 0 tweets, and the tweets they reference at level 1
+    TWEETS = pd.DataFrame({'tweet_id': list(tweet_ids) + list(referenced_ids),
+                           'reference_level': ['0'] * len(tweet_ids) + ['1'] * len(referenced_ids)})
+    return [TWEETS]
+
+def upload(list_of_dataframes, seen_ids):
+    return data.upload_processed_chunk(list_of_dataframes, '', None, 'p', 'd', 'q', None, None, 0, 0, 'DATA', seen_ids)
+
+
+def test_find_and_add(seen_ids):
+    assert seen_ids.find_seen(['1', '2']) == set()
+    seen_ids.add(['1', 2])
+    seen_ids.add(['1'])
+
+    assert seen_ids.find_seen(['1', '2', '3']) == {'1', '2'}
+
+def test_ids_persist(tmp_path, seen_ids):
+    seen_ids.add(['5'])
+
+    assert SeenTweetIds(str(tmp_path / 'seen_tweet_ids.sqlite')).find_seen(['5']) == {'5'}
+
+def test_drop_seen_counts_duplicates(seen_ids):
+    seen_ids.add(['2', '4'])
+    tweets = pd.DataFrame({'id': ['1', '2', '3', '4'], 'text': ['a', 'b', 'c', 'd']})
+
+    kept = seen_ids.drop_seen(tweets)
+    assert kept['id'].tolist() == ['1', '3']
+    assert seen_ids.duplicates_skipped == 2
+
+    seen_ids.drop_seen(tweets)
+    assert seen_ids.duplicates_skipped == 4
+
+def test_drop_seen_passes_through_chunks_without_ids(seen_ids):
+    seen_ids.add(['1'])
+    tweets = pd.DataFrame({'data': [{'id': '1'}]})
+
+    assert seen_ids.drop_seen(tweets) is tweets
+    assert seen_ids.drop_seen(pd.DataFrame({'id': []})).empty
+    assert seen_ids.duplicates_skipped == 0
+
+def test_batches_above_batch_size(seen_ids, monkeypatch):
+    statements = []
+    connection = seen_ids.connection
+
+    class CountingConnection:
+        def execute(self, sql, *args):
+            statements.append(sql)
+            return connection.execute(sql, *args)
+
+    seen_ids.add(range(0, 2400, 2))
+    monkeypatch.setattr(seen_ids, 'connection', CountingConnection())
+    seen = seen_ids.find_seen(range(1201))
+
+    assert seen == {str(tweet_id) for tweet_id in range(0, 1201, 2)}
+    # 1201 ids, in batches of 500
+    assert seen_ids_module.batch_size == 500
+    assert len(statements) == 3
+
+def test_ids_recorded_only_after_upload(seen_ids, monkeypatch):
+    monkeypatch.setattr(data, 'write_processed_data_to_csv', lambda *args: None)
+
+    def failed_push(*args):
+        raise RuntimeError('upload failed')
+    monkeypatch.setattr(data, 'push_processed_tables_to_bq', failed_push)
+    with pytest.raises(RuntimeError):
+        upload(processed_chunk(['1', '2'], ['3']), seen_ids)
+    assert seen_ids.find_seen(['1', '2', '3']) == set()
+
+    monkeypatch.setattr(data, 'push_processed_tables_to_bq', lambda *args: None)
+    upload(processed_chunk(['1', '2'], ['3']), seen_ids)
+    # Only level 0 tweets, which match the query, are recorded; referenced tweets may match a later query
+    assert seen_ids.find_seen(['1', '2', '3']) == {'1', '2'}
@@ -0,0 +1,49 @@
+import logging
+import threading
+
+import pytest
+
+from src.config import Collection
+from src.memory import PeakMemory, current_rss, megabyte
+from src.stage_timers import StageTimers
+
+from tests.test_memory import use_memory
+
+
+pytestmark = pytest.mark.skipif(current_rss() is None, reason='resident memory cannot be read here')
+
+
+@pytest.fixture
+def timers(monkeypatch):
+    # A ceiling that a chunk using 200 MB more than now comes close to, but the memory in use now does not
+    monkeypatch.setattr(Collection, 'memory_ceiling_mb', round((current_rss() / megabyte + 100) / 0.9))
+    return StageTimers()
+
+def upload_chunk(timers):
+    with timers.chunk('upload'):
+        use_memory(50)
+
+
+def test_upload_chunk_overlapping_processing_chunk(timers, caplog):
+    # As in the pipeline: a chunk is uploaded in another thread while the next is processed
+    with caplog.at_level(logging.WARNING):
+        with timers.chunk('processing'):
+            use_memory(200)
+            upload = threading.Thread(target=upload_chunk, args=(timers,))
+            upload.start()
+            upload.join()
+
+    processing = next(record for record in timers.chunks if record['kind'] == 'processing')
+    upload = next(record for record in timers.chunks if record['kind'] == 'upload')
+    assert processing['memory_used_mb'] >= 150
+    assert 25 <= upload['memory_used_mb'] < 150
+    assert 'Processing chunk 1 reached' in caplog.text
+
+def test_chunk_nested_in_chunk_sizer_measurement(timers):
+    # As in process_chunks(): the processing chunk is measured within the chunk sizer's own measurement
+    sizer_memory = PeakMemory().start()
+    with timers.chunk('processing'):
+        use_memory(200)
+
+    assert sizer_memory.stop() >= 150 * megabyte
+    assert timers.chunks[0]['memory_used_mb'] >= 150
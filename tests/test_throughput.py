@@ -0,0 +1,84 @@
+import pytest
+
+from src import throughput
+from src.throughput import StageThroughput, ThroughputHistory
+
+
+def add_run(history, tweets, seconds, workers=None, schematype='DATA'):
+    # A run spending the given seconds per stage (collection seconds summed over its workers)
+    stage_throughput = StageThroughput()
+    for stage in throughput.stages:
+        stage_throughput.add(stage, tweets, seconds[stage] if isinstance(seconds, dict) else seconds)
+    history.record_run(schematype, stage_throughput, workers)
+
+@pytest.fixture
+def history(tmp_path):
+    return ThroughputHistory(str(tmp_path / 'throughput_history.json'))
+
+
+def test_no_history(history):
+    assert history.fit_stage('DATA', 'collection') is None
+    assert history.estimate(1000, 'DATA') == (None, 0)
+
+def test_least_squares_fit(history):
+    # seconds = 10 + 0.01 * tweets
+    for tweets in [1000, 5000, 20000]:
+        add_run(history, tweets, 10 + 0.01 * tweets)
+
+    overhead, seconds_per_tweet, runs = history.fit_stage('DATA', 'processing')
+    assert overhead == pytest.approx(10, abs=0.01)
+    assert seconds_per_tweet == pytest.approx(0.01)
+    assert runs == 3
+    assert history.estimate(10000, 'DATA')[0] == pytest.approx(3 * 110, rel=0.001)
+    assert history.estimate(10000, 'DATA', pipeline=True)[0] == pytest.approx(110, rel=0.001)
+
+def test_ratio_fallback(history):
+    # Too few runs for a fit
+    add_run(history, 1000, 20)
+    add_run(history, 3000, 20)
+    assert history.fit_stage('DATA', 'upload') == (0.0, pytest.approx(40 / 4000), 2)
+
+    # A fit with a negative overhead is not sensible
+    for tweets, seconds in [(1000, 1), (2000, 30), (3000, 60)]:
+        add_run(history, tweets, seconds)
+    overhead, seconds_per_tweet, runs = history.fit_stage('DATA', 'upload')
+    assert overhead == 0.0
+    assert seconds_per_tweet == pytest.approx(131 / 10000)
+
+def test_runs_are_pruned_per_schematype(history, monkeypatch):
+    monkeypatch.setattr(throughput, 'max_runs', 3)
+    for tweets in range(1, 6):
+        add_run(history, tweets * 1000, tweets)
+    add_run(history, 1000, 1, schematype='TCAT')
+
+    assert [run['stages']['upload']['tweets'] for run in history.runs if run['schematype'] == 'DATA'] == [3000, 4000, 5000]
+    assert len([run for run in history.runs if run['schematype'] == 'TCAT']) == 1
+    # The history is saved, and read back
+    assert len(ThroughputHistory(history.history_file).runs) == 4
+
+def test_estimate_scales_with_workers(history):
+    # 0.1 seconds of work per tweet in each stage, collected on 4 workers and processed on 2. Collection seconds are
+    # summed over the workers; processing seconds are the time spent waiting for the process pool
+    for tweets in [1000, 2000, 4000]:
+        add_run(history, tweets, {'collection': 0.1 * tweets, 'processing': 0.05 * tweets, 'upload': 0.1 * tweets},
+                {'collection': 4, 'processing': 2})
+
+    assert history.runs[0]['stages']['collection'] == {'tweets': 1000, 'seconds': 25.0, 'workers': 4}
+    # Each stage of 1000 tweets on one worker takes 100 seconds
+    assert history.estimate(1000, 'DATA', workers={'collection': 1, 'processing': 1})[0] == pytest.approx(300)
+    assert history.estimate(1000, 'DATA', workers={'collection': 2, 'processing': 4})[0] == pytest.approx(50 + 25 + 100)
+
+def test_runs_with_different_workers_are_pooled(history):
+    # The same work per tweet, on 1 and 8 collection workers
+    add_run(history, 1000, 100, {'collection': 1})
+    add_run(history, 1000, 100, {'collection': 8})
+
+    assert history.fit_stage('DATA', 'collection')[1] == pytest.approx(0.1)
+
+def test_runs_recorded_before_stage_workers(history):
+    # Older runs recorded collection workers for the whole run, and collection seconds already divided by them
+    history.runs.append({'date': '', 'schematype': 'DATA', 'workers': 4,
+                         'stages': {stage: {'tweets': 1000, 'seconds': 25.0} for stage in throughput.stages}})
+
+    assert history.fit_stage('DATA', 'collection')[1] == pytest.approx(0.1)
+    assert history.fit_stage('DATA', 'processing')[1] == pytest.approx(0.025)
@@ -0,0 +1,75 @@
+import time
+
+from src.api_client import TokenPool
+from src.rate_limit import RateLimiter, TokenBucket, scale_limits, SEARCH_ALL_LIMITS
+
+
+endpoint = '/2/tweets/search/all'
+
+
+def headers(remaining, reset):
+    return {'x-rate-limit-remaining': str(remaining), 'x-rate-limit-reset': str(int(reset))}
+
+
+def test_unused_tokens_have_a_full_budget():
+    pool = TokenPool(['a', 'b'])
+
+    assert pool.has_budget(endpoint)
+    assert pool.seconds_until_reset(endpoint) == 0
+    assert pool.choose(endpoint) in ['a', 'b']
+
+def test_chooses_the_token_with_most_requests_left():
+    pool = TokenPool(['a', 'b', 'c'])
+    reset = time.time() + 600
+    pool.update('a', endpoint, 200, headers(10, reset))
+    pool.update('b', endpoint, 200, headers(200, reset))
+    pool.update('c', endpoint, 200, headers(50, reset))
+
+    assert pool.choose(endpoint) == 'b'
+    assert pool.choose(endpoint, exclude=['b']) == 'c'
+
+def test_rotates_away_from_exhausted_tokens():
+    pool = TokenPool(['a', 'b'])
+    reset = time.time() + 600
+
+    assert pool.update('a', endpoint, 429, headers(0, reset))
+    assert pool.choose(endpoint) == 'b'
+    assert not pool.has_budget(endpoint, exclude=['b'])
+    # Refused for the per-second limit, with budget left: not exhausted
+    assert not pool.update('b', endpoint, 429, headers(5, reset))
+
+def test_waits_for_the_first_reset_when_every_token_is_exhausted():
+    pool = TokenPool(['a', 'b'])
+    now = time.time()
+    pool.update('a', endpoint, 429, headers(0, now + 600))
+    pool.update('b', endpoint, 429, headers(0, now + 60))
+
+    assert not pool.has_budget(endpoint)
+    assert pool.choose(endpoint) == 'b'
+    assert 0 < pool.seconds_until_reset(endpoint) <= 60
+
+def test_budgets_reset_after_their_window():
+    pool = TokenPool(['a'])
+    pool.update('a', endpoint, 429, headers(0, time.time() - 1))
+
+    assert pool.has_budget(endpoint)
+
+def test_limits_scale_with_tokens():
+    assert scale_limits(SEARCH_ALL_LIMITS, 3) == [(3, 1), (900, 900)]
+    assert scale_limits(SEARCH_ALL_LIMITS, 0) == SEARCH_ALL_LIMITS
+
+def test_rate_limiter_allows_one_request_per_token_per_second():
+    for token_count in [1, 3]:
+        rate_limiter = RateLimiter(scale_limits([(1, 1)], token_count))
+        start = time.monotonic()
+        for request in range(2 * token_count):
+            rate_limiter.acquire()
+        # The first token_count requests are immediate, the rest wait about a second
+        assert 0.8 < time.monotonic() - start < 1.5
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(2, 1)
+    bucket.take()
+    bucket.take()
+
+    assert 0 < bucket.wait_time() <= 0.5